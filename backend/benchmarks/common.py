@@ -0,0 +1,49 @@
+import subprocess
+
+import httpx
+
+from src.config import TOKEN_KEY
+
+
+def percentile_ms(samples: list[float], q: float) -> float | None:
+    """Percentile of latency samples (seconds) in milliseconds"""
+
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(int(len(ordered) * q), len(ordered) - 1)
+    return round(ordered[index] * 1000, 2)
+
+
+def latency_summary(samples: list[float]) -> dict:
+    """p50/p95/p99 of latency samples"""
+
+    return {
+        "p50": percentile_ms(samples, 0.50),
+        "p95": percentile_ms(samples, 0.95),
+        "p99": percentile_ms(samples, 0.99),
+    }
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    """Get access token of seeded user"""
+
+    response = await client.post(
+        "/auth/login", json={"email": email, "password": password}
+    )
+    response.raise_for_status()
+    return response.cookies[TOKEN_KEY]
+
+
+def git_revision() -> str | None:
+    """Commit benchmarked code belongs to"""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
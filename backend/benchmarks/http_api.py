@@ -0,0 +1,270 @@
+"""Mixed HTTP workload: RPS and p50/p95/p99 per endpoint
+
+    uvicorn src.main:app --workers 4
+    python -m benchmarks.http_api --seed --users 1000 --chats-per-user 20 \
+        --messages-per-chat 500 --clients 64 --duration 60 \
+        --output bench.json
+
+Every run writes a JSON report tagged with the git revision. Passing
+``--baseline old.json`` compares p95 per endpoint and exits with status 1
+when any endpoint regresses more than ``--tolerance``.
+
+All clients share one address, so start the server with rate limits off
+(``LOGIN_IP_RATE_LIMIT=0 LOGIN_RATE_LIMIT=0 MESSAGE_RATE_LIMIT=0``).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.common import git_revision, latency_summary, login
+from src.config import TOKEN_KEY
+from src.logger import logger
+
+# operation name -> relative weight in the mix
+WORKLOAD = {
+    "list_chats": 30,
+    "page_messages": 40,
+    "post_message": 15,
+    "search_users": 10,
+    "login": 5,
+}
+
+
+class Recorder:
+    """Latency samples and errors per endpoint"""
+
+    def __init__(self, record_after: float) -> None:
+        self.record_after = record_after
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def call(
+        self, endpoint: str, request
+    ) -> httpx.Response | None:
+        started = time.perf_counter()
+        warming_up = started < self.record_after
+        try:
+            response = await request
+        except httpx.HTTPError:
+            if not warming_up:
+                self.errors[endpoint] += 1
+            return None
+
+        if warming_up:
+            return response
+
+        self.samples[endpoint].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+        return response
+
+
+async def virtual_user(
+    client: httpx.AsyncClient,
+    args: argparse.Namespace,
+    recorder: Recorder,
+    deadline: float,
+    rng: random.Random,
+) -> None:
+    """One client looping over weighted random operations"""
+
+    email = f"user{rng.randint(1, args.users)}@example.com"
+    token = await login(client, email, args.password)
+    cookies = {TOKEN_KEY: token}
+    chat_ids: list[str] = []
+
+    operations = list(WORKLOAD)
+    weights = list(WORKLOAD.values())
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+
+        if operation == "login":
+            await recorder.call(
+                "POST /auth/login",
+                client.post(
+                    "/auth/login",
+                    json={"email": email, "password": args.password},
+                ),
+            )
+
+        elif operation == "list_chats" or not chat_ids:
+            response = await recorder.call(
+                "GET /chat", client.get("/chat", cookies=cookies)
+            )
+            if response is not None and response.status_code == 200:
+                chat_ids = [
+                    chat["id"] for chat in response.json()["items"]
+                ]
+
+        elif operation == "page_messages":
+            chat_id = rng.choice(chat_ids)
+            params = {"limit": args.page_size}
+            cursor = None
+            for _ in range(rng.randint(1, args.max_pages)):
+                if cursor:
+                    params["before"] = cursor
+                response = await recorder.call(
+                    "GET /chat/{chat_id}/message",
+                    client.get(
+                        f"/chat/{chat_id}/message",
+                        params=params,
+                        cookies=cookies,
+                    ),
+                )
+                if response is None or response.status_code != 200:
+                    break
+                cursor = response.json().get("nextCursor")
+                if cursor is None:
+                    break
+
+        elif operation == "post_message":
+            await recorder.call(
+                "POST /chat/{chat_id}/message",
+                client.post(
+                    f"/chat/{rng.choice(chat_ids)}/message",
+                    json={"text": f"Benchmark message {time.time_ns()}"},
+                    cookies=cookies,
+                ),
+            )
+
+        elif operation == "search_users":
+            await recorder.call(
+                "GET /user",
+                client.get(
+                    "/user",
+                    params={"q": f"user{rng.randint(1, 99)}"},
+                    cookies=cookies,
+                ),
+            )
+
+
+def seed_database(args: argparse.Namespace) -> None:
+    """Generate and load dataset of requested size"""
+
+    subprocess.run(
+        [
+            sys.executable, "-m", "fixtures.generate",
+            "--users", str(args.users),
+            "--chats-per-user", str(args.chats_per_user),
+            "--messages-per-chat", str(args.messages_per_chat),
+            "--password", args.password,
+        ],
+        check=True,
+    )
+    subprocess.run([sys.executable, "-m", "fixtures.seed"], check=True)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.random_seed)
+    limits = httpx.Limits(max_connections=args.clients)
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=60
+    ) as client:
+        started = time.perf_counter()
+        recorder = Recorder(record_after=started + args.warmup)
+        deadline = started + args.warmup + args.duration
+        await asyncio.gather(
+            *(
+                virtual_user(
+                    client,
+                    args,
+                    recorder,
+                    deadline,
+                    random.Random(rng.random()),
+                )
+                for _ in range(args.clients)
+            )
+        )
+
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "errors": recorder.errors[endpoint],
+            "rps": round(len(samples) / args.duration, 2),
+            **latency_summary(samples),
+        }
+
+    total = sum(len(samples) for samples in recorder.samples.values())
+    return {
+        "revision": git_revision(),
+        "clients": args.clients,
+        "duration": args.duration,
+        "dataset": {
+            "users": args.users,
+            "chats_per_user": args.chats_per_user,
+            "messages_per_chat": args.messages_per_chat,
+        },
+        "rps": round(total / args.duration, 2),
+        "endpoints": endpoints,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Endpoints whose p95 got worse than baseline by more than tolerance"""
+
+    regressions = []
+    for endpoint, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous or not previous["p95"] or not current["p95"]:
+            continue
+        ratio = current["p95"] / previous["p95"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{endpoint}: p95 {previous['p95']}ms -> {current['p95']}ms"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument(
+        "--seed", action="store_true", help="seed empty database first"
+    )
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--chats-per-user", type=int, default=10)
+    parser.add_argument("--messages-per-chat", type=int, default=20)
+    parser.add_argument("--password", default="pass")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--max-pages", type=int, default=3)
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON report to file")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_database(args)
+
+    report = asyncio.run(run(args))
+    logger.info("HTTP benchmark finished", rps=report["rps"])
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            logger.error("Regression", detail=regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
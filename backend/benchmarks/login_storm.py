@@ -0,0 +1,100 @@
+"""Login storm: Argon2 throughput and latency of unrelated endpoints
+
+Run against a single uvicorn worker with seeded database and login
+limits off:
+
+    LOGIN_IP_RATE_LIMIT=0 LOGIN_RATE_LIMIT=0 uvicorn src.main:app --workers 1
+    python -m benchmarks.login_storm --concurrency 64 --duration 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import latency_summary, login
+from src.config import TOKEN_KEY
+from src.logger import logger
+
+
+async def login_loop(
+    client: httpx.AsyncClient,
+    args: argparse.Namespace,
+    deadline: float,
+    results: dict,
+) -> None:
+    """Log in repeatedly until deadline"""
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post(
+            "/auth/login", json={"email": args.email, "password": args.password}
+        )
+        elapsed = time.perf_counter() - started
+        if response.status_code == 200:
+            results["login"].append(elapsed)
+        elif response.status_code == 429:
+            results["rejected"] += 1
+        else:
+            results["errors"] += 1
+
+
+async def probe_loop(
+    client: httpx.AsyncClient, token: str, deadline: float, results: dict
+) -> None:
+    """Call cheap endpoint at steady rate to observe event loop stalls"""
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await client.get("/user/me", cookies={TOKEN_KEY: token})
+        results["probe"].append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    results = {"login": [], "probe": [], "rejected": 0, "errors": 0}
+    limits = httpx.Limits(max_connections=args.concurrency + 8)
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=60
+    ) as client:
+        token = await login(client, args.email, args.password)
+
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            probe_loop(client, token, deadline, results),
+            *(
+                login_loop(client, args, deadline, results)
+                for _ in range(args.concurrency)
+            ),
+        )
+
+    return {
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "logins_per_second": round(len(results["login"]) / args.duration, 2),
+        "login_rejected": results["rejected"],
+        "login_errors": results["errors"],
+        "login_ms": latency_summary(results["login"]),
+        "unrelated_ms": latency_summary(results["probe"]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", default="user1@example.com")
+    parser.add_argument("--password", default="pass")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    logger.info("Login storm finished", **report)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
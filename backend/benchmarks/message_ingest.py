@@ -0,0 +1,141 @@
+"""Message ingestion throughput, per-request commit vs group commit
+
+Sends messages from concurrent producers straight through the service
+layer, once per write mode, against seeded chats:
+
+    python -m fixtures.generate --users 1000 --chats-per-user 5
+    python -m fixtures.seed
+    python -m benchmarks.message_ingest --producers 64 --messages 20000 \
+        --output ingest.json
+
+Modes are ``direct`` (a transaction per message), ``commit`` (buffered,
+answered after the batch commit) and ``enqueue`` (buffered, answered once
+queued; the run then waits for the buffer to drain, so msgs/s counts
+durable writes).
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import git_revision, latency_summary
+from benchmarks.message_search import sample_memberships
+from src.config import (
+    engine,
+    MESSAGE_FLUSH_SIZE,
+    MESSAGE_FLUSH_INTERVAL,
+)
+from src.logger import logger
+from src.schemes.message import MessageInputScheme
+from src.services.message import create_message, MessageWriter
+from src.services.stream import broker
+
+MODES = ("direct", "commit", "enqueue")
+
+
+async def produce(
+    send, memberships: list[tuple], count: int, offset: int
+) -> list[float]:
+    """Send ``count`` messages round-robin over memberships"""
+
+    samples = []
+    for i in range(count):
+        user_id, chat_id = memberships[(offset + i) % len(memberships)]
+        started = time.perf_counter()
+        await send(user_id, chat_id, f"Benchmark message {offset + i}")
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def measure(
+    mode: str, memberships: list[tuple], args: argparse.Namespace
+) -> dict:
+    writer = None
+    if mode == "direct":
+
+        async def send(user_id, chat_id, text):
+            await create_message(
+                user_id, chat_id, MessageInputScheme(text=text)
+            )
+
+    else:
+        writer = MessageWriter(
+            ack=mode,
+            batch_size=args.flush_size,
+            interval=args.flush_interval,
+        )
+        await writer.start()
+        send = writer.submit
+
+    per_producer = args.messages // args.producers
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        produce(send, memberships, per_producer, n * per_producer)
+        for n in range(args.producers)
+    ])
+    acknowledged = time.perf_counter() - started
+    if writer is not None:
+        await writer.stop()
+    elapsed = time.perf_counter() - started
+
+    samples = [sample for result in results for sample in result]
+    return {
+        "messages": len(samples),
+        "msgs_per_second": round(len(samples) / elapsed, 1),
+        "acknowledged_in": round(acknowledged, 3),
+        "elapsed": round(elapsed, 3),
+        **latency_summary(samples),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    await broker.start()
+    memberships = await sample_memberships(
+        args.memberships, args.random_seed
+    )
+    report = {
+        "revision": git_revision(),
+        "producers": args.producers,
+        "flush_size": args.flush_size,
+        "flush_interval": args.flush_interval,
+        "results": {},
+    }
+
+    for mode in args.modes:
+        report["results"][mode] = await measure(mode, memberships, args)
+        logger.info(
+            "Ingestion measured", mode=mode, **report["results"][mode]
+        )
+
+    await broker.stop()
+    await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--producers", type=int, default=64)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--memberships", type=int, default=500)
+    parser.add_argument("--flush-size", type=int, default=MESSAGE_FLUSH_SIZE)
+    parser.add_argument(
+        "--flush-interval", type=float, default=MESSAGE_FLUSH_INTERVAL
+    )
+    parser.add_argument(
+        "--modes", nargs="+", choices=MODES, default=list(MODES)
+    )
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON report to file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
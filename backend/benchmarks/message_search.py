@@ -0,0 +1,157 @@
+"""Full-text message search latency on seeded history
+
+Runs the search query directly against PostgreSQL, so the numbers show
+the database side of the endpoint without HTTP overhead:
+
+    python -m fixtures.generate --users 2000 --chats-per-user 10 \
+        --messages-per-chat 500
+    python -m fixtures.seed
+    python -m benchmarks.message_search --queries 200 --output search.json
+
+Fixture texts draw words from a Zipf distribution where ``word{n}`` is the
+n-th most frequent one, so terms cover common, mid and rare words.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from sqlalchemy import func, select, text
+
+from benchmarks.common import git_revision, latency_summary
+from src.config import (
+    engine,
+    db_session,
+    SEARCH_CANDIDATES,
+)
+from src.logger import logger
+from src.models import UserChatModel, SEARCH_LANGUAGE
+from src.services.message import search_messages
+
+TERMS = {
+    "common": "word1",
+    "frequent": "word20",
+    "mid": "word300",
+    "rare": "word4000",
+    "phrase": '"word1 word2"',
+    "missing": "nosuchword",
+}
+
+
+async def sample_memberships(count: int, seed: int) -> list[tuple]:
+    """Random (user, chat) pairs to search as"""
+
+    async with db_session() as session:
+        result = await session.execute(
+            select(UserChatModel.user, UserChatModel.chat)
+            .order_by(func.random())
+            .limit(count)
+        )
+        memberships = list(result.all())
+    random.Random(seed).shuffle(memberships)
+    return memberships
+
+
+EXPLAIN_QUERY = """
+    EXPLAIN (ANALYZE, BUFFERS)
+    SELECT id FROM message
+    WHERE search_vector @@ websearch_to_tsquery(
+        CAST(:language AS regconfig), :term
+    ) AND chat = :chat
+    ORDER BY created_at DESC
+    LIMIT :candidates
+"""
+
+
+async def explain(term: str, chat_id) -> str:
+    """Plan of in-chat candidate scan, to check the GIN index is used"""
+
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(EXPLAIN_QUERY),
+            {
+                "language": SEARCH_LANGUAGE,
+                "term": term,
+                "chat": chat_id,
+                "candidates": SEARCH_CANDIDATES,
+            },
+        )
+        return "\n".join(row[0] for row in result.all())
+
+
+async def run(args: argparse.Namespace) -> dict:
+    async with db_session() as session:
+        # Planner estimate, exact count of 10M rows takes seconds
+        messages = await session.scalar(
+            text(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE relname = 'message'"
+            )
+        )
+
+    memberships = await sample_memberships(args.queries, args.random_seed)
+    report = {
+        "revision": git_revision(),
+        "messages": messages,
+        "queries": len(memberships),
+        "results": {},
+    }
+
+    for scope in ("chat", "all"):
+        for name, term in TERMS.items():
+            samples = []
+            hits = 0
+            for user_id, chat_id in memberships:
+                started = time.perf_counter()
+                rows, _ = await search_messages(
+                    user_id,
+                    term,
+                    chat_id if scope == "chat" else None,
+                    limit=args.page_size,
+                )
+                samples.append(time.perf_counter() - started)
+                hits += len(rows)
+
+            report["results"][f"{scope}:{name}"] = {
+                "term": term,
+                "avg_hits": round(hits / max(len(samples), 1), 2),
+                **latency_summary(samples),
+            }
+            logger.info(
+                "Search measured",
+                scope=scope,
+                term=term,
+                **latency_summary(samples),
+            )
+
+    if args.explain and memberships:
+        _, chat_id = memberships[0]
+        report["plan"] = await explain(TERMS["common"], chat_id)
+
+    await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument(
+        "--explain", action="store_true", help="include query plan in report"
+    )
+    parser.add_argument("--output", help="write JSON report to file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
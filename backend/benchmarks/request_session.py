@@ -0,0 +1,184 @@
+"""Pool checkouts and latency per request, per-call vs request session
+
+Runs request flows straight through the service layer against seeded
+chats, once with every service call opening its own session (``call``)
+and once with one session per request as the ``request_session``
+dependency provides (``request``):
+
+    python -m fixtures.generate --users 1000 --chats-per-user 5
+    python -m fixtures.seed
+    python -m benchmarks.request_session --concurrency 32 \
+        --requests 5000 --output session.json
+
+Membership cache is dropped before every request, so the permission
+check reads the database as it does after a cache expiry; pass
+``--warm-membership`` to keep it.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from fastapi import Response
+
+from benchmarks.common import git_revision, latency_summary
+from benchmarks.message_search import sample_memberships
+from src.config import engine
+from src.logger import logger
+from src.schemes.message import MessageBatchItemScheme, MessageInputScheme
+from src.services.chat import invalidate_membership, read_chat, user_in_chat
+from src.services.message import create_message, create_messages
+from src.services.session import request_session
+from src.services.stream import broker
+
+MODES = ("call", "request")
+
+
+async def post_message(user_id, chat_id, session) -> None:
+    """POST /chat/{chat_id}/message"""
+
+    if await user_in_chat(user_id, chat_id, session):
+        await create_message(
+            user_id, chat_id, MessageInputScheme(text="Benchmark"), session
+        )
+
+
+async def post_batch(user_id, chat_id, session) -> None:
+    """POST /message/batch with a few messages"""
+
+    items = [
+        MessageBatchItemScheme(chat_id=chat_id, text=f"Benchmark {i}")
+        for i in range(5)
+    ]
+    await create_messages(user_id, items, session)
+
+
+async def get_chat(user_id, chat_id, session) -> None:
+    """GET /chat/{chat_id}"""
+
+    if await user_in_chat(user_id, chat_id, session):
+        await read_chat(user_id, chat_id, session)
+
+
+# flow -> (function, HTTP method)
+FLOWS = {
+    "post_message": (post_message, "POST"),
+    "post_batch": (post_batch, "POST"),
+    "get_chat": (get_chat, "GET"),
+}
+
+open_request_session = asynccontextmanager(request_session)
+
+
+async def handle(mode: str, flow: str, user_id, chat_id) -> None:
+    function, method = FLOWS[flow]
+    if mode == "call":
+        await function(user_id, chat_id, None)
+        return
+
+    request = SimpleNamespace(method=method, cookies={})
+    async with open_request_session(request, Response()) as session:
+        await function(user_id, chat_id, session)
+
+
+async def client(
+    mode: str,
+    flow: str,
+    memberships: list[tuple],
+    count: int,
+    offset: int,
+    warm: bool,
+) -> list[float]:
+    samples = []
+    for i in range(count):
+        user_id, chat_id = memberships[(offset + i) % len(memberships)]
+        if not warm:
+            await invalidate_membership([user_id])
+        started = time.perf_counter()
+        await handle(mode, flow, user_id, chat_id)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def measure(
+    mode: str, flow: str, memberships: list[tuple], args
+) -> dict:
+    per_client = args.requests // args.concurrency
+    checkouts = engine.pool.stats()["checkouts"]
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        client(
+            mode,
+            flow,
+            memberships,
+            per_client,
+            n * per_client,
+            args.warm_membership,
+        )
+        for n in range(args.concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    checkouts = engine.pool.stats()["checkouts"] - checkouts
+
+    samples = [sample for result in results for sample in result]
+    return {
+        "requests": len(samples),
+        "requests_per_second": round(len(samples) / elapsed, 1),
+        "checkouts_per_request": round(checkouts / len(samples), 2),
+        **latency_summary(samples),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    await broker.start()
+    memberships = await sample_memberships(
+        args.memberships, args.random_seed
+    )
+    report = {
+        "revision": git_revision(),
+        "concurrency": args.concurrency,
+        "warm_membership": args.warm_membership,
+        "results": {},
+    }
+
+    for flow in args.flows:
+        report["results"][flow] = {}
+        for mode in args.modes:
+            result = await measure(mode, flow, memberships, args)
+            report["results"][flow][mode] = result
+            logger.info("Requests measured", flow=flow, mode=mode, **result)
+
+    await broker.stop()
+    await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--memberships", type=int, default=500)
+    parser.add_argument(
+        "--flows", nargs="+", choices=list(FLOWS), default=list(FLOWS)
+    )
+    parser.add_argument(
+        "--modes", nargs="+", choices=MODES, default=list(MODES)
+    )
+    parser.add_argument("--warm-membership", action="store_true")
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON report to file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Load test of realtime stream: how many sockets one worker can hold
+
+Run against a single uvicorn worker with seeded database:
+
+    uvicorn src.main:app --workers 1
+    python -m benchmarks.stream_connections --chat <chat_id> --connections 5000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+import websockets
+
+from benchmarks.common import latency_summary, login
+from src.config import TOKEN_KEY
+from src.logger import logger
+
+
+async def open_socket(ws_url: str, token: str):
+    """Open one stream connection"""
+
+    return await websockets.connect(
+        ws_url,
+        additional_headers={"Cookie": f"{TOKEN_KEY}={token}"},
+        open_timeout=30,
+    )
+
+
+async def receive_one(socket, sent_at: dict[str, float]) -> float | None:
+    """Wait for next event and return its delivery latency"""
+
+    try:
+        raw = await asyncio.wait_for(socket.recv(), timeout=30)
+    except (asyncio.TimeoutError, websockets.ConnectionClosed):
+        return None
+
+    event = json.loads(raw)
+    text = (event.get("message") or {}).get("text")
+    if text not in sent_at:
+        return None
+    return time.perf_counter() - sent_at[text]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """Open connections in batches, then measure fan-out of one message"""
+
+    base_url = args.base_url.rstrip("/")
+    ws_url = base_url.replace("http", "ws", 1) + "/stream"
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        token = await login(client, args.email, args.password)
+
+    sockets = []
+    failures = 0
+    started = time.perf_counter()
+    for offset in range(0, args.connections, args.batch):
+        size = min(args.batch, args.connections - offset)
+        results = await asyncio.gather(
+            *(open_socket(ws_url, token) for _ in range(size)),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                failures += 1
+            else:
+                sockets.append(result)
+    connect_seconds = time.perf_counter() - started
+
+    sent_at: dict[str, float] = {}
+    text = f"load-test-{time.time_ns()}"
+    waiters = [
+        asyncio.create_task(receive_one(socket, sent_at)) for socket in sockets
+    ]
+
+    async with httpx.AsyncClient(
+        base_url=base_url, cookies={TOKEN_KEY: token}
+    ) as client:
+        sent_at[text] = time.perf_counter()
+        response = await client.post(
+            f"/chat/{args.chat}/message", json={"text": text}
+        )
+        response.raise_for_status()
+
+    latencies = [
+        latency for latency in await asyncio.gather(*waiters) if latency
+    ]
+    await asyncio.gather(
+        *(socket.close() for socket in sockets), return_exceptions=True
+    )
+
+    return {
+        "connections_requested": args.connections,
+        "connections_open": len(sockets),
+        "connection_failures": failures,
+        "connect_seconds": round(connect_seconds, 3),
+        "delivered": len(latencies),
+        "delivery_ms": {
+            "mean": (
+                round(statistics.mean(latencies) * 1000, 2)
+                if latencies
+                else None
+            ),
+            **latency_summary(latencies),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", default="user1@example.com")
+    parser.add_argument("--password", default="pass")
+    parser.add_argument("--chat", required=True, help="chat id of the user")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    logger.info("Stream load test finished", **report)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Insert throughput, index size and WAL volume of UUID4 vs UUIDv7 keys
+
+Fills one scratch table per key kind with the same rows in batches and
+reports what the primary key costs:
+
+    python -m benchmarks.uuid_insert --rows 20000000 --output uuid.json
+
+Ids are generated before each batch is timed, so rows/s measures the
+database side only. Random UUID4 keys land on random B-tree leaves, so
+once the index outgrows shared buffers every batch dirties (and after a
+checkpoint, logs in full) pages all over it; UUIDv7 keys append to the
+rightmost leaf.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from benchmarks.common import git_revision
+from src.config import engine
+from src.logger import logger
+from src.utils import uuid7
+
+KINDS = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+INSERT_QUERY = """
+    INSERT INTO {table} (id, payload)
+    SELECT * FROM unnest($1::uuid[], $2::text[])
+"""
+
+
+async def measure(connection, kind: str, args: argparse.Namespace) -> dict:
+    table = f"bench_{kind}"
+    await connection.execute(f"DROP TABLE IF EXISTS {table}")
+    await connection.execute(
+        f"CREATE TABLE {table} (id uuid PRIMARY KEY, payload text)"
+    )
+    try:
+        # Same starting point for full page writes of both runs
+        await connection.execute("CHECKPOINT")
+    except Exception as exc:
+        logger.warning("Checkpoint skipped", error=str(exc))
+
+    generate = KINDS[kind]
+    payloads = ["x" * args.payload] * args.batch
+    wal_before = await connection.fetchval("SELECT pg_current_wal_lsn()")
+    elapsed = 0.0
+    inserted = 0
+
+    while inserted < args.rows:
+        size = min(args.batch, args.rows - inserted)
+        ids = [generate() for _ in range(size)]
+        started = time.perf_counter()
+        await connection.execute(
+            INSERT_QUERY.format(table=table), ids, payloads[:size]
+        )
+        elapsed += time.perf_counter() - started
+        inserted += size
+
+    wal_bytes = await connection.fetchval(
+        "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), $1)", wal_before
+    )
+    index_bytes = await connection.fetchval(
+        "SELECT pg_relation_size($1)", f"{table}_pkey"
+    )
+    table_bytes = await connection.fetchval(
+        "SELECT pg_relation_size($1)", table
+    )
+    if not args.keep:
+        await connection.execute(f"DROP TABLE {table}")
+
+    return {
+        "rows": inserted,
+        "rows_per_second": round(inserted / max(elapsed, 1e-9)),
+        "seconds": round(elapsed, 2),
+        "index_mb": round(index_bytes / 2**20, 1),
+        "table_mb": round(table_bytes / 2**20, 1),
+        "wal_mb": round(float(wal_bytes) / 2**20, 1),
+        "wal_bytes_per_row": round(float(wal_bytes) / inserted, 1),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    report = {
+        "revision": git_revision(),
+        "rows": args.rows,
+        "batch": args.batch,
+        "results": {},
+    }
+
+    async with engine.connect() as conn:
+        raw_connection = await conn.get_raw_connection()
+        connection = raw_connection.driver_connection
+        for kind in args.kinds:
+            report["results"][kind] = await measure(connection, kind, args)
+            logger.info(
+                "Inserts measured", kind=kind, **report["results"][kind]
+            )
+
+    await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--payload", type=int, default=100, help="row bytes")
+    parser.add_argument(
+        "--kinds", nargs="+", choices=list(KINDS), default=list(KINDS)
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="keep tables for inspection"
+    )
+    parser.add_argument("--output", help="write JSON report to file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,203 @@
+"""Generate fixtures as CSV streams
+
+Rows are written one by one, so memory stays flat whatever the scale:
+
+    python -m fixtures.generate --users 1000 --chats-per-user 100 \
+        --messages-per-chat 100
+"""
+
+import argparse
+import csv
+import itertools
 import json
-import uuid
+import random
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+
+from pwdlib import PasswordHash
+
 from src.logger import logger
+from src.utils import uuid7
 
 FIXTURES_DIR = Path("fixtures")
-FIXTURES_DIR.mkdir(exist_ok=True)
 
 USERS_COUNT = 5
 CHATS_PER_USER = 10
 MESSAGES_PER_CHAT = 20
+MEMBERS_PER_CHAT = 2
+VOCABULARY_SIZE = 5000
+PASSWORD = "pass"
+
+TABLES = {
+    "users": [
+        "id", "first_name", "last_name", "email", "password",
+        "is_active", "is_2fa_enabled", "created_at", "updated_at",
+    ],
+    "chats": [
+        "id", "name", "is_muted", "is_archived", "last_message_id",
+        "last_message_at", "last_activity_at", "message_count",
+        "created_at", "updated_at",
+    ],
+    "user_chats": ["id", "user", "chat", "last_read_at", "read_count"],
+    "messages": ["id", "text", "user", "chat", "created_at", "updated_at"],
+}
+# Time span of messages, so seeding needs no pass over them
+METADATA_FILE = "metadata.json"
+
+
+def open_writer(name: str, stack: ExitStack) -> csv.DictWriter:
+    """CSV writer with header for fixture table"""
+
+    file = stack.enter_context(
+        open(FIXTURES_DIR / f"{name}.csv", "w", newline="")
+    )
+    writer = csv.DictWriter(file, fieldnames=TABLES[name])
+    writer.writeheader()
+    return writer
+
+
+def random_uuid(rng: random.Random, moment: datetime) -> str:
+    """Reproducible UUIDv7 string of row created at ``moment``"""
+
+    return str(uuid7(moment, randbits=rng.getrandbits))
+
+
+def vocabulary(size: int) -> tuple[list[str], list[float]]:
+    """Words with Zipf cumulative weights, word{n} is n-th most frequent"""
+
+    words = [f"word{n}" for n in range(1, size + 1)]
+    cum_weights = list(itertools.accumulate(1 / n for n in range(1, size + 1)))
+    return words, cum_weights
 
-users = []
-chats = []
-user_chats = []
-messages = []
-
-
-# ---- USERS ----
-for i in range(1, USERS_COUNT + 1):
-    user_id = uuid.uuid4()
-    users.append({
-        "id": str(user_id),
-        "first_name": f"User{i}",
-        "last_name": "Test",
-        "email": f"user{i}@example.com",
-        "password": f"pass{i}"
-    })
-
-    # ---- CHATS ----
-    for ci in range(1, CHATS_PER_USER + 1):
-        chat_id = uuid.uuid4()
-        chats.append({
-            "id": str(chat_id),
-            "name": f"Chat {i}-{ci}"
-        })
-
-        # relation
-        user_chats.append({
-            "id": str(uuid.uuid4()),
-            "user": str(user_id),
-            "chat": str(chat_id)
-        })
-
-        # ---- MESSAGES ----
-        for mi in range(1, MESSAGES_PER_CHAT + 1):
-            messages.append({
-                "id": str(uuid.uuid4()),
-                "text": f"Message {mi} in chat {i}-{ci}",
-                "user": str(user_id),
-                "chat": str(chat_id)
+
+def generate(args: argparse.Namespace) -> None:
+    """Stream users, chats, memberships and messages to CSV files"""
+
+    FIXTURES_DIR.mkdir(exist_ok=True)
+    rng = random.Random(args.seed)
+
+    # One Argon2 hash shared by all users, hashing millions is not viable
+    password = PasswordHash.recommended().hash(args.password)
+    started = datetime.now(timezone.utc) - timedelta(days=args.days)
+    message_step = timedelta(days=args.days) / max(args.messages_per_chat, 1)
+
+    user_ids = [random_uuid(rng, started) for _ in range(args.users)]
+    words, cum_weights = vocabulary(args.vocabulary)
+
+    with ExitStack() as stack:
+        users = open_writer("users", stack)
+        chats = open_writer("chats", stack)
+        user_chats = open_writer("user_chats", stack)
+        messages = open_writer("messages", stack)
+
+        for i, user_id in enumerate(user_ids, start=1):
+            created_at = started.isoformat()
+            users.writerow({
+                "id": user_id,
+                "first_name": f"User{i}",
+                "last_name": "Test",
+                "email": f"user{i}@example.com",
+                "password": password,
+                "is_active": True,
+                "is_2fa_enabled": False,
+                "created_at": created_at,
+                "updated_at": created_at,
             })
 
-# ---- WRITE FILES ----
-(FIXTURES_DIR / "users.json").write_text(json.dumps(users, indent=2))
-(FIXTURES_DIR / "chats.json").write_text(json.dumps(chats, indent=2))
-(FIXTURES_DIR / "user_chats.json").write_text(json.dumps(user_chats, indent=2))
-(FIXTURES_DIR / "messages.json").write_text(json.dumps(messages, indent=2))
+        for i, user_id in enumerate(user_ids, start=1):
+            for ci in range(1, args.chats_per_user + 1):
+                chat_id = random_uuid(rng, started)
+
+                members = {user_id}
+                while len(members) < min(args.members_per_chat, args.users):
+                    members.add(rng.choice(user_ids))
+
+                members = list(members)
+                last_message_id = last_message_at = None
+                last_activity_at = started.isoformat()
+                for mi in range(1, args.messages_per_chat + 1):
+                    sent_at = started + message_step * mi
+                    last_message_id = random_uuid(rng, sent_at)
+                    last_activity_at = last_message_at = sent_at.isoformat()
+                    text = rng.choices(
+                        words, cum_weights=cum_weights, k=rng.randint(3, 15)
+                    )
+                    messages.writerow({
+                        "id": last_message_id,
+                        "text": " ".join(text),
+                        "user": rng.choice(members),
+                        "chat": chat_id,
+                        "created_at": last_activity_at,
+                        "updated_at": last_activity_at,
+                    })
+
+                chats.writerow({
+                    "id": chat_id,
+                    "name": f"Chat {i}-{ci}",
+                    "is_muted": False,
+                    "is_archived": False,
+                    "last_message_id": last_message_id,
+                    "last_message_at": last_message_at,
+                    "last_activity_at": last_activity_at,
+                    "message_count": args.messages_per_chat,
+                    "created_at": started.isoformat(),
+                    "updated_at": started.isoformat(),
+                })
+                # Members have read the whole history
+                for member in members:
+                    user_chats.writerow({
+                        "id": random_uuid(rng, started),
+                        "user": member,
+                        "chat": chat_id,
+                        "last_read_at": last_message_at,
+                        "read_count": args.messages_per_chat,
+                    })
+
+    sent = [
+        (started + message_step * mi).isoformat()
+        for mi in (1, args.messages_per_chat)
+        if args.messages_per_chat and args.chats_per_user and args.users
+    ]
+    with open(FIXTURES_DIR / METADATA_FILE, "w") as file:
+        json.dump(
+            {
+                "oldest_message": sent[0] if sent else None,
+                "newest_message": sent[-1] if sent else None,
+            },
+            file,
+            indent=2,
+        )
+
+    logger.info(
+        "Fixtures generated!",
+        users=args.users,
+        chats=args.users * args.chats_per_user,
+        messages=args.users * args.chats_per_user * args.messages_per_chat,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=USERS_COUNT)
+    parser.add_argument("--chats-per-user", type=int, default=CHATS_PER_USER)
+    parser.add_argument(
+        "--messages-per-chat", type=int, default=MESSAGES_PER_CHAT
+    )
+    parser.add_argument(
+        "--members-per-chat", type=int, default=MEMBERS_PER_CHAT
+    )
+    parser.add_argument("--days", type=int, default=30, help="history span")
+    parser.add_argument(
+        "--vocabulary",
+        type=int,
+        default=VOCABULARY_SIZE,
+        help="distinct words",
+    )
+    parser.add_argument("--password", default=PASSWORD)
+    parser.add_argument("--seed", type=int, default=0)
+    generate(parser.parse_args())
+
 
-logger.info("Fixtures generated!")
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,157 @@
+"""Load CSV fixtures with COPY
+
+    python -m fixtures.generate --users 1000 --chats-per-user 100 \
+        --messages-per-chat 100
+    python -m fixtures.seed
+
+Files are streamed to Postgres and parsed server side, so memory stays
+flat and Python never touches individual rows. Secondary indexes and
+foreign keys are dropped for the load and rebuilt once at the end, which
+is far cheaper than maintaining them row by row. Schema is migrated
+first and message partitions are created up front for the whole span
+of the fixture history, as recorded by the generator in metadata.json.
+"""
+
+import argparse
+import asyncio
+import csv
 import json
+import time
+from datetime import datetime
 from pathlib import Path
-from src.config import db_session
-from src.models import UserModel, ChatModel, UserChatModel, MessageModel
+
+from src.config import engine
 from src.logger import logger
+from src.migrate import migrate
+from src.services.partition import create_partitions
+from fixtures.generate import FIXTURES_DIR, METADATA_FILE
+
+# Parents first, so foreign keys resolve
+TABLES = [
+    ("user", "users.csv"),
+    ("chat", "chats.csv"),
+    ("user_chat", "user_chats.csv"),
+    ("message", "messages.csv"),
+]
+
+
+def read_header(path: Path) -> list[str]:
+    """Column names from CSV header"""
+
+    with open(path, newline="") as file:
+        return next(csv.reader(file))
+
+
+FOREIGN_KEYS_QUERY = """
+    SELECT conname, pg_get_constraintdef(oid)
+    FROM pg_constraint
+    WHERE conrelid = quote_ident($1)::regclass AND contype = 'f'
+"""
 
-FIXTURES_DIR = Path("fixtures")
+INDEXES_QUERY = """
+    SELECT i.relname, pg_get_indexdef(i.oid)
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    WHERE x.indrelid = quote_ident($1)::regclass
+      AND NOT x.indisprimary
+      AND NOT EXISTS (
+        SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid
+      )
+"""
 
-async def seed():
-    async with db_session() as session:
-        users = json.loads((FIXTURES_DIR / "users.json").read_text())
-        chats = json.loads((FIXTURES_DIR / "chats.json").read_text())
-        user_chats = json.loads((FIXTURES_DIR / "user_chats.json").read_text())
-        messages = json.loads((FIXTURES_DIR / "messages.json").read_text())
 
-        for u in users:
-            session.add(UserModel(**u))
-        
-        await session.commit()
+def oldest_message() -> datetime | None:
+    """Earliest created_at of message fixtures"""
 
-        for c in chats:
-            session.add(ChatModel(**c))
+    with open(FIXTURES_DIR / METADATA_FILE) as file:
+        oldest = json.load(file)["oldest_message"]
+    return datetime.fromisoformat(oldest) if oldest else None
 
-        for uc in user_chats:
-            session.add(UserChatModel(**uc))
 
-        for m in messages:
-            session.add(MessageModel(**m))
+async def drop_secondary(connection, table: str) -> list[str]:
+    """Drop foreign keys and secondary indexes, return DDL restoring them"""
 
-        await session.commit()
+    restore = []
+    for name, definition in await connection.fetch(FOREIGN_KEYS_QUERY, table):
+        await connection.execute(
+            f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"'
+        )
+        restore.append(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}'
+        )
 
+    for name, definition in await connection.fetch(INDEXES_QUERY, table):
+        await connection.execute(f'DROP INDEX "{name}"')
+        # Partitioned index is defined ON ONLY the parent, which would
+        # leave it invalid without indexes of the partitions
+        restore.insert(0, definition.replace(" ON ONLY ", " ON ", 1))
+
+    return restore
+
+
+async def seed(drop_indexes: bool) -> None:
+    await create_partitions(since=oldest_message())
+
+    async with engine.connect() as conn:
+        raw_connection = await conn.get_raw_connection()
+        connection = raw_connection.driver_connection
+        # Losing the tail of a seed on crash is fine, waiting on fsync is not
+        await connection.execute("SET synchronous_commit TO off")
+        await connection.execute("SET maintenance_work_mem TO '512MB'")
+
+        restore = []
+        if drop_indexes:
+            for table, _ in TABLES:
+                restore.extend(await drop_secondary(connection, table))
+
+        try:
+            for table, filename in TABLES:
+                path = FIXTURES_DIR / filename
+                started = time.perf_counter()
+                status = await connection.copy_to_table(
+                    table,
+                    source=path,
+                    columns=read_header(path),
+                    format="csv",
+                    header=True,
+                )
+                rows = int(status.split()[-1])
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    "Table seeded",
+                    table=table,
+                    rows=rows,
+                    rows_per_second=round(rows / max(elapsed, 1e-9)),
+                )
+        finally:
+            # Rebuild even after failed load, never leave tables unindexed
+            started = time.perf_counter()
+            for statement in restore:
+                await connection.execute(statement)
+            if restore:
+                logger.info(
+                    "Indexes and foreign keys rebuilt",
+                    statements=len(restore),
+                    seconds=round(time.perf_counter() - started, 2),
+                )
+
+        await connection.execute("ANALYZE")
+
+    await engine.dispose()
     logger.info("Database seeded successfully!")
 
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--keep-indexes",
+        action="store_true",
+        help="maintain indexes during load (for seeding non-empty tables)",
+    )
+    args = parser.parse_args()
+    migrate()
+    asyncio.run(seed(drop_indexes=not args.keep_indexes))
+
+
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(seed())
+    main()
@@ -0,0 +1,87 @@
+"""Alembic environment, migrations use the application database"""
+
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import pool, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.config import DATABASE_URL
+from src.models import Base
+
+# Serializes migration runs started at the same time
+MIGRATION_LOCK = 0x6D696772
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get(
+    "configure_logger", True
+):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+# Created by migrations only where the server supports them
+UNMANAGED_INDEXES = {"ix_user_search_key_trgm"}
+
+
+def include_object(obj, name, type_, reflected, compare_to) -> bool:
+    """Leave out message partitions and optional indexes"""
+
+    if type_ == "index" and name in UNMANAGED_INDEXES:
+        return False
+    if type_ == "foreign_key_constraint" and reflected:
+        # PostgreSQL clones foreign keys onto each message partition
+        return obj.referred_table.name in target_metadata.tables
+    return not (type_ == "table" and reflected and compare_to is None)
+
+
+def run_migrations_offline() -> None:
+    """Emit migration SQL without connecting"""
+
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+    )
+    # Session lock, held across autocommit blocks of concurrent index builds
+    connection.execute(
+        text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK}
+    )
+    connection.commit()
+    try:
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        connection.execute(
+            text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK}
+        )
+        connection.commit()
+
+
+async def run_migrations_online() -> None:
+    """Apply migrations over a dedicated connection"""
+
+    connectable = create_async_engine(DATABASE_URL, poolclass=pool.NullPool)
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await connectable.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
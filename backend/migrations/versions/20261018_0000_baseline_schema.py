@@ -0,0 +1,83 @@
+"""baseline schema
+
+Tables as created by ``Base.metadata.create_all`` before migrations were
+introduced. Databases created that way are stamped with this revision by
+``src.migrate`` and upgraded from here.
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-18 06:20:12.504117
+"""
+
+from typing import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0000"
+down_revision: str | None = None
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def timestamps() -> list[sa.Column]:
+    return [
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("first_name", sa.String(), nullable=True),
+        sa.Column("last_name", sa.String(), nullable=True),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("password", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("is_2fa_enabled", sa.Boolean(), nullable=True),
+        sa.Column("otp_secret", sa.String(), nullable=True),
+        *timestamps(),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_user_email", "user", ["email"], unique=True)
+
+    op.create_table(
+        "chat",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("is_muted", sa.Boolean(), nullable=True),
+        sa.Column("is_archived", sa.Boolean(), nullable=True),
+        *timestamps(),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    op.create_table(
+        "user_chat",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("user", sa.UUID(), nullable=True),
+        sa.Column("chat", sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(["chat"], ["chat.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    op.create_table(
+        "message",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("text", sa.TEXT(), nullable=True),
+        sa.Column("user", sa.UUID(), nullable=True),
+        sa.Column("chat", sa.UUID(), nullable=True),
+        *timestamps(),
+        sa.ForeignKeyConstraint(["chat"], ["chat.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("message")
+    op.drop_table("user_chat")
+    op.drop_table("chat")
+    op.drop_table("user")
@@ -0,0 +1,267 @@
+"""user search, chat activity, read pointers and partitioned messages
+
+The message table is converted to one range partitioned by created_at:
+the old table is renamed, partitions covering its rows are created, the
+rows are copied over and the old table dropped. Messages are locked
+against writes meanwhile, so run it in a maintenance window on large
+installs.
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18 06:22:41.200349
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0001"
+down_revision: str | None = "0000"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# Text search config of search_vector, as of this revision
+SEARCH_LANGUAGE = "simple"
+
+MESSAGE_COLUMNS = 'id, text, "user", chat, created_at, updated_at'
+MESSAGE_CONSTRAINTS = (
+    "message_pkey",
+    "message_user_fkey",
+    "message_chat_fkey",
+)
+
+
+def create_message_partitions(first: datetime, last: datetime) -> None:
+    """Monthly partitions covering [first, last], named like those the
+    app creates from then on"""
+
+    first = first.astimezone(timezone.utc)
+    bound = datetime(first.year, first.month, 1, tzinfo=timezone.utc)
+    while bound <= last:
+        upper = (bound.replace(day=28) + timedelta(days=4)).replace(day=1)
+        op.execute(
+            f'CREATE TABLE "message_p{bound:%Y%m%d}" PARTITION OF message '
+            f"FOR VALUES FROM ('{bound.isoformat()}') "
+            f"TO ('{upper.isoformat()}')"
+        )
+        bound = upper
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user",
+        sa.Column(
+            "search_key",
+            sa.String(),
+            sa.Computed(
+                "lower(coalesce(first_name, '') || ' ' || "
+                "coalesce(last_name, '') || ' ' || coalesce(email, ''))",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    for field in ("email", "first_name", "last_name"):
+        op.create_index(
+            f"ix_user_{field}_prefix",
+            "user",
+            [sa.literal_column(f"lower({field})").label(field)],
+            postgresql_ops={field: "text_pattern_ops"},
+        )
+
+    # Substring search, only where pg_trgm is shipped with the server;
+    # elsewhere it falls back to scanning the table
+    trigrams = op.get_bind().scalar(
+        sa.text(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+    )
+    if trigrams:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            'CREATE INDEX ix_user_search_key_trgm ON "user" '
+            "USING gin (search_key gin_trgm_ops)"
+        )
+
+    op.add_column("chat", sa.Column("last_message_id", sa.UUID()))
+    op.add_column(
+        "chat", sa.Column("last_message_at", sa.DateTime(timezone=True))
+    )
+    op.add_column(
+        "chat",
+        sa.Column(
+            "last_activity_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    op.add_column("chat", sa.Column("retention_days", sa.Integer()))
+    op.add_column(
+        "chat",
+        sa.Column(
+            "message_count", sa.Integer(), server_default="0", nullable=False
+        ),
+    )
+
+    op.add_column(
+        "user_chat",
+        sa.Column("last_read_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "user_chat",
+        sa.Column(
+            "read_count", sa.Integer(), server_default="0", nullable=False
+        ),
+    )
+
+    # Constraints are dropped so the new table gets the same names as on
+    # fresh installs, the old one is only read from now on
+    op.rename_table("message", "message_legacy")
+    for constraint in MESSAGE_CONSTRAINTS:
+        op.execute(f"ALTER TABLE message_legacy DROP CONSTRAINT {constraint}")
+
+    op.create_table(
+        "message",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("text", sa.TEXT(), nullable=True),
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                f"to_tsvector('{SEARCH_LANGUAGE}'::regconfig, "
+                "coalesce(text, ''))",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+        sa.Column("user", sa.UUID(), nullable=True),
+        sa.Column("chat", sa.UUID(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["chat"], ["chat.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id", "created_at"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+
+    # created_at was nullable, it is the partition key now
+    op.execute(
+        "UPDATE message_legacy "
+        "SET created_at = coalesce(updated_at, now()) "
+        "WHERE created_at IS NULL"
+    )
+    first, last = op.get_bind().execute(
+        sa.text(
+            "SELECT min(created_at), max(created_at) FROM message_legacy"
+        )
+    ).one()
+    if first is not None:
+        create_message_partitions(first, last)
+    op.execute(
+        f"INSERT INTO message ({MESSAGE_COLUMNS}) "
+        f"SELECT {MESSAGE_COLUMNS} FROM message_legacy"
+    )
+    op.drop_table("message_legacy")
+
+    op.create_index(
+        "ix_message_chat_created_at_id",
+        "message",
+        ["chat", "created_at", "id"],
+    )
+    op.create_index(
+        "ix_message_search_vector",
+        "message",
+        ["search_vector"],
+        postgresql_using="gin",
+    )
+
+    op.execute(
+        "UPDATE chat SET last_activity_at = created_at "
+        "WHERE created_at IS NOT NULL"
+    )
+    op.execute(
+        "UPDATE chat SET last_message_id = last.id, "
+        "last_message_at = last.created_at, "
+        "last_activity_at = last.created_at "
+        "FROM ("
+        "SELECT DISTINCT ON (chat) chat, id, created_at FROM message "
+        "ORDER BY chat, created_at DESC, id DESC"
+        ") last "
+        "WHERE last.chat = chat.id"
+    )
+    op.execute(
+        "UPDATE chat SET message_count = counted.count "
+        "FROM (SELECT chat, count(*) FROM message GROUP BY chat) counted "
+        "WHERE counted.chat = chat.id"
+    )
+    # Nothing is unread until the next message arrives
+    op.execute(
+        "UPDATE user_chat SET read_count = chat.message_count, "
+        "last_read_at = chat.last_message_at "
+        "FROM chat WHERE chat.id = user_chat.chat"
+    )
+
+    op.create_table(
+        "message_key",
+        sa.Column("user", sa.UUID(), nullable=False),
+        sa.Column("idempotency_key", sa.String(), nullable=False),
+        sa.Column("message_id", sa.UUID(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["message_id", "created_at"],
+            ["message.id", "message.created_at"],
+            ondelete="CASCADE",
+            deferrable=True,
+            initially="DEFERRED",
+        ),
+        sa.ForeignKeyConstraint(["user"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user", "idempotency_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("message_key")
+
+    op.rename_table("message", "message_partitioned")
+    for constraint in MESSAGE_CONSTRAINTS:
+        op.execute(
+            f"ALTER TABLE message_partitioned DROP CONSTRAINT {constraint}"
+        )
+    op.create_table(
+        "message",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("text", sa.TEXT(), nullable=True),
+        sa.Column("user", sa.UUID(), nullable=True),
+        sa.Column("chat", sa.UUID(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["chat"], ["chat.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute(
+        f"INSERT INTO message ({MESSAGE_COLUMNS}) "
+        f"SELECT {MESSAGE_COLUMNS} FROM message_partitioned"
+    )
+    # Partitions go with their parent
+    op.drop_table("message_partitioned")
+
+    op.drop_column("user_chat", "read_count")
+    op.drop_column("user_chat", "last_read_at")
+    for column in (
+        "message_count",
+        "retention_days",
+        "last_activity_at",
+        "last_message_at",
+        "last_message_id",
+    ):
+        op.drop_column("chat", column)
+
+    op.execute("DROP INDEX IF EXISTS ix_user_search_key_trgm")
+    for field in ("email", "first_name", "last_name"):
+        op.drop_index(f"ix_user_{field}_prefix", table_name="user")
+    op.drop_column("user", "search_key")
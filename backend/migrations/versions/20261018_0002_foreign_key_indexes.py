@@ -0,0 +1,99 @@
+"""foreign key indexes, unique memberships and retention index
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:12:05.418227
+"""
+
+from typing import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0002"
+down_revision: str | None = "0001"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+PARTITIONS_QUERY = """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'message'::regclass AND NOT i.inhdetachpending
+"""
+
+
+def create_message_index(name: str, column: str) -> None:
+    """Index partitioned message table without blocking writes
+
+    The parent index is created invalid ON ONLY the parent, each
+    partition is indexed concurrently and attached, which validates the
+    parent once all are. Partitions created later inherit the index.
+    """
+
+    op.execute(
+        f'CREATE INDEX IF NOT EXISTS {name} ON ONLY message ("{column}")'
+    )
+    partitions = op.get_bind().scalars(sa.text(PARTITIONS_QUERY)).all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            index = f"{partition}_{column}_idx"
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{index}" '
+                f'ON "{partition}" ("{column}")'
+            )
+            op.execute(f'ALTER INDEX {name} ATTACH PARTITION "{index}"')
+
+
+def upgrade() -> None:
+    # Keep one of duplicate memberships, so the unique index builds.
+    # user_chat has no creation time and its ids are random, the
+    # physically first row is kept.
+    op.execute(
+        'DELETE FROM user_chat a USING user_chat b '
+        'WHERE a."user" = b."user" AND a.chat = b.chat AND a.ctid > b.ctid'
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "uq_user_chat_user_chat",
+            "user_chat",
+            ["user", "chat"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_user_chat_chat",
+            "user_chat",
+            ["chat"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_message_key_message_id_created_at",
+            "message_key",
+            ["message_id", "created_at"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_chat_retention_days",
+            "chat",
+            ["retention_days"],
+            postgresql_where=sa.text("retention_days IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+    op.execute(
+        "ALTER TABLE user_chat ADD CONSTRAINT uq_user_chat_user_chat "
+        "UNIQUE USING INDEX uq_user_chat_user_chat"
+    )
+
+    create_message_index("ix_message_user", "user")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_retention_days", table_name="chat")
+    op.drop_index("ix_message_user", table_name="message")
+    op.drop_index(
+        "ix_message_key_message_id_created_at", table_name="message_key"
+    )
+    op.drop_index("ix_user_chat_chat", table_name="user_chat")
+    op.drop_constraint("uq_user_chat_user_chat", "user_chat", type_="unique")
@@ -0,0 +1,43 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.utils import CheckoutStats
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """SQLAlchemy async pool that records connection checkout wait time"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.checkout_stats.timeouts += 1
+            raise
+
+        self.checkout_stats.record(time.perf_counter() - started)
+        return record
+
+    def recreate(self) -> "InstrumentedQueuePool":
+        # Keep counters when pool is recreated after invalidation
+        pool = super().recreate()
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage"""
+
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            **self.checkout_stats.snapshot(),
+        }
@@ -3,30 +3,87 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter
 from sqlalchemy import text
 
-from src.config import BASE_URL, APP_TITLE, redis_client, engine
-from src.routers import auth, user, chat, message
+from src.config import BASE_URL, APP_TITLE, engine, replica_engines
+from src.routers import (
+    auth, user, chat, message, stream, metrics, health
+)
 from src.logger import logger
-from src.models import Base
+from src.metrics import MetricsMiddleware, instrument_engine
+from src.migrate import schema_head, schema_revision
+from src.redis_pool import redis_client, redis_pool
+from src.services.health import worker_state
+from src.services.mail import mail_dispatcher
+from src.services.partition import partition_maintainer
+from src.services.message import message_writer
+from src.services.receipt import read_receipts
+from src.services.replica import replica_router
+from src.services.stream import broker
+from src.services.token import revocation_list
+from src.services.user import password_executor
 
 
 @asynccontextmanager
 async def lifespan(app_span: FastAPI):
     """Lifespan FastAPI app"""
 
-    redis_client.ping()
+    await redis_client.ping()
     logger.info("✅ Redis connection established")
 
     async with engine.connect() as conn:
         await conn.execute(text("SELECT 1"))
+        revision = await schema_revision(conn)
     logger.info("✅ PostgreSQL connection established")
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    logger.info("✅ PostgreSQL migrated")
+    # Schema is migrated by ``python -m src.migrate`` before deploy,
+    # until then readiness keeps this worker out of rotation
+    if revision != schema_head():
+        logger.warning(
+            "PostgreSQL schema not migrated",
+            revision=revision,
+            expected=schema_head(),
+        )
 
-    yield
+    await replica_router.start()
+    if replica_router.engines:
+        logger.info(
+            "✅ Read replicas checked",
+            healthy=len(replica_router.healthy),
+            replicas=len(replica_router.engines),
+        )
+
+    await revocation_list.start()
+    logger.info("✅ Token revocations loaded")
+
+    await partition_maintainer.start()
+    logger.info("✅ Partition maintainer started")
+
+    await broker.start()
+    logger.info("✅ Realtime stream started")
 
-    redis_client.close()
+    await mail_dispatcher.start()
+    logger.info("✅ Mail dispatcher started")
+
+    await read_receipts.start()
+    logger.info("✅ Read receipts flusher started")
+
+    await message_writer.start()
+    logger.info("✅ Message writer started")
+
+    worker_state.started = True
+    yield
+    # Fail readiness first, so no new traffic arrives while draining
+    worker_state.stopping = True
+
+    await message_writer.stop()
+    await read_receipts.stop()
+    await partition_maintainer.stop()
+    await replica_router.stop()
+    await revocation_list.stop()
+    await mail_dispatcher.stop()
+    await broker.stop()
+    password_executor.shutdown()
+    await redis_client.aclose()
+    await redis_pool.disconnect()
     logger.info("🛑 Application shutting down")
 
 
@@ -43,7 +100,15 @@ router.include_router(auth.router)
 router.include_router(user.router)
 router.include_router(chat.router)
 router.include_router(message.router)
+router.include_router(message.messages_router)
+router.include_router(stream.router)
+router.include_router(metrics.router)
+router.include_router(health.router)
 app.include_router(router)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+for replica_engine in replica_engines:
+    instrument_engine(replica_engine)
 
 
 @app.get(f"{BASE_URL}")
@@ -52,35 +117,3 @@ def health():
 
     return "OK"
 
-
-
-
-# @app.get("/stream")
-# async def stream():
-#     """Server Sent Action for new message"""
-
-#     pubsub = app.state.redis.pubsub()
-#     await pubsub.subscribe("chat")
-
-#     async def event_stream():
-#         try:
-#             async for msg in pubsub.listen():
-#                 if msg["type"] == "message":
-#                     yield f"data: {msg['data']}\n\n"
-#         finally:
-#             await pubsub.unsubscribe("chat")
-#             await pubsub.close()
-
-#     return StreamingResponse(event_stream(), media_type="text/event-stream")
-
-
-# @app.post("/message")
-# async def send_message(
-#     message: Message, session: AsyncSession = Depends(get_pg_session)
-# ) -> MessageResponse:
-#     """Post new message to chat"""
-
-#     message_instance = await create_message(session, message.input.text)
-#     message_response = MessageResponse.model_validate(message_instance)
-#     await app.state.redis.publish("chat", message_response.model_dump_json())
-#     return message_response
@@ -0,0 +1,223 @@
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    REGISTRY,
+)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config import engine, replica_engines, DB_SLOW_QUERY_MS
+from src.logger import logger
+from src.redis_pool import redis_pool
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being processed"
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries per HTTP request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Database time per HTTP request",
+    ["route"],
+)
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "Database query latency")
+SLOW_QUERIES = Counter(
+    "db_slow_queries_total", "Queries slower than threshold", ["route"]
+)
+MESSAGE_CACHE_REQUESTS = Counter(
+    "message_cache_requests_total",
+    "Chat history page lookups in Redis cache",
+    ["result"],
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total",
+    "Requests rejected by rate limits",
+    ["scope"],
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestStats:
+    """Database usage of current request"""
+
+    __slots__ = ("scope", "queries", "db_time")
+
+    def __init__(self, scope: dict) -> None:
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return route.path if route is not None else UNMATCHED_ROUTE
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and DB usage per route"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = request_stats.set(stats)
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            route = stats.route
+            REQUEST_LATENCY.labels(
+                scope["method"], route, str(status_code)
+            ).observe(elapsed)
+            REQUEST_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_DB_TIME.labels(route).observe(stats.db_time)
+            request_stats.reset(token)
+
+
+def instrument_engine(async_engine: AsyncEngine) -> None:
+    """Count queries and DB time of each request, log slow queries"""
+
+    sync_engine = async_engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, params, context, many):
+        context.query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, params, context, many):
+        elapsed = time.perf_counter() - context.query_started
+        QUERY_LATENCY.observe(elapsed)
+
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            route = stats.route if stats is not None else UNMATCHED_ROUTE
+            SLOW_QUERIES.labels(route).inc()
+            logger.warning(
+                "Slow query",
+                route=route,
+                duration_ms=round(elapsed * 1000, 2),
+                statement=statement[:500],
+            )
+
+
+class PoolCollector:
+    """Expose connection pools usage at scrape time
+
+    Pools live in each worker, so with several workers only the pools
+    of the worker answering the scrape are seen, labelled by its pid.
+    """
+
+    # cumulative pool stats and their metric names
+    COUNTERS = {
+        "checkouts": "checkouts",
+        "checkout_timeouts": "checkout_timeouts",
+        "checkout_wait_total": "checkout_wait_seconds",
+    }
+
+    def __init__(self, per_process: bool = False) -> None:
+        self.per_process = per_process
+
+    def collect(self):
+        # pool -> (label names, [(label values, stats)])
+        pools = {
+            "database": ([], [([], engine.pool.stats())]),
+            "database_replica": (
+                ["replica"],
+                [
+                    ([str(index)], replica.pool.stats())
+                    for index, replica in enumerate(replica_engines)
+                ],
+            ),
+            "redis": ([], [([], redis_pool.stats())]),
+        }
+        if self.per_process:
+            pid = str(os.getpid())
+            pools = {
+                pool: (
+                    ["pid", *labels],
+                    [([pid, *values], stats) for values, stats in samples],
+                )
+                for pool, (labels, samples) in pools.items()
+            }
+        for pool, (labels, samples) in pools.items():
+            if not samples:
+                continue
+            for name in samples[0][1]:
+                if name in self.COUNTERS:
+                    metric = CounterMetricFamily(
+                        f"{pool}_pool_{self.COUNTERS[name]}",
+                        f"{pool} pool {name}",
+                        labels=labels,
+                    )
+                else:
+                    metric = GaugeMetricFamily(
+                        f"{pool}_pool_{name}",
+                        f"{pool} pool {name}",
+                        labels=labels,
+                    )
+                for values, stats in samples:
+                    metric.add_metric(values, stats[name])
+                yield metric
+
+
+REGISTRY.register(PoolCollector())
+
+
+def render_metrics() -> bytes:
+    """Prometheus text exposition of all metrics"""
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Several uvicorn workers: aggregate their metric files
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PoolCollector(per_process=True))
+        return generate_latest(registry)
+
+    return generate_latest()
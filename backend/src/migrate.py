@@ -0,0 +1,97 @@
+"""Apply schema migrations and create upcoming message partitions
+
+Run once per deploy, before starting (or rolling) the workers:
+
+    python -m src.migrate
+
+Workers do not touch the schema, they only report through readiness
+whether the database is at the revision their code expects.
+
+Databases created by ``Base.metadata.create_all`` before migrations
+existed are stamped with the baseline revision first, then upgraded.
+"""
+
+import asyncio
+from functools import lru_cache
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.config import engine
+from src.logger import logger
+from src.services.partition import create_partitions
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+# Schema of databases created before migrations were introduced
+BASELINE_REVISION = "0000"
+
+
+def alembic_config() -> Config:
+    """Alembic configuration, independent of working directory"""
+
+    config = Config(str(ALEMBIC_INI))
+    # Keep application logging setup when run from the app or tests
+    config.attributes["configure_logger"] = False
+    return config
+
+
+@lru_cache
+def schema_head() -> str | None:
+    """Revision the code expects the database to be at"""
+
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+async def schema_revision(conn: AsyncConnection) -> str | None:
+    """Revision the database is at, None before the first migration"""
+
+    try:
+        return await conn.scalar(
+            text("SELECT version_num FROM alembic_version")
+        )
+    except ProgrammingError:
+        await conn.rollback()
+        return None
+
+
+async def unversioned_schema() -> bool:
+    """Whether tables exist without any migration applied"""
+
+    async with engine.connect() as conn:
+        if await schema_revision(conn) is not None:
+            return False
+        return await conn.scalar(
+            text("SELECT to_regclass('message') IS NOT NULL")
+        )
+
+
+def migrate() -> None:
+    """Upgrade schema to head and create partitions ahead of time"""
+
+    async def check() -> bool:
+        unversioned = await unversioned_schema()
+        await engine.dispose()
+        return unversioned
+
+    config = alembic_config()
+    if asyncio.run(check()):
+        command.stamp(config, BASELINE_REVISION)
+        logger.info("Schema stamped", revision=BASELINE_REVISION)
+    command.upgrade(config, "head")
+    logger.info("Schema migrated", revision=schema_head())
+
+    async def prepare() -> None:
+        await create_partitions()
+        await engine.dispose()
+
+    asyncio.run(prepare())
+
+
+if __name__ == "__main__":
+    migrate()
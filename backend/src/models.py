@@ -1,9 +1,18 @@
-import uuid
 from datetime import datetime, timezone
-from sqlalchemy import Column, ForeignKey, DateTime, String, Boolean
-from sqlalchemy.dialects.postgresql import UUID, TEXT
+from sqlalchemy import Column, ForeignKey, DateTime, String, Boolean, Index
+from sqlalchemy import ForeignKeyConstraint, UniqueConstraint
+from sqlalchemy import Integer, Computed
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import UUID, TEXT, TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.ext.declarative import declarative_base
 
+from src.utils import uuid7
+
+# Text search config of messages. Stored vectors are built with it, so
+# changing it takes a migration rebuilding search_vector
+SEARCH_LANGUAGE = "simple"
+
 Base = declarative_base()
 
 
@@ -12,7 +21,7 @@ class UserModel(Base):
 
     __tablename__ = "user"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     first_name = Column(String, nullable=True)
     last_name = Column(String, nullable=True)
     email = Column(String, unique=True, index=True)
@@ -20,14 +29,35 @@ class UserModel(Base):
     is_active = Column(Boolean, default=True)
     is_2fa_enabled = Column(Boolean, default=False)
     otp_secret = Column(String, nullable=True)
+    # Lowercased names and email for substring search, trigram indexed
+    # where the server ships pg_trgm (see the initial migration)
+    search_key = deferred(
+        Column(
+            String,
+            Computed(
+                "lower(coalesce(first_name, '') || ' ' || "
+                "coalesce(last_name, '') || ' ' || coalesce(email, ''))",
+                persisted=True,
+            ),
+        )
+    )
 
     created_at = Column(
-        DateTime(timezone=True), default=datetime.now(timezone.utc)
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
     )
     updated_at = Column(
         DateTime(timezone=True),
-        default=datetime.now(timezone.utc),
-        onupdate=datetime.now(timezone.utc),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+
+# Prefix search on any of the fields, LIKE 'abc%' is a btree range scan
+for field in ("email", "first_name", "last_name"):
+    Index(
+        f"ix_user_{field}_prefix",
+        func.lower(UserModel.__table__.c[field]).label(field),
+        postgresql_ops={field: "text_pattern_ops"},
     )
 
 
@@ -36,43 +66,107 @@ class ChatModel(Base):
 
     __tablename__ = "chat"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     name = Column(String)
 
     is_muted = Column(Boolean, default=False)
     is_archived = Column(Boolean, default=False)
 
+    # Denormalized on message insert, so chat list needs no history scan
+    last_message_id = Column(UUID(as_uuid=True), nullable=True)
+    # Lets the last message lookup prune message partitions
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    last_activity_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+    )
+    # Messages older than this are deleted, unless kept longer globally
+    retention_days = Column(Integer, nullable=True)
+    # Messages posted to the chat, unread counts of members derive from it
+    message_count = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+
     created_at = Column(
-        DateTime(timezone=True), default=datetime.now(timezone.utc)
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
     )
     updated_at = Column(
         DateTime(timezone=True),
-        default=datetime.now(timezone.utc),
-        onupdate=datetime.now(timezone.utc),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
     )
 
 
+# Few chats set own retention, the retention job starts from them
+Index(
+    "ix_chat_retention_days",
+    ChatModel.retention_days,
+    postgresql_where=ChatModel.retention_days.is_not(None),
+)
+
+
 class UserChatModel(Base):
     """Connection table between User and Chat"""
 
     __tablename__ = "user_chat"
+    __table_args__ = (
+        # One membership per user and chat, also serves chats of a user
+        UniqueConstraint("user", "chat", name="uq_user_chat_user_chat"),
+        # Members of a chat, for fan-out and cascades from chat
+        Index("ix_user_chat_chat", "chat"),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user = Column(
         UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE")
     )
     chat = Column(
         UUID(as_uuid=True), ForeignKey("chat.id", ondelete="CASCADE")
     )
+    # Read pointer and chat message_count as of it. Unread count is the
+    # difference, so a new message updates the chat row, not every member
+    last_read_at = Column(DateTime(timezone=True), nullable=True)
+    read_count = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
 
 
 class MessageModel(Base):
-    """Message model"""
+    """Message model
+
+    Range partitioned by ``created_at``, partitions are created ahead of
+    time and expired by ``src.services.partition``. UUIDv7 ids carry the
+    creation time, rows inserted with explicit ``created_at`` should get
+    ``uuid7(created_at)`` ids so lookups by id prune partitions.
+    """
 
     __tablename__ = "message"
+    __table_args__ = (
+        # Keyset pagination of chat history walks this index backwards
+        Index("ix_message_chat_created_at_id", "chat", "created_at", "id"),
+        # Cascades from user
+        Index("ix_message_user", "user"),
+        Index(
+            "ix_message_search_vector", "search_vector", postgresql_using="gin"
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     text = Column(TEXT)
+    # Maintained by PostgreSQL, loaded only when asked for
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                f"to_tsvector('{SEARCH_LANGUAGE}'::regconfig, "
+                "coalesce(text, ''))",
+                persisted=True,
+            ),
+        )
+    )
     user = Column(
         UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE")
     )
@@ -80,11 +174,48 @@ class MessageModel(Base):
         UUID(as_uuid=True), ForeignKey("chat.id", ondelete="CASCADE")
     )
 
+    # Partition key, so part of every unique index
     created_at = Column(
-        DateTime(timezone=True), default=datetime.now(timezone.utc)
+        DateTime(timezone=True),
+        primary_key=True,
+        default=lambda: datetime.now(timezone.utc),
     )
     updated_at = Column(
         DateTime(timezone=True),
-        default=datetime.now(timezone.utc),
-        onupdate=datetime.now(timezone.utc),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+
+class MessageKeyModel(Base):
+    """Idempotency key of sent message
+
+    Retried sends of the same message are recognized per sender. Unique
+    indexes of partitioned message table must include ``created_at``, so
+    the keys live in their own table.
+    """
+
+    __tablename__ = "message_key"
+    __table_args__ = (
+        # Deferred, the key is claimed before its message is inserted
+        ForeignKeyConstraint(
+            ["message_id", "created_at"],
+            ["message.id", "message.created_at"],
+            ondelete="CASCADE",
+            deferrable=True,
+            initially="DEFERRED",
+        ),
+        # Cascades from message
+        Index(
+            "ix_message_key_message_id_created_at", "message_id", "created_at"
+        ),
+    )
+
+    user = Column(
+        UUID(as_uuid=True),
+        ForeignKey("user.id", ondelete="CASCADE"),
+        primary_key=True,
     )
+    idempotency_key = Column(String, primary_key=True)
+    message_id = Column(UUID(as_uuid=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
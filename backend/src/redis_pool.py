@@ -0,0 +1,63 @@
+import time
+from typing import AsyncIterator
+
+from redis.asyncio import Redis, BlockingConnectionPool
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.config import (
+    REDIS_URL,
+    REDIS_POOL_SIZE,
+    REDIS_POOL_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT,
+    REDIS_CONNECT_TIMEOUT,
+)
+from src.utils import CheckoutStats
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Bounded Redis pool that records connection checkout wait time"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    async def get_connection(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        except RedisConnectionError:
+            self.checkout_stats.timeouts += 1
+            raise
+
+        self.checkout_stats.record(time.perf_counter() - started)
+        return connection
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage"""
+
+        return {
+            "size": self.max_connections,
+            "in_use": len(self._in_use_connections),
+            **self.checkout_stats.snapshot(),
+        }
+
+
+redis_pool = InstrumentedConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_POOL_SIZE,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    encoding="utf-8",
+    decode_responses=True,
+)
+redis_client = Redis(connection_pool=redis_pool)
+
+
+async def get_redis() -> AsyncIterator[Redis]:
+    """Shared client of the instrumented pool (FastAPI dependency)
+
+    Connections are checked out per command, none is held by the request.
+    """
+
+    yield redis_client
@@ -4,12 +4,20 @@ from uuid import UUID
 
 import qrcode
 from pydantic import EmailStr
-from fastapi import APIRouter, Response, Depends, Body, status
+from fastapi import APIRouter, Request, Response, Depends, Body, status
 from fastapi.responses import StreamingResponse
-
-from src.config import api_key_cookie, refresh_api_key_cookie
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import (
+    api_key_cookie,
+    refresh_api_key_cookie,
+    LOGIN_RATE_LIMIT,
+    LOGIN_IP_RATE_LIMIT,
+)
 from src.schemes import user as user_scheme
 from src.services import user as user_service
+from src.services.rate_limit import rate_limit, body_email, body_user_id
+from src.services.session import request_session
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -18,23 +26,31 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 async def register(
     response: Response,
     user: user_scheme.RegisterScheme,
+    session: AsyncSession = Depends(request_session),
 ) -> user_scheme.AuthenticatedUser:
     """User registration"""
 
-    user_model = await user_service.create_user(user)
+    user_model = await user_service.create_user(user, session)
     user_service.set_auth_cookie(response, user_model.id)
     return user_scheme.AuthenticatedUser.model_validate(user_model)
 
 
-@router.post("/login")
+@router.post(
+    "/login",
+    dependencies=[
+        Depends(rate_limit("login_ip", LOGIN_IP_RATE_LIMIT)),
+        Depends(rate_limit("login", LOGIN_RATE_LIMIT, key=body_email)),
+    ],
+)
 async def login(
     response: Response,
     email: Annotated[EmailStr, Body()],
     password: Annotated[str, Body()],
+    session: AsyncSession = Depends(request_session),
 ) -> Union[user_scheme.AuthenticatedUser, user_scheme.OTPRequiredResponse]:
     """User registration"""
 
-    user_model = await user_service.user_login(email, password)
+    user_model = await user_service.user_login(email, password, session)
     if user_model.is_2fa_enabled:
         return user_scheme.OTPRequiredResponse(
             otp_required=True, user_id=user_model.id
@@ -56,11 +72,12 @@ async def refresh_session(
 
 @router.post("/2fa")
 async def enable_2fa(
-    user_id: UUID = Depends(user_service.authenticated_user)
+    user_id: UUID = Depends(user_service.authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ):
     """Generate QR-code for enabling 2FA"""
 
-    otp_uri = await user_service.enable_2fa(user_id)
+    otp_uri = await user_service.enable_2fa(user_id, session)
 
     qr = qrcode.make(otp_uri)
     buf = io.BytesIO()
@@ -70,21 +87,29 @@ async def enable_2fa(
     return StreamingResponse(buf, media_type="image/png")
 
 
-@router.post("/2fa/validate")
+@router.post(
+    "/2fa/validate",
+    dependencies=[
+        Depends(rate_limit("2fa_ip", LOGIN_IP_RATE_LIMIT)),
+        Depends(rate_limit("2fa", LOGIN_RATE_LIMIT, key=body_user_id)),
+    ],
+)
 async def validate_2fa(
     response: Response,
     user_id: Annotated[UUID, Body()],
     code: Annotated[str, Body(min_length=6, max_length=6)],
+    session: AsyncSession = Depends(request_session),
 ):
     """Validate 2FA code and login"""
 
-    user_model = await user_service.validate_2fa(user_id, code)
+    user_model = await user_service.validate_2fa(user_id, code, session)
     user_service.set_auth_cookie(response, user_id)
     return user_scheme.AuthenticatedUser.model_validate(user_model)
 
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
-async def logout(response: Response) -> None:
+async def logout(request: Request, response: Response) -> None:
     """User logout"""
 
+    await user_service.revoke_auth_cookies(request)
     user_service.delete_auth_cookie(response)
@@ -1,10 +1,16 @@
 from typing import List, Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Body, status
+from fastapi import APIRouter, Depends, Body, Query, status
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.config import CHAT_PAGE_SIZE, CHAT_PAGE_MAX
+from src.redis_pool import get_redis
 from src.schemes import chat as chat_scheme
 from src.services import chat as chat_service
+from src.services.receipt import read_receipts, read_unread_counts
+from src.services.session import request_session
 from src.services.user import authenticated_user
 
 router = APIRouter(
@@ -16,21 +22,50 @@ router = APIRouter(
 
 @router.get("")
 async def read_chats(
-    user_id: UUID = Depends(authenticated_user)
-) -> List[chat_scheme.ChatScheme]:
-    """Read user chats"""
-
-    chats = await chat_service.read_chats(user_id)
-    return [chat_scheme.ChatScheme.model_validate(chat) for chat in chats]
+    before: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=CHAT_PAGE_MAX)] = CHAT_PAGE_SIZE,
+    user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
+) -> chat_scheme.ChatPageScheme:
+    """Read page of user chats with previews"""
+
+    rows, next_cursor = await chat_service.read_chats(
+        user_id, before, limit, session
+    )
+    return chat_scheme.ChatPageScheme(
+        items=[
+            chat_scheme.ChatPreviewScheme(
+                **chat_scheme.ChatScheme.model_validate(chat).model_dump(),
+                last_message=last_message,
+                unread_count=unread_count,
+                participants=participants,
+            )
+            for chat, last_message, unread_count, participants in rows
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/unread")
+async def read_unread(
+    user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
+) -> chat_scheme.UnreadScheme:
+    """Read unread counters of user chats"""
+
+    chats = await read_unread_counts(user_id, session)
+    return chat_scheme.UnreadScheme(total=sum(chats.values()), chats=chats)
 
 
 @router.get("/{chat_id}")
 async def read_chat(
-    chat_id: UUID, user_id: UUID = Depends(authenticated_user)
+    chat_id: UUID,
+    user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ) -> chat_scheme.ChatScheme:
     """Read user chat"""
 
-    chat = await chat_service.read_chat(user_id, chat_id)
+    chat = await chat_service.read_chat(user_id, chat_id, session)
     return chat_scheme.ChatScheme.model_validate(chat)
 
 
@@ -38,26 +73,47 @@ async def read_chat(
 async def create_chat(
     participants: Annotated[List[UUID], Body()],
     chat: chat_scheme.ChatInputScheme,
-    user_id: UUID = Depends(authenticated_user)
+    user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
+    redis: Redis = Depends(get_redis),
 ) -> chat_scheme.ChatScheme:
     """Create new chat"""
 
-    chat = await chat_service.create_chat(user_id, participants, chat)
+    chat = await chat_service.create_chat(
+        user_id, participants, chat, redis, session
+    )
     return chat_scheme.ChatScheme.model_validate(chat)
 
 
+@router.post("/{chat_id}/read", status_code=status.HTTP_202_ACCEPTED)
+async def advance_read(
+    chat_id: UUID,
+    receipt: chat_scheme.ReadReceiptScheme,
+    user_id: UUID = Depends(authenticated_user),
+) -> None:
+    """Mark chat read up to given time, applied in background"""
+
+    await read_receipts.advance(user_id, chat_id, receipt.last_read_at)
+
+
 @router.put("/{chat_id}")
 async def update_chat(
-    chat_id: UUID, chat: chat_scheme.ChatInputScheme
+    chat_id: UUID,
+    chat: chat_scheme.ChatInputScheme,
+    session: AsyncSession = Depends(request_session),
 ) -> chat_scheme.ChatScheme:
     """Create new chat"""
 
-    chat = await chat_service.update_chat(chat_id, chat)
+    chat = await chat_service.update_chat(chat_id, chat, session)
     return chat_scheme.ChatScheme.model_validate(chat)
 
 
 @router.delete("/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_chat(chat_id: UUID) -> None:
+async def delete_chat(
+    chat_id: UUID,
+    session: AsyncSession = Depends(request_session),
+    redis: Redis = Depends(get_redis),
+) -> None:
     """Delete user chat"""
 
-    await chat_service.delete_chat(chat_id)
+    await chat_service.delete_chat(chat_id, redis, session)
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, Response, status
+from redis.asyncio import Redis
+
+from src.config import engine, replica_engines
+from src.redis_pool import get_redis, redis_pool
+from src.services.health import check_readiness
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live")
+async def read_liveness() -> dict:
+    """Whether the process responds, without touching dependencies"""
+
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def read_readiness(
+    response: Response, redis: Redis = Depends(get_redis)
+) -> dict:
+    """Whether this worker can serve requests, with pools usage"""
+
+    checks = await check_readiness(redis)
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    return {
+        "status": "ready" if ready else "unavailable",
+        "checks": checks,
+        "pools": {
+            "database": engine.pool.stats(),
+            "replicas": [replica.pool.stats() for replica in replica_engines],
+            "redis": redis_pool.stats(),
+        },
+    }
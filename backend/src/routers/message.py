@@ -1,11 +1,24 @@
-from typing import List
+from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, status
-
+from fastapi import APIRouter, Depends, Query, status
+from redis.asyncio import Redis
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import (
+    MESSAGE_RATE_LIMIT,
+    MESSAGE_PAGE_SIZE,
+    MESSAGE_PAGE_MAX,
+    SEARCH_PAGE_SIZE,
+    SEARCH_PAGE_MAX,
+)
+from src.redis_pool import get_redis
 from src.schemes import message as message_scheme
 from src.services import message as message_service
 from src.services.chat import check_chat_permission
+from src.services.rate_limit import rate_limit
+from src.services.session import request_session
 from src.services.user import authenticated_user
 from src.routers.chat import router as chat_router
 
@@ -14,36 +27,163 @@ router = APIRouter(
     tags=["message"],
     dependencies=[Depends(check_chat_permission)],
 )
+# Endpoints spanning all user chats, membership is checked by services
+messages_router = APIRouter(prefix="/message", tags=["message"])
+
+SearchText = Annotated[str, Query(min_length=1, max_length=256)]
+SearchLimit = Annotated[int, Query(ge=1, le=SEARCH_PAGE_MAX)]
+
+
+def search_page(
+    rows: list[Row], next_cursor: str | None
+) -> message_scheme.MessageSearchPageScheme:
+    """Build page of search hits from service rows"""
+
+    return message_scheme.MessageSearchPageScheme(
+        items=[
+            message_scheme.MessageSearchHitScheme(
+                **message_scheme.MessageScheme.model_validate(
+                    message
+                ).model_dump(),
+                chat=message.chat,
+                rank=rank,
+                headline=headline,
+            )
+            for message, rank, headline in rows
+        ],
+        next_cursor=next_cursor,
+    )
 
 
 @router.get("")
-async def read_messages(chat_id: UUID) -> List[message_scheme.MessageScheme]:
-    """Read user chat messages"""
+async def read_messages(
+    chat_id: UUID,
+    before: str | None = None,
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MESSAGE_PAGE_MAX)] = MESSAGE_PAGE_SIZE,
+    session: AsyncSession = Depends(request_session),
+) -> message_scheme.MessagePageScheme:
+    """Read page of user chat messages"""
+
+    messages, next_cursor = await message_service.read_messages(
+        chat_id, before, after, limit, session
+    )
+    return message_scheme.MessagePageScheme(
+        items=[
+            message_scheme.MessageScheme.model_validate(message)
+            for message in messages
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/search")
+async def search_chat_messages(
+    chat_id: UUID,
+    q: SearchText,
+    before: str | None = None,
+    limit: SearchLimit = SEARCH_PAGE_SIZE,
+    user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
+) -> message_scheme.MessageSearchPageScheme:
+    """Search messages of user chat"""
+
+    rows, next_cursor = await message_service.search_messages(
+        user_id, q, chat_id, before, limit, session
+    )
+    return search_page(rows, next_cursor)
 
-    messages = await message_service.read_messages(chat_id)
-    return [
-        message_scheme.MessageScheme.model_validate(message)
-        for message in messages
-    ]
+
+@messages_router.get("/search")
+async def search_messages(
+    q: SearchText,
+    before: str | None = None,
+    limit: SearchLimit = SEARCH_PAGE_SIZE,
+    user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
+) -> message_scheme.MessageSearchPageScheme:
+    """Search messages of all user chats"""
+
+    rows, next_cursor = await message_service.search_messages(
+        user_id, q, None, before, limit, session
+    )
+    return search_page(rows, next_cursor)
+
+
+def batch_size(batch: message_scheme.MessageBatchScheme) -> int:
+    """Messages of batch, each counted by the message rate limit"""
+
+    return len(batch.items)
+
+
+@messages_router.post(
+    "/batch",
+    dependencies=[
+        Depends(
+            rate_limit(
+                "message",
+                MESSAGE_RATE_LIMIT,
+                key=authenticated_user,
+                cost=batch_size,
+            )
+        )
+    ],
+)
+async def create_messages(
+    batch: message_scheme.MessageBatchScheme,
+    user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
+    redis: Redis = Depends(get_redis),
+) -> message_scheme.MessageBatchResultsScheme:
+    """Create batch of messages in one transaction"""
+
+    results = await message_service.create_messages(
+        user_id, batch.items, redis, session
+    )
+    return message_scheme.MessageBatchResultsScheme(
+        items=[
+            message_scheme.MessageBatchResultScheme(
+                status=result_status,
+                message=(
+                    message_scheme.MessageScheme.model_validate(message)
+                    if message is not None
+                    else None
+                ),
+            )
+            for result_status, message in results
+        ]
+    )
 
 
 @router.get("/{message_id}")
-async def read_message(message_id: UUID) -> message_scheme.MessageScheme:
+async def read_message(
+    message_id: UUID, session: AsyncSession = Depends(request_session)
+) -> message_scheme.MessageScheme:
     """Read user chat message"""
 
-    message = await message_service.read_message(message_id)
+    message = await message_service.read_message(message_id, session)
     return message_scheme.MessageScheme.model_validate(message)
 
 
-@router.post("")
+@router.post(
+    "",
+    dependencies=[
+        Depends(
+            rate_limit("message", MESSAGE_RATE_LIMIT, key=authenticated_user)
+        )
+    ],
+)
 async def create_message(
     chat_id: UUID,
     message: message_scheme.MessageInputScheme,
     user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ) -> message_scheme.MessageScheme:
     """Create new message"""
 
-    message = await message_service.create_message(user_id, chat_id, message)
+    message = await message_service.create_message(
+        user_id, chat_id, message, session
+    )
     return message_scheme.MessageScheme.model_validate(message)
 
 
@@ -52,10 +192,13 @@ async def update_chat(
     message_id: UUID,
     message: message_scheme.MessageInputScheme,
     user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ) -> message_scheme.MessageScheme:
     """Create new chat"""
 
-    chat = await message_service.update_message(user_id, message_id, message)
+    chat = await message_service.update_message(
+        user_id, message_id, message, session
+    )
     return message_scheme.MessageScheme.model_validate(chat)
 
 
@@ -63,7 +206,8 @@ async def update_chat(
 async def delete_message(
     message_id: UUID,
     user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ) -> None:
     """Delete user chat"""
 
-    await message_service.delete_message(user_id, message_id)
+    await message_service.delete_message(user_id, message_id, session)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from src.config import engine, replica_engines
+from src.metrics import render_metrics
+from src.redis_pool import redis_pool
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("")
+async def read_metrics() -> Response:
+    """Prometheus metrics"""
+
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/pools")
+async def read_pools() -> dict:
+    """Connection pools usage"""
+
+    return {
+        "database": engine.pool.stats(),
+        "replicas": [replica.pool.stats() for replica in replica_engines],
+        "redis": redis_pool.stats(),
+    }
@@ -0,0 +1,82 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import status
+
+from src.config import TOKEN_KEY
+from src.services import chat as chat_service
+from src.services.stream import broker, Subscription
+from src.services.user import decode_token
+
+router = APIRouter(prefix="/stream", tags=["stream"])
+
+
+async def _send_events(
+    websocket: WebSocket, subscription: Subscription
+) -> None:
+    """Forward queued chat events to client"""
+
+    try:
+        while True:
+            data = await subscription.queue.get()
+            if subscription.overflowed:
+                await websocket.close(
+                    code=status.WS_1013_TRY_AGAIN_LATER,
+                    reason="Too many pending events",
+                )
+                return
+            await websocket.send_text(data)
+    except (WebSocketDisconnect, RuntimeError):
+        return
+
+
+async def _follow_chats(subscription: Subscription) -> None:
+    """Resubscribe whenever the user joins or leaves chats"""
+
+    while True:
+        await subscription.changed.wait()
+        # Cleared before reading, so changes meanwhile trigger a new read
+        subscription.changed.clear()
+        chat_ids = await chat_service.read_chat_ids(subscription.user_id)
+        await broker.update(subscription, chat_ids)
+
+
+async def _receive_until_closed(websocket: WebSocket) -> None:
+    """Drain client frames until it disconnects"""
+
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        return
+
+
+@router.websocket("")
+async def stream(websocket: WebSocket) -> None:
+    """Push message events of all user chats"""
+
+    try:
+        user_id = await decode_token(websocket.cookies.get(TOKEN_KEY, ""))
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Chats are read once membership changes are listened to, so none
+    # made in between is missed
+    subscription = await broker.subscribe(user_id)
+    try:
+        chat_ids = await chat_service.read_chat_ids(user_id)
+        await broker.update(subscription, chat_ids)
+        await websocket.accept()
+        tasks = [
+            asyncio.create_task(_send_events(websocket, subscription)),
+            asyncio.create_task(_receive_until_closed(websocket)),
+            asyncio.create_task(_follow_chats(subscription)),
+        ]
+        _, pending = await asyncio.wait(
+            tasks, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+    finally:
+        await broker.unsubscribe(subscription)
@@ -1,11 +1,30 @@
-from typing import List, Annotated
+from typing import Annotated, Literal
 from uuid import UUID
 
-from fastapi import APIRouter, Response, Depends, Body, status
-
-from src.config import api_key_cookie
+from fastapi import (
+    APIRouter,
+    Request,
+    Response,
+    Depends,
+    Body,
+    Query,
+    status,
+)
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import (
+    api_key_cookie,
+    FORGOT_PASSWORD_RATE_LIMIT,
+    LOGIN_IP_RATE_LIMIT,
+    USER_SEARCH_PAGE_SIZE,
+    USER_SEARCH_PAGE_MAX,
+)
+from src.redis_pool import get_redis
 from src.schemes import user as user_scheme
 from src.services import user as user_service
+from src.services.rate_limit import rate_limit, body_email
+from src.services.session import request_session
 
 router = APIRouter(prefix="/user", tags=["user"])
 
@@ -13,45 +32,64 @@ router = APIRouter(prefix="/user", tags=["user"])
 @router.get("/me")
 async def me(
     user_id: UUID = Depends(user_service.authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ) -> user_scheme.AuthenticatedUser:
     """Read current user"""
 
-    user_instance = await user_service.get_user(user_id)
+    user_instance = await user_service.get_user(user_id, session)
     return user_scheme.AuthenticatedUser.model_validate(user_instance)
 
 
 @router.get("")
 async def read_users(
+    q: Annotated[str, Query(min_length=1, max_length=128)],
+    mode: Literal["prefix", "substring"] = "prefix",
+    after: str | None = None,
+    limit: Annotated[
+        int, Query(ge=1, le=USER_SEARCH_PAGE_MAX)
+    ] = USER_SEARCH_PAGE_SIZE,
     _: UUID = Depends(user_service.authenticated_user),
-    email_contains: str = "",
-) -> List[user_scheme.UserScheme]:
-    """Get list of users whose emails contain the given substring"""
-
-    users = await user_service.search_users(email_contains)
-    return [
-        user_scheme.UserScheme.model_validate(user_instance)
-        for user_instance in users
-    ]
+    session: AsyncSession = Depends(request_session),
+) -> user_scheme.UserPageScheme:
+    """Search users by email, first or last name"""
+
+    users, next_cursor = await user_service.search_users(
+        q, mode, after, limit, session
+    )
+    return user_scheme.UserPageScheme(
+        items=[
+            user_scheme.UserScheme.model_validate(user_instance)
+            for user_instance in users
+        ],
+        next_cursor=next_cursor,
+    )
 
 
 @router.put("")
 async def update_user(
     user_data: user_scheme.UserUpdateScheme,
     user_id: UUID = Depends(user_service.authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ) -> user_scheme.AuthenticatedUser:
     """Update user information"""
 
-    user_instance = await user_service.update_user(user_id, user_data)
+    user_instance = await user_service.update_user(
+        user_id, user_data, session
+    )
     return user_scheme.AuthenticatedUser.model_validate(user_instance)
 
 
 @router.delete("", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
-    response: Response, user_id: UUID = Depends(user_service.authenticated_user)
+    request: Request,
+    response: Response,
+    user_id: UUID = Depends(user_service.authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ) -> None:
     """Delete user"""
 
-    await user_service.delete_user(user_id)
+    await user_service.delete_user(user_id, session)
+    await user_service.revoke_auth_cookies(request)
     user_service.delete_auth_cookie(response)
 
 
@@ -60,17 +98,31 @@ async def reset_password(
     old: Annotated[str, Body()],
     new: Annotated[str, Body()],
     user_id: UUID = Depends(user_service.authenticated_user),
+    session: AsyncSession = Depends(request_session),
 ) -> None:
     """Reset user password"""
 
-    await user_service.reset_password(user_id, old, new)
-
-
-@router.post("/forgot-password", status_code=status.HTTP_204_NO_CONTENT)
+    await user_service.reset_password(user_id, old, new, session)
+
+
+@router.post(
+    "/forgot-password",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[
+        Depends(rate_limit("forgot_password_ip", LOGIN_IP_RATE_LIMIT)),
+        Depends(
+            rate_limit(
+                "forgot_password", FORGOT_PASSWORD_RATE_LIMIT, key=body_email
+            )
+        ),
+    ],
+)
 async def forgot_password(
     email: Annotated[str, Body()],
     redirect_url: Annotated[str, Body(alias="redirectUrl")],
+    session: AsyncSession = Depends(request_session),
+    redis: Redis = Depends(get_redis),
 ) -> None:
     """Send mail to user for new password"""
 
-    await user_service.forgot_password(email, redirect_url)
+    await user_service.forgot_password(email, redirect_url, redis, session)
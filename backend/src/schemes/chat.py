@@ -1,6 +1,8 @@
 from uuid import UUID
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import AwareDatetime, BaseModel, Field
+from src.schemes.message import MessageScheme
+from src.schemes.user import UserScheme
 from src.utils import to_camel
 
 
@@ -11,7 +13,9 @@ class ChatScheme(BaseModel):
     name: str
     is_muted: bool
     is_archived: bool
+    retention_days: int | None = None
 
+    last_activity_at: datetime
     created_at: datetime
     updated_at: datetime
 
@@ -21,12 +25,54 @@ class ChatScheme(BaseModel):
         from_attributes = True
 
 
+class ChatPreviewScheme(ChatScheme):
+    """Chat with everything needed to render chat list"""
+
+    last_message: MessageScheme | None = None
+    unread_count: int
+    participants: list[UserScheme]
+
+
+class ChatPageScheme(BaseModel):
+    """Page of user chats, most recently active first"""
+
+    items: list[ChatPreviewScheme]
+    next_cursor: str | None = None
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
+class ReadReceiptScheme(BaseModel):
+    """Newest message time the user has seen in chat"""
+
+    last_read_at: AwareDatetime
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
+class UnreadScheme(BaseModel):
+    """Unread counters of user chats"""
+
+    total: int
+    chats: dict[UUID, int]
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
 class ChatInputScheme(BaseModel):
     """Base model for create or update chat"""
 
     name: str
     is_muted: bool = False
     is_archived: bool = False
+    # Days to keep messages for, forever if not set
+    retention_days: int | None = Field(default=None, ge=1)
 
     class Config:
         alias_generator = to_camel
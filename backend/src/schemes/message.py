@@ -1,6 +1,8 @@
+from typing import Literal
 from uuid import UUID
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from src.config import MESSAGE_BATCH_MAX
 from src.utils import to_camel
 
 
@@ -9,6 +11,7 @@ class MessageScheme(BaseModel):
 
     id: UUID
     text: str
+    user: UUID | None = None
 
     created_at: datetime
     updated_at: datetime
@@ -27,3 +30,86 @@ class MessageInputScheme(BaseModel):
     class Config:
         alias_generator = to_camel
         populate_by_name = True
+
+
+class MessageBatchItemScheme(MessageInputScheme):
+    """Message of batch, retried sends repeat its idempotency key"""
+
+    chat_id: UUID
+    idempotency_key: str | None = Field(default=None, max_length=128)
+
+
+class MessageBatchScheme(BaseModel):
+    """Batch of messages, possibly for several chats"""
+
+    items: list[MessageBatchItemScheme] = Field(
+        min_length=1, max_length=MESSAGE_BATCH_MAX
+    )
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
+class MessageBatchResultScheme(BaseModel):
+    """Outcome of one batch item"""
+
+    status: Literal["created", "duplicate", "forbidden"]
+    message: MessageScheme | None = None
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
+class MessageBatchResultsScheme(BaseModel):
+    """Outcomes of batch items, in request order"""
+
+    items: list[MessageBatchResultScheme]
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
+class MessagePageScheme(BaseModel):
+    """Page of chat messages, newest first"""
+
+    items: list[MessageScheme]
+    next_cursor: str | None = None
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
+class MessageSearchHitScheme(MessageScheme):
+    """Message matching search query"""
+
+    chat: UUID
+    rank: float
+    headline: str  # raw text fragments, matches wrapped in <mark>
+
+
+class MessageSearchPageScheme(BaseModel):
+    """Page of search results, best match first"""
+
+    items: list[MessageSearchHitScheme]
+    next_cursor: str | None = None
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
+class MessageEventScheme(BaseModel):
+    """Realtime event about chat message"""
+
+    type: Literal["created", "updated", "deleted"]
+    chat_id: UUID
+    message_id: UUID
+    message: MessageScheme | None = None
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
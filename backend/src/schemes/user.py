@@ -49,6 +49,17 @@ class UserScheme(BaseModel):
         from_attributes = True
 
 
+class UserPageScheme(BaseModel):
+    """Page of users, ordered by email"""
+
+    items: list[UserScheme]
+    next_cursor: str | None = None
+
+    class Config:
+        alias_generator = to_camel
+        populate_by_name = True
+
+
 class UserUpdateScheme(BaseModel):
     """Model for user update"""
 
@@ -1,22 +1,95 @@
-from typing import Sequence, List
+from typing import List
 from uuid import UUID
 
-from sqlalchemy import select, insert, update, delete, exists
+from sqlalchemy import Row, select, insert, update, delete, func, tuple_, true
+from sqlalchemy.orm import aliased
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status, Request, Depends
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.services.history import history_cache
+from src.services.receipt import unread_count
+from src.services.session import (
+    primary_session,
+    request_session,
+    use_session,
+)
+from src.services.stream import broker
 from src.services.user import authenticated_user
 from src.schemes.chat import ChatInputScheme
-from src.models import ChatModel, UserChatModel
-from src.config import db_session
+from src.models import ChatModel, UserChatModel, MessageModel, UserModel
+from src.config import (
+    CHAT_MEMBERSHIP_TTL,
+    CHAT_PAGE_SIZE,
+)
+from src.logger import logger
+from src.redis_pool import get_redis
+from src.utils import encode_cursor, decode_cursor
+
+# Keeps cached membership set alive for users without chats
+MEMBERSHIP_SENTINEL = "-"
+
+# KEYS: memberships, version; ARGV: version, ttl, then chat ids. Stores
+# memberships read from the database unless they changed since, as told
+# by the version bumped on every invalidation.
+FILL_SCRIPT = """
+if (redis.call("GET", KEYS[2]) or "0") ~= ARGV[1] then
+    return 0
+end
+redis.call("DEL", KEYS[1])
+redis.call("SADD", KEYS[1], unpack(ARGV, 3))
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+return 1
+"""
+
+
+
+def membership_key(user_id: UUID) -> str:
+    """Redis set of chat ids the user participates in"""
+
+    return f"user_chats:{user_id}"
+
+
+def membership_version_key(user_id: UUID) -> str:
+    """Redis counter of membership changes of the user"""
+
+    return f"user_chats:{user_id}:version"
+
+
+async def invalidate_membership(
+    user_ids: List[UUID], redis: Redis
+) -> None:
+    """Drop cached chat memberships of given users"""
+
+    if not user_ids:
+        return
+
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            for uid in user_ids:
+                # Fills started before the change are refused
+                pipe.incr(membership_version_key(uid))
+                pipe.expire(membership_version_key(uid), CHAT_MEMBERSHIP_TTL)
+                pipe.delete(membership_key(uid))
+            await pipe.execute()
+    except RedisError as exc:
+        logger.warning("Membership invalidation failed", error=str(exc))
+    # Open streams of the users follow the change
+    await broker.membership_changed(user_ids)
 
 
 async def create_chat(
-    user_id: UUID, participants: List[UUID], chat: ChatInputScheme
+    user_id: UUID,
+    participants: List[UUID],
+    chat: ChatInputScheme,
+    redis: Redis,
+    session: AsyncSession | None = None,
 ) -> ChatModel:
     """Create new chat and link both users"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         try:
             stmt_chat = (
                 insert(ChatModel)
@@ -26,7 +99,8 @@ async def create_chat(
             result_chat = await session.execute(stmt_chat)
             chat_instance: ChatModel = result_chat.scalar_one()
 
-            participants = [user_id, *participants]
+            # Memberships are unique, repeated ids would fail the insert
+            participants = list(dict.fromkeys([user_id, *participants]))
             user_chat_values = [
                 {"user": uid, "chat": chat_instance.id} for uid in participants
             ]
@@ -35,6 +109,7 @@ async def create_chat(
             await session.execute(stmt_user_chat)
 
             await session.commit()
+            await invalidate_membership(participants, redis)
             return chat_instance
 
         except IntegrityError as exc:
@@ -45,10 +120,14 @@ async def create_chat(
             ) from exc
 
 
-async def update_chat(chat_id: UUID, chat: ChatInputScheme) -> ChatModel:
+async def update_chat(
+    chat_id: UUID,
+    chat: ChatInputScheme,
+    session: AsyncSession | None = None,
+) -> ChatModel:
     """Update chat details"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             update(ChatModel)
             .where(ChatModel.id == chat_id)
@@ -60,19 +139,31 @@ async def update_chat(chat_id: UUID, chat: ChatInputScheme) -> ChatModel:
         return result.scalar_one()
 
 
-async def delete_chat(chat_id: UUID) -> None:
+async def delete_chat(
+    chat_id: UUID, redis: Redis, session: AsyncSession | None = None
+) -> None:
     """Delete chat (and cascade deletes user relations)"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
+        members = await session.scalars(
+            select(UserChatModel.user).where(UserChatModel.chat == chat_id)
+        )
+        user_ids = list(members.all())
+
         stmt = delete(ChatModel).where(ChatModel.id == chat_id)
         await session.execute(stmt)
         await session.commit()
 
+    await invalidate_membership(user_ids, redis)
+    await history_cache.invalidate([chat_id])
 
-async def read_chat(user_id: UUID, chat_id: UUID) -> ChatModel:
+
+async def read_chat(
+    user_id: UUID, chat_id: UUID, session: AsyncSession | None = None
+) -> ChatModel:
     """Get specific chat if user participates in it"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             select(ChatModel)
             .join(UserChatModel, ChatModel.id == UserChatModel.chat)
@@ -82,35 +173,155 @@ async def read_chat(user_id: UUID, chat_id: UUID) -> ChatModel:
         return await session.scalar(stmt)
 
 
-async def read_chats(user_id: UUID) -> Sequence[ChatModel]:
-    """Get all chats for given user"""
+async def read_chats(
+    user_id: UUID,
+    before: str | None = None,
+    limit: int = CHAT_PAGE_SIZE,
+    session: AsyncSession | None = None,
+) -> tuple[List[Row], str | None]:
+    """Get page of user chats with last message, unread count and members
 
-    async with db_session() as session:
-        stmt = (
-            select(ChatModel)
-            .join(UserChatModel, ChatModel.id == UserChatModel.chat)
-            .where(UserChatModel.user == user_id)
+    Everything comes from one query: chats are ordered by denormalized
+    last_activity_at, last message is a primary key lookup and unread
+    count is the chat message count less the member read count.
+    """
+
+    last_message = aliased(MessageModel)
+    member = aliased(UserChatModel)
+
+    participants = (
+        select(
+            func.json_agg(
+                func.json_build_object(
+                    "id", UserModel.id,
+                    "first_name", UserModel.first_name,
+                    "last_name", UserModel.last_name,
+                    "email", UserModel.email,
+                )
+            ).label("participants")
+        )
+        .select_from(member)
+        .join(UserModel, UserModel.id == member.user)
+        .where(member.chat == ChatModel.id)
+        .lateral("participants")
+    )
+
+    stmt = (
+        select(
+            ChatModel,
+            last_message,
+            unread_count(),
+            participants.c.participants,
+        )
+        .join(UserChatModel, UserChatModel.chat == ChatModel.id)
+        .outerjoin(
+            last_message,
+            (last_message.id == ChatModel.last_message_id)
+            & (last_message.created_at == ChatModel.last_message_at),
+        )
+        .join(participants, true())
+        .where(UserChatModel.user == user_id)
+        .order_by(ChatModel.last_activity_at.desc(), ChatModel.id.desc())
+        .limit(limit + 1)
+    )
+    if before is not None:
+        stmt = stmt.where(
+            tuple_(ChatModel.last_activity_at, ChatModel.id)
+            < tuple_(*decode_cursor(before))
         )
+
+    async with use_session(session) as session:
+        result = await session.execute(stmt)
+        rows = list(result.all())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        edge = rows[-1][0]
+        next_cursor = encode_cursor(edge.last_activity_at, edge.id)
+
+    return rows, next_cursor
+
+
+async def read_chat_ids(
+    user_id: UUID, session: AsyncSession | None = None
+) -> set[UUID]:
+    """Get ids of all chats user participates in"""
+
+    async with use_session(session) as session:
+        stmt = select(UserChatModel.chat).where(UserChatModel.user == user_id)
         result = await session.scalars(stmt)
-        return result.all()
+        return set(result.all())
 
 
-async def user_in_chat(user_id: UUID, chat_id: UUID) -> bool:
-    """Check if user participates in chat"""
+async def allowed_chats(
+    user_id: UUID,
+    chat_ids: set[UUID],
+    redis: Redis,
+    session: AsyncSession | None = None,
+) -> set[UUID]:
+    """Get those of given chats the user participates in
 
-    async with db_session() as session:
-        stmt = select(
-            exists().where(
-                UserChatModel.user == user_id, UserChatModel.chat == chat_id
-            )
+    Memberships are cached in Redis as a set per user, so the check is one
+    Redis round trip unless the set expired or was invalidated. The set
+    is filled only if no invalidation happened since the miss, otherwise
+    memberships read before a change could be cached after it.
+    """
+
+    key = membership_key(user_id)
+    version_key = membership_version_key(user_id)
+    ordered = list(chat_ids)
+    version = None
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.exists(key)
+            pipe.smismember(key, [str(chat_id) for chat_id in ordered])
+            pipe.get(version_key)
+            cached, is_member, version = await pipe.execute()
+        version = version or "0"
+        if cached:
+            return {c for c, member in zip(ordered, is_member) if member}
+    except RedisError as exc:
+        logger.warning("Membership cache read failed", error=str(exc))
+
+    if version is None:
+        return chat_ids & await read_chat_ids(user_id, session)
+
+    async with primary_session(session) as primary:
+        user_chat_ids = await read_chat_ids(user_id, primary)
+
+    try:
+        await redis.register_script(FILL_SCRIPT)(
+            keys=[key, version_key],
+            args=[
+                version,
+                CHAT_MEMBERSHIP_TTL,
+                MEMBERSHIP_SENTINEL,
+                *(str(c) for c in user_chat_ids),
+            ],
         )
-        result = await session.scalar(stmt)
-        return bool(result)
+    except RedisError as exc:
+        logger.warning("Membership cache write failed", error=str(exc))
+
+    return chat_ids & user_chat_ids
+
+
+async def user_in_chat(
+    user_id: UUID,
+    chat_id: UUID,
+    redis: Redis,
+    session: AsyncSession | None = None,
+) -> bool:
+    """Check if user participates in chat"""
+
+    return chat_id in await allowed_chats(user_id, {chat_id}, redis, session)
 
 
 async def check_chat_permission(
     request: Request,
-    user_id: UUID = Depends(authenticated_user)
+    user_id: UUID = Depends(authenticated_user),
+    session: AsyncSession = Depends(request_session),
+    redis: Redis = Depends(get_redis),
 ) -> None:
     """Check user chat permission"""
 
@@ -119,7 +330,7 @@ async def check_chat_permission(
         return
 
     chat_id = UUID(chat_id)
-    has_access = await user_in_chat(user_id, chat_id)
+    has_access = await user_in_chat(user_id, chat_id, redis, session)
     if not has_access:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
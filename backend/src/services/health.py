@@ -0,0 +1,60 @@
+import asyncio
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.config import engine, READINESS_TIMEOUT
+from src.migrate import schema_head, schema_revision
+
+
+class WorkerState:
+    """Whether this worker finished startup and is not shutting down"""
+
+    def __init__(self) -> None:
+        self.started = False
+        self.stopping = False
+
+    @property
+    def serving(self) -> bool:
+        return self.started and not self.stopping
+
+
+worker_state = WorkerState()
+
+
+async def check_database() -> tuple[bool, bool]:
+    """Whether PostgreSQL answers and its schema is at expected revision"""
+
+    try:
+        async with asyncio.timeout(READINESS_TIMEOUT):
+            async with engine.connect() as conn:
+                revision = await schema_revision(conn)
+    except (SQLAlchemyError, OSError, TimeoutError):
+        return False, False
+    return True, revision == schema_head()
+
+
+async def check_redis(redis: Redis) -> bool:
+    """Whether Redis answers"""
+
+    try:
+        async with asyncio.timeout(READINESS_TIMEOUT):
+            await redis.ping()
+    except (RedisError, OSError, TimeoutError):
+        return False
+    return True
+
+
+async def check_readiness(redis: Redis) -> dict[str, bool]:
+    """Checks deciding whether this worker should receive traffic"""
+
+    (database, schema), redis_up = await asyncio.gather(
+        check_database(), check_redis(redis)
+    )
+    return {
+        "started": worker_state.serving,
+        "database": database,
+        "schema": schema,
+        "redis": redis_up,
+    }
@@ -0,0 +1,286 @@
+from datetime import datetime
+from uuid import UUID
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.config import MESSAGE_CACHE_SIZE, MESSAGE_CACHE_TTL
+from src.logger import logger
+from src.metrics import MESSAGE_CACHE_REQUESTS
+from src.models import MessageModel
+from src.redis_pool import redis_client
+from src.schemes.message import MessageScheme
+from src.utils import to_micros
+
+# KEYS: meta, window, data, version; ARGV: limit, cursor micros, cursor
+# id, ttl. Window is a sorted set of message ids scored by creation time,
+# so ties are broken by id like in ix_message_chat_created_at_id. A miss
+# returns the version to fill the window with.
+READ_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return {-1, redis.call("GET", KEYS[4]) or "0"}
+end
+local complete = redis.call("HGET", KEYS[1], "complete") == "1"
+local limit = tonumber(ARGV[1])
+local score = tonumber(ARGV[2])
+local entries = redis.call("ZREVRANGE", KEYS[2], 0, -1, "WITHSCORES")
+local ids = {}
+for i = 1, #entries, 2 do
+    local id, at = entries[i], tonumber(entries[i + 1])
+    if not score or at < score or (at == score and id < ARGV[3]) then
+        if #ids == limit then
+            for i = 1, 3 do
+                redis.call("EXPIRE", KEYS[i], ARGV[4])
+            end
+            return {1, redis.call("HMGET", KEYS[3], unpack(ids))}
+        end
+        ids[#ids + 1] = id
+    end
+end
+-- Page runs past the window, only whole history can answer it
+if not complete then
+    return {-1, redis.call("GET", KEYS[4]) or "0"}
+end
+if #ids == 0 then
+    return {0, {}}
+end
+return {0, redis.call("HMGET", KEYS[3], unpack(ids))}
+"""
+
+# KEYS: meta, window, data, version; ARGV: version, ttl, complete,
+# then (micros, id, json) of each message
+FILL_SCRIPT = """
+if (redis.call("GET", KEYS[4]) or "0") ~= ARGV[1] then
+    return 0
+end
+redis.call("DEL", KEYS[1], KEYS[2], KEYS[3])
+redis.call("HSET", KEYS[1], "complete", ARGV[3])
+for i = 4, #ARGV, 3 do
+    redis.call("ZADD", KEYS[2], ARGV[i], ARGV[i + 1])
+    redis.call("HSET", KEYS[3], ARGV[i + 1], ARGV[i + 2])
+end
+for i = 1, 3 do
+    redis.call("EXPIRE", KEYS[i], ARGV[2])
+end
+return 1
+"""
+
+# KEYS: meta, window, data, version; ARGV: size, ttl,
+# then (micros, id, json) of each new message
+APPEND_SCRIPT = """
+redis.call("INCR", KEYS[4])
+redis.call("EXPIRE", KEYS[4], ARGV[2])
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+local complete = redis.call("HGET", KEYS[1], "complete") == "1"
+for i = 3, #ARGV, 3 do
+    local oldest = redis.call("ZRANGE", KEYS[2], 0, 0, "WITHSCORES")
+    local at = tonumber(ARGV[i])
+    -- Late commit older than the window would leave a gap before it
+    if complete or #oldest == 0 or at > tonumber(oldest[2])
+        or (at == tonumber(oldest[2]) and ARGV[i + 1] > oldest[1]) then
+        redis.call("ZADD", KEYS[2], ARGV[i], ARGV[i + 1])
+        redis.call("HSET", KEYS[3], ARGV[i + 1], ARGV[i + 2])
+    end
+end
+local size = tonumber(ARGV[1])
+local stale = redis.call("ZRANGE", KEYS[2], 0, -size - 1)
+if #stale > 0 then
+    redis.call("ZREM", KEYS[2], unpack(stale))
+    redis.call("HDEL", KEYS[3], unpack(stale))
+    redis.call("HSET", KEYS[1], "complete", "0")
+end
+return 1
+"""
+
+# KEYS: meta, window, data, version; ARGV: ttl, id, json or nothing
+CHANGE_SCRIPT = """
+redis.call("INCR", KEYS[4])
+redis.call("EXPIRE", KEYS[4], ARGV[1])
+if redis.call("ZSCORE", KEYS[2], ARGV[2]) == false then
+    return 0
+end
+if ARGV[3] then
+    redis.call("HSET", KEYS[3], ARGV[2], ARGV[3])
+else
+    redis.call("ZREM", KEYS[2], ARGV[2])
+    redis.call("HDEL", KEYS[3], ARGV[2])
+end
+return 1
+"""
+
+
+def history_keys(chat_id: UUID) -> list[str]:
+    """Redis keys holding cached window of chat history"""
+
+    return [
+        f"history:{chat_id}:meta",
+        f"history:{chat_id}:window",
+        f"history:{chat_id}:data",
+        f"history:{chat_id}:version",
+    ]
+
+
+def cache_entry(message: MessageModel) -> list:
+    """Sorted set score, member and serialized message"""
+
+    return [
+        to_micros(message.created_at),
+        str(message.id),
+        MessageScheme.model_validate(message).model_dump_json(),
+    ]
+
+
+class HistoryCache:
+    """Write-through cache of the newest messages of each chat
+
+    Every chat keeps up to ``size`` newest messages in Redis, so opening
+    a chat does not touch PostgreSQL. The window always holds every
+    message newer than its oldest entry; pages reaching past it are read
+    from the database. Writers bump a per-chat version, so a window read
+    from the database before their commit is never stored.
+    """
+
+    def __init__(
+        self,
+        client: Redis,
+        size: int = MESSAGE_CACHE_SIZE,
+        ttl: int = MESSAGE_CACHE_TTL,
+    ) -> None:
+        self.client = client
+        self.size = size
+        self.ttl = ttl
+        self.read_script = client.register_script(READ_SCRIPT)
+        self.fill_script = client.register_script(FILL_SCRIPT)
+        self.append_script = client.register_script(APPEND_SCRIPT)
+        self.change_script = client.register_script(CHANGE_SCRIPT)
+
+    async def read(
+        self,
+        chat_id: UUID,
+        before: tuple[datetime, UUID] | None,
+        limit: int,
+    ) -> tuple[list[MessageScheme] | None, bool, str]:
+        """Get page older than ``before`` and whether more exist
+
+        On a miss no messages are returned, only the window version to
+        pass to ``fill`` once the page is read from the database.
+        """
+
+        if self.size == 0:
+            return None, False, ""
+        if before is not None and before[0].tzinfo is None:
+            return None, False, ""
+
+        cursor = ["", ""]
+        if before is not None:
+            cursor = [to_micros(before[0]), str(before[1])]
+
+        try:
+            found, entries = await self.read_script(
+                keys=history_keys(chat_id),
+                args=[limit, *cursor, self.ttl],
+            )
+        except RedisError as exc:
+            logger.warning("History cache read failed", error=str(exc))
+            found, entries = -1, ""
+
+        if found == -1 or None in entries:
+            MESSAGE_CACHE_REQUESTS.labels("miss").inc()
+            return None, False, entries if found == -1 else ""
+
+        MESSAGE_CACHE_REQUESTS.labels("hit").inc()
+        messages = [MessageScheme.model_validate_json(e) for e in entries]
+        return messages, bool(found), ""
+
+    async def fill(
+        self,
+        chat_id: UUID,
+        version: str,
+        messages: list[MessageModel],
+        complete: bool,
+    ) -> None:
+        """Store newest messages of chat unless it changed since"""
+
+        if self.size == 0 or not version:
+            return
+
+        args = [version, self.ttl, int(complete)]
+        for message in messages[:self.size]:
+            args.extend(cache_entry(message))
+
+        try:
+            await self.fill_script(keys=history_keys(chat_id), args=args)
+        except RedisError as exc:
+            logger.warning("History cache write failed", error=str(exc))
+
+    async def append(self, messages: list[MessageModel]) -> None:
+        """Add committed messages to windows of their chats"""
+
+        if self.size == 0 or not messages:
+            return
+
+        by_chat: dict[UUID, list] = {}
+        for message in messages:
+            by_chat.setdefault(message.chat, []).extend(cache_entry(message))
+
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for chat_id, entries in by_chat.items():
+                    await self.append_script(
+                        keys=history_keys(chat_id),
+                        args=[self.size, self.ttl, *entries],
+                        client=pipe,
+                    )
+                await pipe.execute()
+        except RedisError as exc:
+            logger.warning("History cache write failed", error=str(exc))
+            await self.invalidate(list(by_chat))
+
+    async def replace(self, message: MessageModel) -> None:
+        """Update edited message if it is cached"""
+
+        _, member, data = cache_entry(message)
+        await self._change(message.chat, [member, data])
+
+    async def remove(self, chat_id: UUID, message_id: UUID) -> None:
+        """Drop deleted message if it is cached"""
+
+        await self._change(chat_id, [str(message_id)])
+
+    async def _change(self, chat_id: UUID, args: list) -> None:
+        if self.size == 0:
+            return
+
+        try:
+            await self.change_script(
+                keys=history_keys(chat_id), args=[self.ttl, *args]
+            )
+        except RedisError as exc:
+            logger.warning("History cache write failed", error=str(exc))
+            await self.invalidate([chat_id])
+
+    async def invalidate(self, chat_ids: list[UUID]) -> None:
+        """Forget cached windows of given chats
+
+        Versions are bumped as well, so windows read from the database
+        before the change are not stored afterwards.
+        """
+
+        if not chat_ids:
+            return
+
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for chat_id in chat_ids:
+                    meta, window, data, version = history_keys(chat_id)
+                    pipe.incr(version)
+                    pipe.expire(version, self.ttl)
+                    pipe.delete(meta, window, data)
+                await pipe.execute()
+        except RedisError as exc:
+            logger.warning("History cache invalidation failed", error=str(exc))
+
+
+history_cache = HistoryCache(redis_client)
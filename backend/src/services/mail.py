@@ -0,0 +1,380 @@
+import asyncio
+import json
+import smtplib
+import time
+from typing import Callable
+from uuid import uuid4
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.config import (
+    MAIL_SENDER,
+    MAIL_API_KEY,
+    MAIL_HOST,
+    MAIL_PORT,
+    MAIL_STARTTLS,
+    MAIL_WORKERS,
+    MAIL_BATCH_SIZE,
+    MAIL_MAX_ATTEMPTS,
+    MAIL_IDLE_TIMEOUT,
+    MAIL_RETRY_DELAY,
+    MAIL_WORKER_TIMEOUT,
+)
+from src.logger import logger
+from src.redis_pool import redis_client
+
+MAIL_KEY_PREFIX = "mail"
+MAIL_QUEUE_KEY = f"{MAIL_KEY_PREFIX}:queue"
+MAIL_FIELDS = {"to": str, "subject": str, "text": str, "attempts": int}
+
+# KEYS: retry set, queue; ARGV: now, limit. Moves mails due for retry
+# back to the queue, returns retry time of the next one still waiting
+PROMOTE_SCRIPT = """
+local due = redis.call(
+    "ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2]
+)
+for _, mail in ipairs(due) do
+    redis.call("ZREM", KEYS[1], mail)
+    redis.call("LPUSH", KEYS[2], mail)
+end
+return redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")[2]
+"""
+
+# KEYS: processing list, queue. Moves mails left by a worker back to the
+# end of the queue taken first, returns how many
+RECOVER_SCRIPT = """
+local moved = 0
+while redis.call("LMOVE", KEYS[1], KEYS[2], "LEFT", "RIGHT") do
+    moved = moved + 1
+end
+return moved
+"""
+
+
+async def enqueue_mail(
+    to: str, subject: str, text: str, redis: Redis
+) -> None:
+    """Put mail to outbound queue"""
+
+    # Id keeps equal mails apart in the retry set
+    mail = {
+        "id": uuid4().hex,
+        "to": to,
+        "subject": subject,
+        "text": text,
+        "attempts": 0,
+    }
+    await redis.lpush(MAIL_QUEUE_KEY, json.dumps(mail))
+
+
+def parse_mail(raw: str | bytes) -> dict:
+    """Queued mail, ValueError when malformed"""
+
+    mail = json.loads(raw)
+    if not isinstance(mail, dict) or not all(
+        isinstance(mail.get(field), kind)
+        for field, kind in MAIL_FIELDS.items()
+    ):
+        raise ValueError("Mail fields missing")
+    return mail
+
+
+def build_message(mail: dict) -> MIMEMultipart:
+    """Build MIME message from queued mail"""
+
+    message = MIMEMultipart("alternative")
+    message["Subject"] = mail["subject"]
+    message["From"] = MAIL_SENDER
+    message["To"] = mail["to"]
+    message.attach(MIMEText(mail["text"], "plain"))
+    return message
+
+
+class MailSender:
+    """SMTP connection reused across batches of mails"""
+
+    def __init__(
+        self,
+        host: str = MAIL_HOST,
+        port: int = MAIL_PORT,
+        starttls: bool = MAIL_STARTTLS,
+        user: str = MAIL_SENDER,
+        password: str = MAIL_API_KEY,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.user = user
+        self.password = password
+        self.connection: smtplib.SMTP | None = None
+        self.last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()
+        if self.password:
+            server.login(self.user, self.password)
+        return server
+
+    def close(self) -> None:
+        """Close SMTP connection if open"""
+
+        if self.connection is None:
+            return
+
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
+
+    def deliver(self, mails: list[dict]) -> tuple[list[dict], list[dict]]:
+        """Send mails over one connection, return failed ones worth a
+        retry and rejected ones that can never be sent, with the error
+
+        Blocking, meant to run in a worker thread.
+        """
+
+        idle = time.monotonic() - self.last_used
+        if self.connection is not None and idle > MAIL_IDLE_TIMEOUT:
+            # Server has most likely dropped it already
+            self.close()
+
+        failed, rejected = [], []
+        for index, mail in enumerate(mails):
+            try:
+                if self.connection is None:
+                    self.connection = self._connect()
+            except (smtplib.SMTPException, OSError) as exc:
+                logger.warning("SMTP connection failed", error=str(exc))
+                failed.extend(mails[index:])
+                break
+
+            try:
+                self.connection.send_message(build_message(mail))
+            except (smtplib.SMTPException, OSError) as exc:
+                logger.warning("Mail delivery failed", error=str(exc))
+                self.close()
+                failed.append(mail)
+            except Exception as exc:
+                logger.error("Mail rejected", to=mail["to"], error=str(exc))
+                rejected.append({**mail, "error": str(exc)})
+
+        self.last_used = time.monotonic()
+        return failed, rejected
+
+
+class MailDispatcher:
+    """Background workers draining outbound mail queue
+
+    A worker moves each batch into its own processing list and removes
+    mails from it only once they are sent, scheduled for retry or
+    dead-lettered, so nothing is lost when the process dies: lists of
+    workers whose heartbeat expired are moved back to the queue. Failed
+    mails wait in a set scored by their retry time, the workers keep
+    sending others meanwhile.
+    """
+
+    def __init__(
+        self,
+        client: Redis,
+        workers: int = MAIL_WORKERS,
+        prefix: str = MAIL_KEY_PREFIX,
+        retry_delay: float = MAIL_RETRY_DELAY,
+        sender: Callable[[], MailSender] = MailSender,
+    ) -> None:
+        self.client = client
+        self.workers = max(workers, 1)
+        self.retry_delay = retry_delay
+        self.sender = sender
+        self.queue_key = f"{prefix}:queue"
+        self.dead_key = f"{prefix}:dead"
+        self.retry_key = f"{prefix}:retry"
+        # Set of processing lists of all workers
+        self.processing_key = f"{prefix}:processing"
+        self.promote_script = client.register_script(PROMOTE_SCRIPT)
+        self.recover_script = client.register_script(RECOVER_SCRIPT)
+        self.processing: list[str] = []
+        self.tasks: list[asyncio.Task] = []
+        self.running = False
+
+    async def start(self) -> None:
+        """Requeue mails left by dead workers and start queue workers,
+        each with own SMTP connection"""
+
+        self.processing = [
+            f"{self.processing_key}:{uuid4().hex}"
+            for _ in range(self.workers)
+        ]
+        try:
+            await self._heartbeat()
+            await self._recover()
+        except RedisError as exc:
+            logger.warning("Mail queue recovery failed", error=str(exc))
+
+        self.running = True
+        self.tasks = [
+            asyncio.create_task(self._run(self.sender(), processing))
+            for processing in self.processing
+        ]
+        self.tasks.append(asyncio.create_task(self._watch()))
+
+    async def stop(self) -> None:
+        """Stop queue workers, mails they hold go back to the queue"""
+
+        # redis-py may swallow a cancel arriving as a command starts, the
+        # flag still ends the loop within one blocking read
+        self.running = False
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        try:
+            for processing in self.processing:
+                await self._requeue(processing)
+        except RedisError as exc:
+            logger.warning("Mail queue release failed", error=str(exc))
+        self.processing = []
+
+    async def _heartbeat(self) -> None:
+        """Register processing lists and mark their workers alive"""
+
+        timeout = int(MAIL_WORKER_TIMEOUT * 1000)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.sadd(self.processing_key, *self.processing)
+            for processing in self.processing:
+                pipe.set(f"{processing}:alive", 1, px=timeout)
+            await pipe.execute()
+
+    async def _requeue(self, processing: str) -> None:
+        """Move mails of processing list back to the queue"""
+
+        moved = await self.recover_script(
+            keys=[processing, self.queue_key]
+        )
+        await self.client.srem(self.processing_key, processing)
+        await self.client.delete(f"{processing}:alive")
+        if moved:
+            logger.warning("Mails requeued", count=moved, worker=processing)
+
+    async def _recover(self) -> None:
+        """Requeue mails of workers whose heartbeat expired"""
+
+        for processing in await self.client.smembers(self.processing_key):
+            if isinstance(processing, bytes):
+                processing = processing.decode()
+            if processing in self.processing:
+                continue
+            if not await self.client.exists(f"{processing}:alive"):
+                await self._requeue(processing)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(MAIL_WORKER_TIMEOUT / 3)
+            try:
+                await self._heartbeat()
+                await self._recover()
+            except RedisError as exc:
+                logger.warning("Mail heartbeat failed", error=str(exc))
+
+    async def _next_batch(self, processing: str) -> list[str | bytes]:
+        now = time.time()
+        next_retry = await self.promote_script(
+            keys=[self.retry_key, self.queue_key],
+            args=[now, MAIL_BATCH_SIZE],
+        )
+        # Wake up in time for the next retry
+        timeout = 1.0
+        if next_retry is not None:
+            timeout = min(max(float(next_retry) - now, 0.01), timeout)
+        first = await self.client.blmove(
+            self.queue_key, processing, timeout, src="RIGHT", dest="LEFT"
+        )
+        if first is None:
+            return []
+
+        batch = [first]
+        if MAIL_BATCH_SIZE > 1:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for _ in range(MAIL_BATCH_SIZE - 1):
+                    pipe.lmove(
+                        self.queue_key, processing, src="RIGHT", dest="LEFT"
+                    )
+                more = await pipe.execute()
+            batch.extend(raw for raw in more if raw is not None)
+        return batch
+
+    async def _settle(
+        self,
+        processing: str,
+        batch: list[str | bytes],
+        failed: list[dict],
+        dead: list[str | bytes],
+    ) -> None:
+        """Schedule retries and dead letters, then release the batch"""
+
+        now = time.time()
+        async with self.client.pipeline(transaction=True) as pipe:
+            for mail in failed:
+                mail["attempts"] += 1
+                if mail["attempts"] >= MAIL_MAX_ATTEMPTS:
+                    logger.error("Mail moved to dead letters", to=mail["to"])
+                    pipe.lpush(self.dead_key, json.dumps(mail))
+                else:
+                    # Back off so an unavailable SMTP server is not hammered
+                    delay = min(self.retry_delay * 2 ** mail["attempts"], 60)
+                    pipe.zadd(self.retry_key, {json.dumps(mail): now + delay})
+            for raw in dead:
+                pipe.lpush(self.dead_key, raw)
+            for raw in batch:
+                pipe.lrem(processing, 1, raw)
+            await pipe.execute()
+
+    async def _run(self, sender: MailSender, processing: str) -> None:
+        try:
+            while self.running:
+                try:
+                    batch = await self._next_batch(processing)
+                except RedisError as exc:
+                    logger.warning("Mail queue read failed", error=str(exc))
+                    await asyncio.sleep(1.0)
+                    continue
+
+                if not batch:
+                    continue
+
+                mails, dead = [], []
+                for raw in batch:
+                    try:
+                        mails.append(parse_mail(raw))
+                    except ValueError as exc:
+                        logger.error("Malformed mail", error=str(exc))
+                        dead.append(raw)
+
+                failed, rejected = [], []
+                if mails:
+                    failed, rejected = await asyncio.to_thread(
+                        sender.deliver, mails
+                    )
+                dead.extend(json.dumps(mail) for mail in rejected)
+
+                try:
+                    await self._settle(processing, batch, failed, dead)
+                except RedisError as exc:
+                    # Left in the processing list, sent again once the
+                    # list is requeued
+                    logger.error(
+                        "Mail queue update failed",
+                        error=str(exc),
+                        pending=len(batch),
+                    )
+        finally:
+            sender.close()
+
+
+mail_dispatcher = MailDispatcher(redis_client)
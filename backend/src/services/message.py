@@ -1,35 +1,522 @@
-from typing import Sequence, List
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import List
 from uuid import UUID
 
-from sqlalchemy import select, insert, update, delete
+from fastapi import HTTPException, status
+from redis.asyncio import Redis
+from sqlalchemy import Row, select, insert, update, delete, tuple_, values
+from sqlalchemy import any_, case, column, func, DateTime, Integer
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.schemes.message import MessageInputScheme
-from src.models import MessageModel, ChatModel
-from src.config import db_session
+from src.schemes.message import (
+    MessageBatchItemScheme,
+    MessageInputScheme,
+    MessageScheme,
+    MessageEventScheme,
+)
+from src.models import ChatModel, MessageModel, MessageKeyModel
+from src.models import UserChatModel, SEARCH_LANGUAGE
+from src.config import (
+    db_session,
+    MESSAGE_PAGE_SIZE,
+    SEARCH_CANDIDATES,
+    SEARCH_PAGE_SIZE,
+    MESSAGE_WRITE_MODE,
+    MESSAGE_ACK,
+    MESSAGE_FLUSH_SIZE,
+    MESSAGE_FLUSH_INTERVAL,
+    MESSAGE_BUFFER_SIZE,
+    MESSAGE_CACHE_SIZE,
+)
+from src.logger import logger
+from src.services.chat import allowed_chats
+from src.services.history import history_cache
+from src.services.session import primary_session, use_session
+from src.services.stream import broker
+from src.utils import (
+    uuid7,
+    uuid7_time,
+    encode_cursor,
+    decode_cursor,
+    encode_rank_cursor,
+    decode_rank_cursor,
+    FORCE_CUSTOM_PLAN,
+)
+
+
+# Message ids and created_at are both taken on insert, UUIDv7 id tells
+# the creation time to this precision
+ID_CLOCK_SKEW = timedelta(minutes=1)
+
+
+def created_near(message_id: UUID) -> list:
+    """Bounds on created_at implied by message id, to prune partitions
+
+    Rows with UUID4 ids from before UUIDv7 get no bounds.
+    """
+
+    created_at = uuid7_time(message_id)
+    if created_at is None:
+        return []
+    return [
+        MessageModel.created_at.between(
+            created_at - ID_CLOCK_SKEW, created_at + ID_CLOCK_SKEW
+        )
+    ]
+
+
+async def first_by_id(session: AsyncSession, stmt, message_id: UUID):
+    """First row of statement on message by id, None when there is none
+
+    Runs bounded by ``created_near`` first. A clock step or counter carry
+    can put the id time further from created_at, then all partitions
+    are searched.
+    """
+
+    bounds = created_near(message_id)
+    if bounds:
+        row = (await session.execute(stmt.where(*bounds))).first()
+        if row is not None:
+            return row
+    return (await session.execute(stmt)).first()
+
+
+def message_event(
+    event_type: str,
+    chat_id: UUID,
+    message_id: UUID,
+    message: MessageModel | None = None,
+) -> str:
+    """Serialize realtime event about message change"""
+
+    event = MessageEventScheme(
+        type=event_type,
+        chat_id=chat_id,
+        message_id=message_id,
+        message=(
+            MessageScheme.model_validate(message)
+            if message is not None
+            else None
+        ),
+    )
+    return event.model_dump_json(by_alias=True)
+
+
+async def publish_message_event(
+    event_type: str,
+    chat_id: UUID,
+    message_id: UUID,
+    message: MessageModel | None = None,
+) -> None:
+    """Notify chat listeners about message change"""
+
+    await broker.publish(
+        chat_id, message_event(event_type, chat_id, message_id, message)
+    )
+
+
+async def record_chat_activity(
+    session: AsyncSession, user_id: UUID, messages: List[MessageModel]
+) -> None:
+    """Move chats of new messages from one sender forward
+
+    Chat list is ordered by last activity and shows unread counters, so
+    both are kept in the same transaction as the messages themselves.
+    Other members are not written to, their unread counts derive from
+    the chat message count.
+    """
+
+    latest: dict[UUID, MessageModel] = {}
+    counts: Counter[UUID] = Counter()
+    for message in messages:
+        counts[message.chat] += 1
+        last = latest.get(message.chat)
+        if last is None or message.created_at >= last.created_at:
+            latest[message.chat] = message
+
+    activity = values(
+        column("chat", PG_UUID(as_uuid=True)),
+        column("message_id", PG_UUID(as_uuid=True)),
+        column("created_at", DateTime(timezone=True)),
+        column("count", Integer),
+        name="activity",
+    ).data([
+        (chat_id, message.id, message.created_at, counts[chat_id])
+        for chat_id, message in latest.items()
+    ])
+
+    newer = ChatModel.last_activity_at <= activity.c.created_at
+    await session.execute(
+        update(ChatModel)
+        .where(ChatModel.id == activity.c.chat)
+        .values(
+            message_count=ChatModel.message_count + activity.c.count,
+            last_message_id=case(
+                (newer, activity.c.message_id),
+                else_=ChatModel.last_message_id,
+            ),
+            last_message_at=case(
+                (newer, activity.c.created_at),
+                else_=ChatModel.last_message_at,
+            ),
+            last_activity_at=func.greatest(
+                ChatModel.last_activity_at, activity.c.created_at
+            ),
+            updated_at=ChatModel.updated_at,
+        )
+    )
+    # Author has read everything up to own message
+    await session.execute(
+        update(UserChatModel)
+        .where(UserChatModel.chat == ChatModel.id)
+        .where(ChatModel.id == activity.c.chat)
+        .where(UserChatModel.user == user_id)
+        .values(
+            read_count=ChatModel.message_count,
+            last_read_at=activity.c.created_at,
+        )
+    )
 
 
 async def create_message(
-    user_id: UUID, chat_id: UUID, message: MessageInputScheme
+    user_id: UUID,
+    chat_id: UUID,
+    message: MessageInputScheme,
+    session: AsyncSession | None = None,
 ) -> MessageModel:
-    """Create new message"""
+    """Create new message, directly or through the write-behind buffer"""
+
+    if MESSAGE_WRITE_MODE == "buffered":
+        return await message_writer.submit(user_id, chat_id, message.text)
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             insert(MessageModel)
             .values(user=user_id, chat=chat_id, **message.model_dump())
             .returning(MessageModel)
         )
         result = await session.execute(stmt)
+        message_instance = result.scalar_one()
+
+        await record_chat_activity(session, user_id, [message_instance])
         await session.commit()
-        return result.scalar_one()
+
+    await history_cache.append([message_instance])
+    await publish_message_event(
+        "created", chat_id, message_instance.id, message_instance
+    )
+    return message_instance
+
+
+class MessageWriter:
+    """Write-behind buffer group-committing messages in micro-batches
+
+    Requests put messages on an in-process queue, a flusher task inserts
+    whatever accumulated (up to ``batch_size`` rows or ``interval``
+    seconds) in one transaction, so many sends share one commit. With
+    ``ack="commit"`` a request returns after its batch is durable, with
+    ``ack="enqueue"`` right away, at the cost of losing the buffered
+    messages if the process dies.
+    """
+
+    def __init__(
+        self,
+        ack: str = MESSAGE_ACK,
+        batch_size: int = MESSAGE_FLUSH_SIZE,
+        interval: float = MESSAGE_FLUSH_INTERVAL,
+        buffer_size: int = MESSAGE_BUFFER_SIZE,
+    ) -> None:
+        self.ack = ack
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.queue: asyncio.Queue | None = None
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Start flusher"""
+
+        # Bounded, so producers wait instead of piling up memory
+        self.queue = asyncio.Queue(self.buffer_size)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write everything buffered and stop flusher"""
+
+        if self.task is None:
+            return
+
+        await self.queue.join()
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def submit(
+        self, user_id: UUID, chat_id: UUID, text: str
+    ) -> MessageModel:
+        """Buffer message, return it once acknowledged"""
+
+        now = datetime.now(timezone.utc)
+        message = MessageModel(
+            id=uuid7(now),
+            user=user_id,
+            chat=chat_id,
+            text=text,
+            created_at=now,
+            updated_at=now,
+        )
+        if self.ack != "commit":
+            await self.queue.put((message, None))
+            return message
+
+        written = asyncio.get_running_loop().create_future()
+        await self.queue.put((message, written))
+        return await written
+
+    async def _next_batch(self) -> list[tuple]:
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self.queue.get(), timeout)
+                )
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(
+        self, messages: List[MessageModel]
+    ) -> List[MessageModel]:
+        rows = [
+            {
+                "id": message.id,
+                "user": message.user,
+                "chat": message.chat,
+                "text": message.text,
+                "created_at": message.created_at,
+                "updated_at": message.updated_at,
+            }
+            for message in messages
+        ]
+        by_sender: dict[UUID, List[MessageModel]] = {}
+
+        async with db_session() as session:
+            result = await session.scalars(
+                insert(MessageModel).values(rows).returning(MessageModel)
+            )
+            written = list(result.all())
+            for message in written:
+                by_sender.setdefault(message.user, []).append(message)
+            for user_id, sent in by_sender.items():
+                await record_chat_activity(session, user_id, sent)
+            await session.commit()
+
+        return written
+
+    async def _flush(self, batch: list[tuple]) -> None:
+        try:
+            written = await self._write([message for message, _ in batch])
+            # RETURNING order is not guaranteed, match rows by id
+            written = {message.id: message for message in written}
+            outcomes = [
+                (future, written[message.id]) for message, future in batch
+            ]
+        except IntegrityError:
+            # One bad row (chat deleted meanwhile) must not sink the rest
+            outcomes = []
+            for message, future in batch:
+                try:
+                    written = await self._write([message])
+                    outcomes.append((future, written[0]))
+                except IntegrityError as exc:
+                    outcomes.append((future, exc))
+
+        for future, outcome in outcomes:
+            if isinstance(outcome, Exception):
+                logger.warning(
+                    "Buffered message rejected", error=str(outcome)
+                )
+            if future is None or future.done():
+                continue
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+        written = [
+            message
+            for _, message in outcomes
+            if not isinstance(message, Exception)
+        ]
+        await history_cache.append(written)
+        await broker.publish_many([
+            (
+                message.chat,
+                message_event("created", message.chat, message.id, message),
+            )
+            for message in written
+        ])
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            except Exception as exc:
+                logger.error(
+                    "Message batch write failed",
+                    error=str(exc),
+                    lost=len(batch) if self.ack == "enqueue" else 0,
+                )
+                for _, future in batch:
+                    if future is not None and not future.done():
+                        future.set_exception(exc)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+
+message_writer = MessageWriter()
+
+
+async def create_messages(
+    user_id: UUID,
+    items: List[MessageBatchItemScheme],
+    redis: Redis,
+    session: AsyncSession | None = None,
+) -> List[tuple[str, MessageModel | None]]:
+    """Create batch of messages in one transaction
+
+    Chat permissions are checked once per chat and all rows go in one
+    multi-row INSERT. Items whose idempotency key was already used by the
+    sender are not inserted again, the stored message is returned
+    instead. Result has (status, message) for every item, in order.
+    """
+
+    allowed = await allowed_chats(
+        user_id, {item.chat_id for item in items}, redis, session
+    )
+
+    # Distinct timestamps keep batch order in chat history
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "id": uuid7(now + timedelta(microseconds=index)),
+            "user": user_id,
+            "chat": item.chat_id,
+            "text": item.text,
+            "created_at": now + timedelta(microseconds=index),
+            "updated_at": now + timedelta(microseconds=index),
+        }
+        for index, item in enumerate(items)
+        if item.chat_id in allowed
+    ]
+    keys = {
+        row["id"]: item.idempotency_key
+        for row, item in zip(
+            rows, (item for item in items if item.chat_id in allowed)
+        )
+        if item.idempotency_key is not None
+    }
+
+    created: dict[UUID, MessageModel] = {}
+    existing: dict[str, MessageModel] = {}
+    async with use_session(session) as session:
+        # Claim keys first, only messages whose key is new get inserted
+        claimed = set()
+        if keys:
+            stmt = (
+                pg_insert(MessageKeyModel)
+                .values([
+                    {
+                        "user": user_id,
+                        "idempotency_key": key,
+                        "message_id": row["id"],
+                        "created_at": row["created_at"],
+                    }
+                    for row in rows
+                    if (key := keys.get(row["id"])) is not None
+                ])
+                .on_conflict_do_nothing()
+                .returning(MessageKeyModel.message_id)
+            )
+            result = await session.scalars(stmt)
+            claimed = set(result.all())
+
+        new_rows = [
+            row
+            for row in rows
+            if row["id"] not in keys or row["id"] in claimed
+        ]
+        if new_rows:
+            result = await session.scalars(
+                insert(MessageModel).values(new_rows).returning(MessageModel)
+            )
+            created = {message.id: message for message in result.all()}
+
+        skipped = {
+            key for row_id, key in keys.items() if row_id not in claimed
+        }
+        if skipped:
+            result = await session.execute(
+                select(MessageKeyModel.idempotency_key, MessageModel)
+                .join(
+                    MessageModel,
+                    (MessageModel.id == MessageKeyModel.message_id)
+                    & (MessageModel.created_at == MessageKeyModel.created_at),
+                )
+                .where(MessageKeyModel.user == user_id)
+                .where(MessageKeyModel.idempotency_key.in_(skipped))
+            )
+            existing = dict(result.tuples().all())
+
+        if created:
+            await record_chat_activity(
+                session, user_id, list(created.values())
+            )
+        await session.commit()
+
+    await history_cache.append(list(created.values()))
+    await broker.publish_many([
+        (
+            message.chat,
+            message_event("created", message.chat, message.id, message),
+        )
+        for message in created.values()
+    ])
+
+    results = []
+    row_ids = iter(row["id"] for row in rows)
+    for item in items:
+        if item.chat_id not in allowed:
+            results.append(("forbidden", None))
+            continue
+        message = created.get(next(row_ids))
+        if message is not None:
+            results.append(("created", message))
+        else:
+            results.append(("duplicate", existing.get(item.idempotency_key)))
+    return results
 
 
 async def update_message(
-    user_id: UUID, message_id: UUID, message: MessageInputScheme
+    user_id: UUID,
+    message_id: UUID,
+    message: MessageInputScheme,
+    session: AsyncSession | None = None,
 ) -> MessageModel:
     """Update message details"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             update(MessageModel)
             .where(MessageModel.id == message_id)
@@ -37,40 +524,281 @@ async def update_message(
             .values(**message.model_dump())
             .returning(MessageModel)
         )
-        result = await session.execute(stmt)
+        updated = await first_by_id(session, stmt, message_id)
         await session.commit()
-        return result.scalar_one()
 
+    if updated is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Not found"
+        )
+    message_instance = updated[0]
+
+    await history_cache.replace(message_instance)
+    await publish_message_event(
+        "updated",
+        message_instance.chat,
+        message_instance.id,
+        message_instance,
+    )
+    return message_instance
 
-async def delete_message(user_id: UUID, message_id: UUID) -> None:
+
+async def delete_message(
+    user_id: UUID, message_id: UUID, session: AsyncSession | None = None
+) -> None:
     """Delete message"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             delete(MessageModel)
             .where(MessageModel.id == message_id)
             .where(MessageModel.user == user_id)
+            .returning(MessageModel.chat, MessageModel.created_at)
         )
-        await session.execute(stmt)
+        deleted = await first_by_id(session, stmt, message_id)
+        chat_id = deleted.chat if deleted is not None else None
+
+        if deleted is not None:
+            # Members who had read it keep their unread count, the others
+            # lose one unread message with the chat count below
+            await session.execute(
+                update(UserChatModel)
+                .where(UserChatModel.chat == chat_id)
+                .where(UserChatModel.read_count > 0)
+                .where(UserChatModel.last_read_at >= deleted.created_at)
+                .values(read_count=UserChatModel.read_count - 1)
+            )
+
+            # Bounded by the deleted one, so newer partitions are pruned
+            previous = (
+                select(MessageModel.id, MessageModel.created_at)
+                .where(MessageModel.chat == chat_id)
+                .where(MessageModel.created_at <= deleted.created_at)
+                .order_by(
+                    MessageModel.created_at.desc(), MessageModel.id.desc()
+                )
+                .limit(1)
+                .subquery()
+            )
+            was_last = ChatModel.last_message_id == message_id
+            await session.execute(
+                update(ChatModel)
+                .where(ChatModel.id == chat_id)
+                .values(
+                    message_count=func.greatest(
+                        ChatModel.message_count - 1, 0
+                    ),
+                    last_message_id=case(
+                        (was_last, select(previous.c.id).scalar_subquery()),
+                        else_=ChatModel.last_message_id,
+                    ),
+                    last_message_at=case(
+                        (
+                            was_last,
+                            select(previous.c.created_at).scalar_subquery(),
+                        ),
+                        else_=ChatModel.last_message_at,
+                    ),
+                    updated_at=ChatModel.updated_at,
+                )
+            )
         await session.commit()
 
+    if chat_id is not None:
+        await history_cache.remove(chat_id, message_id)
+        await publish_message_event("deleted", chat_id, message_id)
+
 
-async def read_message(message: UUID) -> MessageModel:
+async def read_message(
+    message: UUID, session: AsyncSession | None = None
+) -> MessageModel:
     """Get specific message from chat"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = select(MessageModel).where(MessageModel.id == message)
-        return await session.scalar(stmt)
+        found = await first_by_id(session, stmt, message)
+
+    if found is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Not found"
+        )
+    return found[0]
 
 
-async def read_messages(chat_id: UUID) -> Sequence[MessageModel]:
-    """Get all chat messages"""
+async def read_messages(
+    chat_id: UUID,
+    before: str | None = None,
+    after: str | None = None,
+    limit: int = MESSAGE_PAGE_SIZE,
+    session: AsyncSession | None = None,
+) -> tuple[List[MessageModel | MessageScheme], str | None]:
+    """Get page of chat messages (newest first) and cursor for next page
 
-    async with db_session() as session:
+    Pages are addressed by keyset on (created_at, id), so each page is a
+    bounded range scan of ``ix_message_chat_created_at_id``. Older pages
+    within the newest MESSAGE_CACHE_SIZE messages come from Redis.
+    """
+
+    if before is not None and after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only one of 'before' and 'after' can be given",
+        )
+
+    position = tuple_(MessageModel.created_at, MessageModel.id)
+    stmt = select(MessageModel).where(MessageModel.chat == chat_id)
+    fetch = limit
+    fill_version = ""
+
+    # Row comparisons do not prune partitions, plain bounds on the
+    # partition key next to them do
+    if after is not None:
+        edge = decode_cursor(after)
         stmt = (
-            select(MessageModel)
-            .join(ChatModel, ChatModel.id == MessageModel.chat)
-            .where(ChatModel.id == chat_id)
+            stmt.where(MessageModel.created_at >= edge[0])
+            .where(position > tuple_(*edge))
+            .order_by(MessageModel.created_at.asc(), MessageModel.id.asc())
+        )
+    else:
+        edge = decode_cursor(before) if before is not None else None
+        cached, has_more, version = await history_cache.read(
+            chat_id, edge, limit
         )
+        if cached is not None:
+            next_cursor = None
+            if has_more and cached:
+                next_cursor = encode_cursor(
+                    cached[-1].created_at, cached[-1].id
+                )
+            return cached, next_cursor
+
+        if edge is not None:
+            stmt = stmt.where(MessageModel.created_at <= edge[0]).where(
+                position < tuple_(*edge)
+            )
+        else:
+            # Newest page missed, read the whole window to cache it
+            fetch = max(limit, MESSAGE_CACHE_SIZE)
+            fill_version = version
+        stmt = stmt.order_by(
+            MessageModel.created_at.desc(), MessageModel.id.desc()
+        )
+
+    # One extra row tells whether another page exists
+    stmt = stmt.limit(fetch + 1)
+
+    # Rows cached for everyone come from primary, not a lagging replica
+    reader = primary_session if fill_version else use_session
+    async with reader(session) as session:
         result = await session.scalars(stmt)
-        return result.all()
+        messages = list(result.all())
+
+    if fill_version:
+        await history_cache.fill(
+            chat_id,
+            fill_version,
+            messages,
+            complete=len(messages) <= MESSAGE_CACHE_SIZE,
+        )
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+
+    if after is not None:
+        messages.reverse()
+        edge = messages[0] if messages else None
+    else:
+        edge = messages[-1] if messages else None
+
+    next_cursor = None
+    if has_more and edge is not None:
+        next_cursor = encode_cursor(edge.created_at, edge.id)
+
+    return messages, next_cursor
+
+
+async def search_messages(
+    user_id: UUID,
+    terms: str,
+    chat_id: UUID | None = None,
+    before: str | None = None,
+    limit: int = SEARCH_PAGE_SIZE,
+    session: AsyncSession | None = None,
+) -> tuple[List[Row], str | None]:
+    """Search messages in one chat or all user chats, best match first
+
+    Matches come from the GIN index on ``search_vector``. Only the newest
+    SEARCH_CANDIDATES of them are ranked and only the returned page gets
+    highlighted, so very common words do not rank the whole history.
+    """
+
+    query = func.websearch_to_tsquery(SEARCH_LANGUAGE, terms)
+
+    candidates = (
+        select(
+            MessageModel.id,
+            MessageModel.created_at,
+            func.ts_rank_cd(MessageModel.search_vector, query).label("rank"),
+        )
+        .where(MessageModel.search_vector.op("@@")(query))
+        .order_by(MessageModel.created_at.desc())
+        .limit(SEARCH_CANDIDATES)
+    )
+    if chat_id is not None:
+        candidates = candidates.where(MessageModel.chat == chat_id)
+    else:
+        # ANY(ARRAY(...)) instead of IN: chats are collected once and the
+        # GIN index is scanned once, not in a nested loop per chat
+        user_chats = select(UserChatModel.chat).where(
+            UserChatModel.user == user_id
+        )
+        candidates = candidates.where(
+            MessageModel.chat == any_(func.array(user_chats.scalar_subquery()))
+        )
+    candidates = candidates.subquery("candidates")
+
+    page = select(candidates).order_by(
+        candidates.c.rank.desc(), candidates.c.id.desc()
+    )
+    if before is not None:
+        page = page.where(
+            tuple_(candidates.c.rank, candidates.c.id)
+            < tuple_(*decode_rank_cursor(before))
+        )
+    # One extra row tells whether another page exists
+    page = page.limit(limit + 1).subquery("page")
+
+    stmt = (
+        select(
+            MessageModel,
+            page.c.rank,
+            func.ts_headline(
+                SEARCH_LANGUAGE,
+                MessageModel.text,
+                query,
+                "StartSel=<mark>, StopSel=</mark>, MaxFragments=2",
+            ).label("headline"),
+        )
+        # With created_at each hit is looked up in its partition only
+        .join(
+            page,
+            tuple_(page.c.id, page.c.created_at)
+            == tuple_(MessageModel.id, MessageModel.created_at),
+        )
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+    )
+
+    async with use_session(session) as session:
+        # Generic plan of a cached statement can not see how common the
+        # searched words are and picks a full GIN scan for every term
+        await session.execute(FORCE_CUSTOM_PLAN)
+        result = await session.execute(stmt)
+        rows = list(result.all())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        message, rank, _ = rows[-1]
+        next_cursor = encode_rank_cursor(rank, message.id)
+
+    return rows, next_cursor
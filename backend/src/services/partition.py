@@ -0,0 +1,420 @@
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+from uuid import UUID
+
+from sqlalchemy import DateTime, FromClause, case, column, delete, func
+from sqlalchemy import select, table, text, true, tuple_, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from src.config import (
+    engine,
+    db_session,
+    MESSAGE_PARTITION_PERIOD,
+    MESSAGE_PARTITIONS_AHEAD,
+    MESSAGE_RETENTION_DAYS,
+    MESSAGE_ARCHIVE_SCHEMA,
+    MESSAGE_RETENTION_BATCH,
+    PARTITION_MAINTENANCE_INTERVAL,
+)
+from src.logger import logger
+from src.models import ChatModel, MessageKeyModel, MessageModel
+from src.models import UserChatModel
+from src.services.history import history_cache
+
+# Serializes maintenance of several app instances
+PARTITION_LOCK = 0x6D657373
+
+PARTITIONS_QUERY = text("""
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), i.inhdetachpending
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'message'::regclass
+""")
+
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+class Partition(NamedTuple):
+    """Message partition holding [start, end)"""
+
+    name: str
+    start: datetime
+    end: datetime
+    detach_pending: bool = False
+
+
+def period_start(moment: datetime, period: str) -> datetime:
+    """Start of the period (UTC day, ISO week or month) containing moment"""
+
+    moment = moment.astimezone(timezone.utc)
+    day = datetime(moment.year, moment.month, moment.day, tzinfo=timezone.utc)
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(start: datetime, period: str) -> datetime:
+    """Start of the period following the one starting at ``start``"""
+
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(weeks=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(start: datetime) -> str:
+    """Name of partition starting at ``start``"""
+
+    return f"message_p{start:%Y%m%d}"
+
+
+async def read_partitions(conn: AsyncConnection) -> list[Partition]:
+    """Range partitions of message table, oldest first"""
+
+    partitions = []
+    for name, bound, detach_pending in await conn.execute(PARTITIONS_QUERY):
+        match = BOUND_PATTERN.search(bound)
+        if match is None:  # MINVALUE/MAXVALUE or default partition
+            continue
+        start, end = map(datetime.fromisoformat, match.groups())
+        partitions.append(Partition(name, start, end, detach_pending))
+    return sorted(partitions, key=lambda partition: partition.start)
+
+
+def missing_ranges(
+    partitions: list[Partition], start: datetime, end: datetime
+) -> list[tuple[datetime, datetime]]:
+    """Parts of [start, end) no partition covers yet"""
+
+    gaps = []
+    for partition in partitions:
+        if partition.end <= start or partition.start >= end:
+            continue
+        if partition.start > start:
+            gaps.append((start, partition.start))
+        start = max(start, partition.end)
+    if start < end:
+        gaps.append((start, end))
+    return gaps
+
+
+async def create_partitions(
+    since: datetime | None = None,
+    ahead: int = MESSAGE_PARTITIONS_AHEAD,
+    period: str = MESSAGE_PARTITION_PERIOD,
+) -> list[str]:
+    """Create partitions from ``since`` (default now) to ``ahead`` periods
+    past the current one, return names of created ones
+
+    Ranges already covered are skipped, so changing the period only
+    affects partitions created from then on.
+    """
+
+    now = datetime.now(timezone.utc)
+    start = period_start(since or now, period)
+    end = next_period(period_start(now, period), period)
+    for _ in range(ahead):
+        end = next_period(end, period)
+
+    created = []
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"),
+            {"key": PARTITION_LOCK},
+        )
+        partitions = await read_partitions(conn)
+
+        for gap_start, gap_end in missing_ranges(partitions, start, end):
+            bound = gap_start
+            while bound < gap_end:
+                upper = min(next_period(bound, period), gap_end)
+                name = partition_name(bound)
+                await conn.execute(
+                    text(
+                        f'CREATE TABLE "{name}" PARTITION OF message '
+                        f"FOR VALUES FROM ('{bound.isoformat()}') "
+                        f"TO ('{upper.isoformat()}')"
+                    )
+                )
+                created.append(name)
+                bound = upper
+
+    if created:
+        logger.info("Message partitions created", partitions=created)
+    return created
+
+
+async def uncount_expired(
+    conn: AsyncConnection | AsyncSession, expired: FromClause
+) -> None:
+    """Take expired messages, rows of (chat, created_at), off chat
+    message counts and member read counts, so unread counts stay
+
+    Expiry takes the oldest messages of a chat, one whose last message
+    expired has none left.
+    """
+
+    counted = (
+        select(
+            expired.c.chat,
+            func.count().label("count"),
+            func.max(expired.c.created_at).label("newest"),
+        )
+        .group_by(expired.c.chat)
+        .subquery("counted")
+    )
+    last_expired = ChatModel.last_message_at <= counted.c.newest
+    await conn.execute(
+        update(ChatModel)
+        .where(ChatModel.id == counted.c.chat)
+        .values(
+            message_count=func.greatest(
+                ChatModel.message_count - counted.c.count, 0
+            ),
+            last_message_id=case(
+                (last_expired, None), else_=ChatModel.last_message_id
+            ),
+            last_message_at=case(
+                (last_expired, None), else_=ChatModel.last_message_at
+            ),
+            updated_at=ChatModel.updated_at,
+        )
+    )
+
+    # Members only had those up to their read pointer counted as read
+    read = (
+        select(UserChatModel.id, func.count().label("count"))
+        .join(
+            expired,
+            (expired.c.chat == UserChatModel.chat)
+            & (expired.c.created_at <= UserChatModel.last_read_at),
+        )
+        .group_by(UserChatModel.id)
+        .subquery("read")
+    )
+    await conn.execute(
+        update(UserChatModel)
+        .where(UserChatModel.id == read.c.id)
+        .values(
+            read_count=func.greatest(
+                UserChatModel.read_count - read.c.count, 0
+            )
+        )
+    )
+
+
+async def expire_partitions(
+    retention_days: int = MESSAGE_RETENTION_DAYS,
+    archive_schema: str = MESSAGE_ARCHIVE_SCHEMA,
+) -> list[str]:
+    """Detach partitions past global retention, then archive or drop them
+
+    Detaching concurrently keeps reads and writes of newer partitions
+    going, so it runs outside of a transaction. Counters of chats are
+    adjusted in the transaction archiving or dropping the partition.
+    """
+
+    if retention_days <= 0:
+        return []
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    expired = []
+    chat_ids: set[UUID] = set()
+    conn = await engine.connect()
+    try:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        locked = await conn.scalar(
+            text("SELECT pg_try_advisory_lock(:key)"),
+            {"key": PARTITION_LOCK},
+        )
+        if not locked:
+            return []
+
+        try:
+            for partition in await read_partitions(conn):
+                if partition.end > cutoff:
+                    break
+
+                # Keys of expired messages go first, they reference them
+                await conn.execute(
+                    delete(MessageKeyModel).where(
+                        MessageKeyModel.created_at < partition.end
+                    )
+                )
+                # Interrupted concurrent detach has to be finished instead
+                mode = "CONCURRENTLY"
+                if partition.detach_pending:
+                    mode = "FINALIZE"
+                await conn.execute(
+                    text(
+                        "ALTER TABLE message DETACH PARTITION "
+                        f'"{partition.name}" {mode}'
+                    )
+                )
+                # Cached history windows may still hold its messages
+                chats = await conn.scalars(
+                    text(f'SELECT DISTINCT chat FROM "{partition.name}"')
+                )
+                chat_ids.update(chats)
+                async with engine.begin() as tx:
+                    await uncount_expired(
+                        tx,
+                        table(
+                            partition.name,
+                            column("chat"),
+                            column("created_at"),
+                        ),
+                    )
+                    if archive_schema:
+                        await tx.execute(
+                            text(
+                                "CREATE SCHEMA IF NOT EXISTS "
+                                f'"{archive_schema}"'
+                            )
+                        )
+                        await tx.execute(
+                            text(
+                                f'ALTER TABLE "{partition.name}" '
+                                f'SET SCHEMA "{archive_schema}"'
+                            )
+                        )
+                    else:
+                        await tx.execute(
+                            text(f'DROP TABLE "{partition.name}"')
+                        )
+                expired.append(partition.name)
+        finally:
+            await conn.execute(
+                text("SELECT pg_advisory_unlock(:key)"),
+                {"key": PARTITION_LOCK},
+            )
+    finally:
+        await conn.close()
+
+    if chat_ids:
+        await history_cache.invalidate(list(chat_ids))
+    if expired:
+        logger.info(
+            "Message partitions expired",
+            partitions=expired,
+            archived_to=archive_schema or None,
+        )
+    return expired
+
+
+async def expire_chat_messages(
+    batch_size: int = MESSAGE_RETENTION_BATCH,
+) -> int:
+    """Delete messages past retention of their chat, in batches
+
+    Chats with own retention come from a partial index, their expired
+    messages from a range of the chat history index each.
+    """
+
+    retention = func.make_interval(0, 0, 0, ChatModel.retention_days)
+    chats = (
+        select(ChatModel.id, (func.now() - retention).label("cutoff"))
+        .where(ChatModel.retention_days.is_not(None))
+        .subquery("chats")
+    )
+    chat_expired = (
+        select(MessageModel.id, MessageModel.created_at)
+        .where(MessageModel.chat == chats.c.id)
+        .where(MessageModel.created_at < chats.c.cutoff)
+        .limit(batch_size)
+        .lateral("chat_expired")
+    )
+    expired = (
+        select(chat_expired.c.id, chat_expired.c.created_at)
+        .select_from(chats)
+        .join(chat_expired, true())
+        .limit(batch_size)
+    )
+    stmt = (
+        delete(MessageModel)
+        .where(
+            tuple_(MessageModel.id, MessageModel.created_at).in_(expired)
+        )
+        .returning(MessageModel.chat, MessageModel.created_at)
+    )
+
+    deleted = 0
+    chat_ids: set[UUID] = set()
+    while True:
+        async with db_session() as session:
+            result = await session.execute(stmt)
+            batch = [tuple(row) for row in result.all()]
+            if batch:
+                await uncount_expired(
+                    session,
+                    values(
+                        column("chat", PG_UUID(as_uuid=True)),
+                        column("created_at", DateTime(timezone=True)),
+                        name="expired",
+                    ).data(batch),
+                )
+            await session.commit()
+
+        deleted += len(batch)
+        chat_ids.update(chat_id for chat_id, _ in batch)
+        if len(batch) < batch_size:
+            break
+
+    if chat_ids:
+        await history_cache.invalidate(list(chat_ids))
+        logger.info(
+            "Chat messages expired", messages=deleted, chats=len(chat_ids)
+        )
+    return deleted
+
+
+class PartitionMaintainer:
+    """Keep partitions created ahead of time and expire old messages"""
+
+    def __init__(
+        self, interval: float = PARTITION_MAINTENANCE_INTERVAL
+    ) -> None:
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Start periodic maintenance
+
+        Partitions needed right away are created by ``src.migrate``, so
+        starting workers do not run DDL.
+        """
+
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop periodic maintenance"""
+
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def maintain(self) -> None:
+        """Create upcoming partitions and apply retention policies"""
+
+        try:
+            await create_partitions()
+            await expire_partitions()
+            await expire_chat_messages()
+        except (SQLAlchemyError, OSError) as exc:
+            logger.error("Partition maintenance failed", error=str(exc))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.maintain()
+
+
+partition_maintainer = PartitionMaintainer()
@@ -0,0 +1,192 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Annotated, Any, Callable
+from uuid import UUID
+
+from fastapi import Body, Depends, HTTPException, Request, status
+from pydantic import EmailStr
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.config import RATE_LIMIT_WINDOW, RATE_LIMIT_LOCAL_KEYS
+from src.logger import logger
+from src.metrics import RATE_LIMITED
+from src.redis_pool import redis_client
+
+RATE_LIMIT_PREFIX = "rate:"
+
+# KEYS: counter; ARGV: limit, window in ms, cost of the call. Counts
+# calls of the current
+# fixed window and keeps the count of the previous one, which is weighed
+# by how much of it the sliding window still covers. Server time keeps
+# workers with skewed clocks on the same windows. Returns milliseconds
+# until the next call is allowed, 0 when this one is.
+HIT_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local limit, window = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local index = math.floor(now / window)
+local state = redis.call("HMGET", KEYS[1], "index", "current", "previous")
+local current, previous = tonumber(state[2]) or 0, tonumber(state[3]) or 0
+if tonumber(state[1]) ~= index then
+    if tonumber(state[1]) == index - 1 then
+        previous = current
+    else
+        previous = 0
+    end
+    current = 0
+end
+local offset = now - index * window
+if previous * (window - offset) / window + current + cost > limit then
+    if current + cost > limit or previous == 0 then
+        return window - offset
+    end
+    local allowed_at = (1 - (limit - current - cost) / previous) * window
+    return math.max(math.ceil(allowed_at - offset), 1)
+end
+redis.call(
+    "HSET", KEYS[1], "index", index, "current", current + cost,
+    "previous", previous
+)
+redis.call("PEXPIRE", KEYS[1], 2 * window)
+return 0
+"""
+
+
+class LocalRateLimiter:
+    """Sliding window counters of one worker, used while Redis is down
+
+    Least recently used counters are dropped past ``size`` keys.
+    """
+
+    def __init__(self, size: int = RATE_LIMIT_LOCAL_KEYS) -> None:
+        self.size = size
+        # key -> [window index, current count, previous count]
+        self.counters: OrderedDict[str, list[int]] = OrderedDict()
+
+    def hit(self, key: str, limit: int, window: int, cost: int = 1) -> int:
+        """Count call, milliseconds until allowed, 0 when it is"""
+
+        now = int(time.time() * 1000)
+        index = now // window
+        last, current, previous = self.counters.pop(key, (index, 0, 0))
+        if last != index:
+            previous = current if last == index - 1 else 0
+            current = 0
+
+        offset = now - index * window
+        wait = 0
+        if previous * (window - offset) / window + current + cost > limit:
+            wait = window - offset
+            if current + cost <= limit and previous:
+                allowed_at = (1 - (limit - current - cost) / previous) * window
+                wait = max(math.ceil(allowed_at - offset), 1)
+        else:
+            current += cost
+
+        self.counters[key] = [index, current, previous]
+        if len(self.counters) > self.size:
+            self.counters.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        """Forget all counters"""
+
+        self.counters.clear()
+
+
+class RateLimiter:
+    """Sliding window rate limits shared by all workers through Redis
+
+    Counters are updated by one atomic script per call. While Redis is
+    unavailable each worker falls back to its own counters, so limits
+    still hold, only per worker.
+    """
+
+    def __init__(
+        self, client: Redis, local_size: int = RATE_LIMIT_LOCAL_KEYS
+    ) -> None:
+        self.client = client
+        self.hit_script = client.register_script(HIT_SCRIPT)
+        self.local = LocalRateLimiter(local_size)
+
+    async def hit(
+        self, key: str, limit: int, window: float, cost: int = 1
+    ) -> float:
+        """Count call of ``key`` worth ``cost`` calls, seconds until
+        allowed, 0 when it is"""
+
+        window_ms = int(window * 1000)
+        key = f"{RATE_LIMIT_PREFIX}{key}"
+        try:
+            wait = await self.hit_script(
+                keys=[key], args=[limit, window_ms, cost]
+            )
+        except RedisError as exc:
+            logger.warning("Rate limit check failed", error=str(exc))
+            wait = self.local.hit(key, limit, window_ms, cost)
+        return int(wait) / 1000
+
+
+rate_limiter = RateLimiter(redis_client)
+
+
+def client_ip(request: Request) -> str:
+    """Address of client, taken from forwarded headers by uvicorn when
+    the proxy is trusted (``--forwarded-allow-ips``)"""
+
+    return request.client.host if request.client else ""
+
+
+def body_email(email: Annotated[EmailStr, Body()]) -> str:
+    """Account of login or password reset attempt"""
+
+    return email.lower()
+
+
+def body_user_id(user_id: Annotated[UUID, Body()]) -> UUID:
+    """Account of 2FA attempt"""
+
+    return user_id
+
+
+def single_call() -> int:
+    """Cost of a call counted once"""
+
+    return 1
+
+
+def rate_limit(
+    scope: str,
+    limit: int,
+    window: float = RATE_LIMIT_WINDOW,
+    key: Callable[..., Any] = client_ip,
+    cost: Callable[..., int] = single_call,
+) -> Callable[..., Any]:
+    """Dependency allowing ``limit`` calls per ``window`` seconds for
+    each value of ``key``, itself a dependency (client IP by default)
+
+    A call counts as many calls as ``cost``, also a dependency, tells.
+    Rejected calls get 429 with Retry-After. Zero limit disables it.
+    """
+
+    async def check_rate_limit(
+        subject: Any = Depends(key), calls: int = Depends(cost)
+    ) -> None:
+        if limit <= 0:
+            return
+
+        wait = await rate_limiter.hit(
+            f"{scope}:{subject}", limit, window, calls
+        )
+        if wait:
+            RATE_LIMITED.labels(scope).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    return check_rate_limit
@@ -0,0 +1,204 @@
+import asyncio
+from datetime import datetime, timezone
+from uuid import UUID
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import ColumnElement, DateTime, column, func, select
+from sqlalchemy import update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import db_session, READ_FLUSH_INTERVAL, UNREAD_COUNT_CAP
+from src.logger import logger
+from src.models import ChatModel, MessageModel, UserChatModel
+from src.redis_pool import redis_client
+from src.services.session import use_session
+from src.utils import to_micros, from_micros
+
+READ_PENDING_KEY = "read:pending"
+
+# Keep the furthest pointer, clients may report out of order
+ADVANCE_SCRIPT = """
+local current = redis.call("HGET", KEYS[1], ARGV[1])
+if not current or tonumber(ARGV[2]) > tonumber(current) then
+    redis.call("HSET", KEYS[1], ARGV[1], ARGV[2])
+end
+"""
+
+
+class ReadReceiptFlusher:
+    """Debounce read pointers in Redis and write them in batches"""
+
+    def __init__(
+        self, client: Redis, interval: float = READ_FLUSH_INTERVAL
+    ) -> None:
+        self.client = client
+        self.interval = interval
+        self.advance_script = client.register_script(ADVANCE_SCRIPT)
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Start periodic flush"""
+
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop periodic flush and write what is left"""
+
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    async def advance(
+        self, user_id: UUID, chat_id: UUID, read_at: datetime
+    ) -> None:
+        """Move user read pointer forward, applied on next flush
+
+        Without Redis the pointer is written right away instead.
+        """
+
+        micros = to_micros(min(read_at, datetime.now(timezone.utc)))
+        try:
+            await self.advance_script(
+                keys=[READ_PENDING_KEY], args=[f"{user_id}:{chat_id}", micros]
+            )
+        except RedisError as exc:
+            logger.warning("Read pointer debounce failed", error=str(exc))
+            await write_read_pointers({(user_id, chat_id): micros})
+
+    async def _take_pending(self) -> dict[tuple[UUID, UUID], int]:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hgetall(READ_PENDING_KEY)
+            pipe.delete(READ_PENDING_KEY)
+            pending, _ = await pipe.execute()
+
+        pointers = {}
+        for field, micros in pending.items():
+            user_id, chat_id = field.split(":")
+            pointers[(UUID(user_id), UUID(chat_id))] = int(micros)
+        return pointers
+
+    async def _restore_pending(
+        self, pointers: dict[tuple[UUID, UUID], int]
+    ) -> None:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for (user_id, chat_id), micros in pointers.items():
+                await self.advance_script(
+                    keys=[READ_PENDING_KEY],
+                    args=[f"{user_id}:{chat_id}", micros],
+                    client=pipe,
+                )
+            await pipe.execute()
+
+    async def flush(self) -> int:
+        """Write pending read pointers and recount unread messages"""
+
+        try:
+            pointers = await self._take_pending()
+        except RedisError as exc:
+            logger.warning("Read pointers fetch failed", error=str(exc))
+            return 0
+
+        if not pointers:
+            return 0
+
+        try:
+            await write_read_pointers(pointers)
+        except (SQLAlchemyError, OSError) as exc:
+            logger.warning("Read pointers write failed", error=str(exc))
+            try:
+                await self._restore_pending(pointers)
+            except RedisError as exc:
+                logger.error(
+                    "Read pointers lost", error=str(exc), lost=len(pointers)
+                )
+            return 0
+
+        return len(pointers)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+def unread_count() -> ColumnElement[int]:
+    """Unread messages of membership joined with its chat, capped at
+    UNREAD_COUNT_CAP"""
+
+    return func.least(
+        func.greatest(ChatModel.message_count - UserChatModel.read_count, 0),
+        UNREAD_COUNT_CAP,
+    )
+
+
+async def write_read_pointers(pointers: dict[tuple[UUID, UUID], int]) -> None:
+    """Advance read pointers in one statement
+
+    Read count is the chat message count less messages of others after
+    the pointer, counted up to UNREAD_COUNT_CAP as only that many show.
+    """
+
+    batch = values(
+        column("user", PG_UUID(as_uuid=True)),
+        column("chat", PG_UUID(as_uuid=True)),
+        column("read_at", DateTime(timezone=True)),
+        name="batch",
+    ).data([
+        (user_id, chat_id, from_micros(micros))
+        for (user_id, chat_id), micros in pointers.items()
+    ])
+
+    # GREATEST skips NULL, so the first pointer is taken as is
+    read_at = func.greatest(UserChatModel.last_read_at, batch.c.read_at)
+    unread = (
+        select(MessageModel.id)
+        .where(MessageModel.chat == UserChatModel.chat)
+        .where(MessageModel.user != UserChatModel.user)
+        .where(MessageModel.created_at > read_at)
+        .limit(UNREAD_COUNT_CAP)
+        .correlate(UserChatModel, batch)
+        .subquery()
+    )
+
+    stmt = (
+        update(UserChatModel)
+        .where(UserChatModel.user == batch.c.user)
+        .where(UserChatModel.chat == batch.c.chat)
+        .where(ChatModel.id == UserChatModel.chat)
+        .values(
+            last_read_at=read_at,
+            read_count=func.greatest(
+                ChatModel.message_count
+                - select(func.count()).select_from(unread).scalar_subquery(),
+                0,
+            ),
+        )
+    )
+
+    async with db_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def read_unread_counts(
+    user_id: UUID, session: AsyncSession | None = None
+) -> dict[UUID, int]:
+    """Get unread counters of user chats having unread messages"""
+
+    async with use_session(session) as session:
+        stmt = (
+            select(UserChatModel.chat, unread_count())
+            .join(ChatModel, ChatModel.id == UserChatModel.chat)
+            .where(UserChatModel.user == user_id)
+            .where(ChatModel.message_count > UserChatModel.read_count)
+        )
+        result = await session.execute(stmt)
+        return {chat_id: count for chat_id, count in result.all()}
+
+
+read_receipts = ReadReceiptFlusher(redis_client)
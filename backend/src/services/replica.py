@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config import (
+    replica_engines,
+    READINESS_TIMEOUT,
+    REPLICA_SELECTION,
+    REPLICA_MAX_LAG,
+    REPLICA_CHECK_INTERVAL,
+)
+from src.logger import logger
+
+# Seconds a replica is behind, zero when it replayed all it received or
+# is not a replica at all. NULL when it is not streaming from primary
+# (received and replayed WAL then match however stale it is) or never
+# replayed anything, either makes it unavailable.
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+        WHEN pg_last_xact_replay_timestamp() IS NULL THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class ReplicaRouter:
+    """Pick a healthy read replica for read-only sessions
+
+    Replicas are checked periodically, one is healthy while it answers
+    within the readiness timeout and lags at most ``max_lag`` seconds.
+    Without a healthy replica reads go to primary.
+    """
+
+    def __init__(
+        self,
+        engines: List[AsyncEngine],
+        selection: str = REPLICA_SELECTION,
+        max_lag: float = REPLICA_MAX_LAG,
+        interval: float = REPLICA_CHECK_INTERVAL,
+        timeout: float = READINESS_TIMEOUT,
+    ) -> None:
+        self.engines = engines
+        self.selection = selection
+        self.max_lag = max_lag
+        self.interval = interval
+        self.timeout = timeout
+        self.healthy: List[AsyncEngine] = []
+        self.read_only = {
+            replica: replica.execution_options(postgresql_readonly=True)
+            for replica in engines
+        }
+        self.turn = itertools.count()
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Check replicas right away, then periodically"""
+
+        if not self.engines:
+            return
+        await self.check()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop checks and close replica connections"""
+
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for replica in self.engines:
+            await replica.dispose()
+
+    async def lag(self, replica: AsyncEngine) -> float | None:
+        """Replication lag in seconds, None when unreachable or unknown"""
+
+        try:
+            async with asyncio.timeout(self.timeout):
+                async with replica.connect() as conn:
+                    lag = await conn.scalar(REPLICA_LAG_QUERY)
+        except (SQLAlchemyError, OSError, TimeoutError) as exc:
+            logger.warning(
+                "Replica check failed",
+                replica=replica.url.host,
+                error=str(exc),
+            )
+            return None
+        return float(lag) if lag is not None else None
+
+    async def check(self) -> None:
+        """Update replicas eligible for reads"""
+
+        lags = await asyncio.gather(*map(self.lag, self.engines))
+        healthy = [
+            replica
+            for replica, lag in zip(self.engines, lags)
+            if lag is not None and lag <= self.max_lag
+        ]
+        if len(healthy) != len(self.healthy):
+            logger.info(
+                "Healthy replicas changed",
+                healthy=len(healthy),
+                replicas=len(self.engines),
+            )
+        self.healthy = healthy
+
+    def pick(self) -> AsyncEngine | None:
+        """Read-only engine of a healthy replica, None to use primary"""
+
+        healthy = self.healthy
+        if not healthy:
+            return None
+
+        # Rotating the start spreads ties of least connections too
+        start = next(self.turn) % len(healthy)
+        ordered = healthy[start:] + healthy[:start]
+        replica = ordered[0]
+        if self.selection == "least_connections":
+            replica = min(ordered, key=lambda e: e.pool.checkedout())
+        return self.read_only[replica]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+
+replica_router = ReplicaRouter(replica_engines)
@@ -0,0 +1,90 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import engine, db_session, RELEASE, REPLICA_STICKINESS
+from src.services.replica import replica_router
+
+# Requests of these methods do not write, their transactions are READ ONLY
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Set on writes, reads of the client go to primary while it lives
+PRIMARY_COOKIE = "read_primary"
+
+# Session info flag of sessions reading from a replica
+REPLICA_INFO = "replica"
+
+read_only_engine = engine.execution_options(postgresql_readonly=True)
+
+
+async def request_session(
+    request: Request, response: Response
+) -> AsyncIterator[AsyncSession]:
+    """Session shared by dependencies and services of one request
+
+    A connection is checked out on the first statement and returned when
+    its transaction ends, so a request runs one transaction unless a
+    service commits on the way. Uncommitted work is rolled back.
+
+    Reads go to a healthy replica, unless the client wrote within
+    REPLICA_STICKINESS seconds and could miss its own write there.
+    """
+
+    replica = None
+    if request.method not in READ_METHODS:
+        bind = engine
+        if replica_router.engines:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=REPLICA_STICKINESS,
+                httponly=True,
+                samesite="lax",
+                secure=RELEASE,
+            )
+    elif PRIMARY_COOKIE in request.cookies:
+        bind = read_only_engine
+    else:
+        replica = replica_router.pick()
+        bind = replica or read_only_engine
+
+    info = {REPLICA_INFO: replica is not None}
+    async with db_session(bind=bind, info=info) as session:
+        yield session
+
+
+@asynccontextmanager
+async def use_session(
+    session: AsyncSession | None,
+) -> AsyncIterator[AsyncSession]:
+    """Given request session, or a new one outside of requests"""
+
+    if session is not None:
+        yield session
+        return
+
+    async with db_session() as new_session:
+        yield new_session
+
+
+@asynccontextmanager
+async def primary_session(
+    session: AsyncSession | None,
+) -> AsyncIterator[AsyncSession]:
+    """Like ``use_session``, but on primary when the session reads from
+    a replica
+
+    Cache fills read through it. They are guarded by a version bumped on
+    writes, which a lagging replica may not show yet, so its rows would
+    be cached as current.
+    """
+
+    if session is None or not session.info.get(REPLICA_INFO):
+        async with use_session(session) as session:
+            yield session
+        return
+
+    async with db_session(bind=read_only_engine) as primary:
+        yield primary
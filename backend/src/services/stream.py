@@ -0,0 +1,212 @@
+import asyncio
+import zlib
+from uuid import UUID
+
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError
+
+from src.config import STREAM_SHARDS, STREAM_QUEUE_SIZE
+from src.logger import logger
+from src.redis_pool import redis_client
+
+CHANNEL_PREFIX = "chat:"
+USER_CHANNEL_PREFIX = "user:"
+
+# Published on user channel when the user joins or leaves chats
+MEMBERSHIP_CHANGED = "memberships"
+
+
+def chat_channel(chat_id: UUID) -> str:
+    """Redis channel carrying events of one chat"""
+
+    return f"{CHANNEL_PREFIX}{chat_id}"
+
+
+def user_channel(user_id: UUID) -> str:
+    """Redis channel telling streams of one user its chats changed"""
+
+    return f"{USER_CHANNEL_PREFIX}{user_id}"
+
+
+class Subscription:
+    """Events queue of one client connection"""
+
+    def __init__(self, user_id: UUID) -> None:
+        self.user_id = user_id
+        # Channels the connection listens to, user channel included
+        self.channels: set[str] = set()
+        self.queue: asyncio.Queue[str] = asyncio.Queue(STREAM_QUEUE_SIZE)
+        self.overflowed = False
+        # Set when chats of the user change, until resubscribed
+        self.changed = asyncio.Event()
+
+    def push(self, data: str) -> None:
+        """Queue event without blocking the dispatcher"""
+
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # Slow consumer: mark it so the connection is closed and the
+            # client re-syncs history instead of stalling everyone else
+            self.overflowed = True
+
+
+class _Shard:
+    """One Redis pubsub connection shared by many client connections"""
+
+    def __init__(self, client: Redis) -> None:
+        self.pubsub: PubSub = client.pubsub(ignore_subscribe_messages=True)
+        self.listeners: dict[str, set[Subscription]] = {}
+        self.subscribed = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    async def add(self, channel: str, subscription: Subscription) -> None:
+        """Attach connection to channel, subscribing on first listener"""
+
+        listeners = self.listeners.setdefault(channel, set())
+        listeners.add(subscription)
+        if len(listeners) == 1:
+            await self.pubsub.subscribe(channel)
+            self.subscribed.set()
+
+    async def remove(self, channel: str, subscription: Subscription) -> None:
+        """Detach connection, unsubscribing after last listener"""
+
+        listeners = self.listeners.get(channel)
+        if listeners is None:
+            return
+
+        listeners.discard(subscription)
+        if not listeners:
+            del self.listeners[channel]
+            await self.pubsub.unsubscribe(channel)
+            if not self.listeners:
+                self.subscribed.clear()
+
+    async def run(self) -> None:
+        """Read pubsub and fan events out to local connections"""
+
+        while True:
+            await self.subscribed.wait()
+            try:
+                message = await self.pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+            except RedisError as exc:
+                logger.warning("Stream pubsub read failed", error=str(exc))
+                await asyncio.sleep(1.0)
+                continue
+
+            if message is None or message["type"] != "message":
+                continue
+
+            channel = message["channel"]
+            control = channel.startswith(USER_CHANNEL_PREFIX)
+            for subscription in self.listeners.get(channel, ()):
+                if control:
+                    subscription.changed.set()
+                else:
+                    subscription.push(message["data"])
+
+
+class ChatBroker:
+    """Per-worker multiplexer of chat events over few Redis subscriptions"""
+
+    def __init__(self, client: Redis, shards: int = STREAM_SHARDS) -> None:
+        self.client = client
+        self.shards_count = max(shards, 1)
+        self.shards: list[_Shard] = []
+
+    async def start(self) -> None:
+        """Start shard readers"""
+
+        self.shards = [_Shard(self.client) for _ in range(self.shards_count)]
+        for shard in self.shards:
+            shard.task = asyncio.create_task(shard.run())
+
+    async def stop(self) -> None:
+        """Stop shard readers and return their connections to the pool"""
+
+        for shard in self.shards:
+            if shard.task is not None:
+                shard.task.cancel()
+            await shard.pubsub.aclose()
+        self.shards = []
+
+    def _shard(self, channel: str) -> _Shard:
+        return self.shards[zlib.crc32(channel.encode()) % len(self.shards)]
+
+    async def subscribe(self, user_id: UUID) -> Subscription:
+        """Subscribe client connection to membership changes of user,
+        chats are added by ``update`` once read
+
+        Subscribing first means no change made after the read is missed.
+        """
+
+        subscription = Subscription(user_id)
+        try:
+            await self.update(subscription, set())
+        except BaseException:
+            await self.unsubscribe(subscription)
+            raise
+        return subscription
+
+    async def update(
+        self, subscription: Subscription, chat_ids: set[UUID]
+    ) -> None:
+        """Make client connection follow exactly the given chats"""
+
+        wanted = {user_channel(subscription.user_id)}
+        wanted.update(chat_channel(chat_id) for chat_id in chat_ids)
+        for channel in wanted - subscription.channels:
+            # Recorded first, so unsubscribe releases a failed attempt
+            subscription.channels.add(channel)
+            await self._shard(channel).add(channel, subscription)
+        for channel in subscription.channels - wanted:
+            subscription.channels.discard(channel)
+            await self._shard(channel).remove(channel, subscription)
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        """Release all channels of client connection"""
+
+        while subscription.channels:
+            channel = subscription.channels.pop()
+            await self._shard(channel).remove(channel, subscription)
+
+    async def publish(self, chat_id: UUID, data: str) -> None:
+        """Publish pre-serialized event to every worker"""
+
+        try:
+            await self.client.publish(chat_channel(chat_id), data)
+        except RedisError as exc:
+            # Delivery is best effort, the message itself is already stored
+            logger.warning("Stream publish failed", error=str(exc))
+
+    async def membership_changed(self, user_ids: list[UUID]) -> None:
+        """Tell streams of given users to resubscribe to their chats"""
+
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.publish(user_channel(user_id), MEMBERSHIP_CHANGED)
+                await pipe.execute()
+        except RedisError as exc:
+            logger.warning("Stream publish failed", error=str(exc))
+
+    async def publish_many(self, events: list[tuple[UUID, str]]) -> None:
+        """Publish batch of (chat id, event) in one round trip"""
+
+        if not events:
+            return
+
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for chat_id, data in events:
+                    pipe.publish(chat_channel(chat_id), data)
+                await pipe.execute()
+        except RedisError as exc:
+            logger.warning("Stream publish failed", error=str(exc))
+
+
+broker = ChatBroker(redis_client)
@@ -0,0 +1,330 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple
+from uuid import UUID, uuid4
+
+import jwt
+from fastapi import HTTPException, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.config import (
+    ALGORITHM,
+    SECRET_KEY,
+    TOKEN_EXPIRE,
+    JWT_KEYS_FILE,
+    JWT_SIGNING_KEY,
+    TOKEN_CACHE_SIZE,
+    REVOCATION_SYNC_INTERVAL,
+    REVOCATION_FILTER_BITS,
+    REVOCATION_FILTER_HASHES,
+)
+from src.logger import logger
+from src.redis_pool import redis_client
+
+# Sorted set of revoked token ids scored by their expiry
+REVOKED_TOKENS_KEY = "tokens:revoked"
+
+
+class KeySet:
+    """Keys tokens are signed and verified with
+
+    Tokens name their key in the ``kid`` header. A key is rotated by
+    adding the new one to the set, signing with it once every worker
+    loaded the set, and dropping the old one after the longest token
+    lifetime. Tokens without ``kid`` are verified with the signing key.
+    """
+
+    def __init__(
+        self, path: str = JWT_KEYS_FILE, signing_kid: str = JWT_SIGNING_KEY
+    ) -> None:
+        # kid -> (verification key, algorithm)
+        self.keys: dict[str | None, tuple[Any, str]] = {}
+        self.signing_kid: str | None = None
+        self.signing: tuple[Any, str] = (SECRET_KEY, ALGORITHM)
+        if not path:
+            self.keys[None] = self.signing
+            return
+
+        with open(path) as file:
+            jwks = jwt.PyJWKSet.from_json(file.read())
+
+        signing_keys = {}
+        for jwk in jwks.keys:
+            if not jwk.key_id:
+                raise ValueError("Token key without kid")
+            key = jwk.key
+            if isinstance(key, bytes):
+                signing_keys[jwk.key_id] = (key, jwk.algorithm_name)
+            elif hasattr(key, "public_key"):
+                signing_keys[jwk.key_id] = (key, jwk.algorithm_name)
+                key = key.public_key()
+            self.keys[jwk.key_id] = (key, jwk.algorithm_name)
+
+        self.signing_kid = signing_kid or next(iter(signing_keys), None)
+        if self.signing_kid not in signing_keys:
+            raise ValueError(f"No private key to sign with: {signing_kid}")
+        self.signing = signing_keys[self.signing_kid]
+        self.keys[None] = self.keys[self.signing_kid]
+
+
+class VerifiedToken(NamedTuple):
+    """Claims of token with valid signature"""
+
+    user_id: UUID
+    jti: str
+    exp: float
+
+
+class TokenCache:
+    """Claims of verified tokens by token hash, least recently used ones
+    are dropped past ``size`` tokens
+
+    Entries are not trusted past the token expiry, so a cached token
+    never outlives its ``exp``.
+    """
+
+    def __init__(self, size: int = TOKEN_CACHE_SIZE) -> None:
+        self.size = size
+        self.tokens: OrderedDict[bytes, VerifiedToken] = OrderedDict()
+
+    def get(self, digest: bytes) -> VerifiedToken | None:
+        """Cached claims of token"""
+
+        claims = self.tokens.get(digest)
+        if claims is not None:
+            self.tokens.move_to_end(digest)
+        return claims
+
+    def put(self, digest: bytes, claims: VerifiedToken) -> None:
+        """Cache claims of verified token"""
+
+        if self.size <= 0:
+            return
+        self.tokens[digest] = claims
+        if len(self.tokens) > self.size:
+            self.tokens.popitem(last=False)
+
+    def discard(self, digest: bytes) -> None:
+        """Drop cached claims of token"""
+
+        self.tokens.pop(digest, None)
+
+    def clear(self) -> None:
+        """Drop all cached claims"""
+
+        self.tokens.clear()
+
+
+class BloomFilter:
+    """Set of strings answering "maybe" or "no", never a false "no" """
+
+    def __init__(self, bits: int, hashes: int) -> None:
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def _positions(self, item: str) -> list[int]:
+        # Double hashing derives all positions from one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * step) % self.bits for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.array[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevocationList:
+    """Revoked token ids in Redis, mirrored by a bloom filter per worker
+
+    Ids missing from the filter are not revoked, so most requests are
+    answered without Redis, only filter hits are confirmed there. The
+    filter is rebuilt every ``interval`` seconds, revocations made by
+    other workers take effect within that time.
+    """
+
+    def __init__(
+        self,
+        client: Redis,
+        interval: float = REVOCATION_SYNC_INTERVAL,
+        bits: int = REVOCATION_FILTER_BITS,
+        hashes: int = REVOCATION_FILTER_HASHES,
+    ) -> None:
+        self.client = client
+        self.interval = interval
+        self.bits = bits
+        self.hashes = hashes
+        self.filter = BloomFilter(bits, hashes)
+        # ids known to be revoked -> expiry, answered without Redis
+        self.revoked: dict[str, float] = {}
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Load revoked ids right away, then periodically"""
+
+        await self.sync()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop periodic sync"""
+
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def revoke(self, jti: str, exp: float) -> None:
+        """Revoke token id until the token expires"""
+
+        self.revoked[jti] = exp
+        self.filter.add(jti)
+        try:
+            await self.client.zadd(REVOKED_TOKENS_KEY, {jti: exp})
+        except RedisError as exc:
+            logger.warning("Token revocation failed", error=str(exc))
+
+    async def is_revoked(self, jti: str) -> bool:
+        """Whether token id is revoked
+
+        Without Redis filter hits count as revoked, as they most
+        likely are.
+        """
+
+        if not jti or jti not in self.filter:
+            return False
+        if jti in self.revoked:
+            return True
+
+        try:
+            exp = await self.client.zscore(REVOKED_TOKENS_KEY, jti)
+        except RedisError as exc:
+            logger.warning("Token revocation check failed", error=str(exc))
+            return True
+        if exp is None:
+            return False
+        self.revoked[jti] = exp
+        return True
+
+    async def sync(self) -> None:
+        """Drop expired revocations and rebuild filter from the rest"""
+
+        now = time.time()
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.zremrangebyscore(REVOKED_TOKENS_KEY, "-inf", now)
+                pipe.zrange(REVOKED_TOKENS_KEY, 0, -1)
+                _, revoked = await pipe.execute()
+        except RedisError as exc:
+            logger.warning("Token revocation sync failed", error=str(exc))
+            return
+
+        self.revoked = {
+            jti: exp for jti, exp in self.revoked.items() if exp > now
+        }
+        bloom = BloomFilter(self.bits, self.hashes)
+        # Ids known here stay in, even when their write to Redis failed
+        # or came after the read above
+        for jti in [*revoked, *self.revoked]:
+            bloom.add(jti)
+        self.filter = bloom
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sync()
+
+
+key_set = KeySet()
+token_cache = TokenCache()
+revocation_list = RevocationList(redis_client)
+
+
+def token_digest(token: str) -> bytes:
+    """Cache key of token"""
+
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def create_token(user_id: UUID, expire: float = TOKEN_EXPIRE) -> str:
+    """Create JWT-token"""
+
+    expire = datetime.now(timezone.utc) + timedelta(seconds=expire)
+    key, algorithm = key_set.signing
+    headers = {"kid": key_set.signing_kid} if key_set.signing_kid else None
+    return jwt.encode(
+        {"id": str(user_id), "exp": expire, "jti": uuid4().hex},
+        key,
+        algorithm=algorithm,
+        headers=headers,
+    )
+
+
+def verify_token(token: str) -> VerifiedToken:
+    """Claims of token, signature is verified once per worker"""
+
+    digest = token_digest(token)
+    claims = token_cache.get(digest)
+    if claims is None:
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key, algorithm = key_set.keys[kid]
+            payload = jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                options={"require": ["exp", "id"]},
+            )
+            claims = VerifiedToken(
+                UUID(payload["id"]), payload.get("jti", ""), payload["exp"]
+            )
+        except jwt.ExpiredSignatureError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token expired",
+            ) from exc
+        except (jwt.InvalidTokenError, KeyError, ValueError) as exc:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token",
+            ) from exc
+        token_cache.put(digest, claims)
+
+    if claims.exp <= time.time():
+        token_cache.discard(digest)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired"
+        )
+    return claims
+
+
+async def decode_token(token: str) -> UUID:
+    """Decode user data"""
+
+    claims = verify_token(token)
+    if await revocation_list.is_revoked(claims.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked"
+        )
+    return claims.user_id
+
+
+async def revoke_token(token: str) -> None:
+    """Revoke token until it expires, invalid ones are ignored"""
+
+    try:
+        claims = verify_token(token)
+    except HTTPException:
+        return
+    if claims.jti:
+        await revocation_list.revoke(claims.jti, claims.exp)
@@ -1,97 +1,106 @@
-from datetime import timedelta, datetime, timezone
+from typing import Literal
 from uuid import UUID
 
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-
-import jwt
 import pyotp
-from fastapi import HTTPException, Response, status, Depends
-from sqlalchemy import select, insert, update
+from fastapi import HTTPException, Request, Response, status, Depends
+from sqlalchemy import select, insert, update, func, or_, tuple_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+from redis.asyncio import Redis
 
 from src.config import (
-    db_session,
     api_key_cookie,
     refresh_api_key_cookie,
     RELEASE,
-    SECRET_KEY,
     TOKEN_EXPIRE,
-    ALGORITHM,
     APP_TITLE,
     TOKEN_KEY,
     REFRESH_TOKEN_EXPIRE,
-    MAIL_API_KEY,
-    MAIL_SENDER,
+    PASSWORD_TIME_COST,
+    PASSWORD_MEMORY_COST,
+    PASSWORD_PARALLELISM,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE,
+    USER_SEARCH_PAGE_SIZE,
 )
 from src.schemes.user import UserScheme, RegisterScheme
 from src.models import UserModel
+from src.services.mail import enqueue_mail
+from src.services.session import use_session
+from src.services.token import create_token, decode_token, revoke_token
+from src.utils import (
+    BoundedExecutor,
+    FORCE_CUSTOM_PLAN,
+    decode_text_cursor,
+    encode_text_cursor,
+    escape_like,
+)
 
-password_hash = PasswordHash.recommended()
+password_hash = PasswordHash(
+    (
+        Argon2Hasher(
+            time_cost=PASSWORD_TIME_COST,
+            memory_cost=PASSWORD_MEMORY_COST,
+            parallelism=PASSWORD_PARALLELISM,
+        ),
+    )
+)
+# Argon2 releases the GIL, so threads keep hashing off the event loop
+password_executor = BoundedExecutor(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, "argon2"
+)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify user password"""
 
-    return password_hash.verify(plain_password, hashed_password)
+    return await password_executor.run(
+        password_hash.verify, plain_password, hashed_password
+    )
 
 
-def get_password_hash(password: str) -> str:
+async def get_password_hash(password: str) -> str:
     """Hashing user password"""
 
-    return password_hash.hash(password)
-
+    return await password_executor.run(password_hash.hash, password)
 
-def create_token(user_id: UUID, expire: float = TOKEN_EXPIRE) -> str:
-    """Create JWT-token"""
 
-    expire = datetime.now(timezone.utc) + timedelta(seconds=expire)
-    return jwt.encode(
-        {"id": str(user_id), "exp": expire}, SECRET_KEY, algorithm=ALGORITHM
-    )
-
-
-def decode_token(token: str) -> UUID:
-    """Decode user data"""
-
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return UUID(payload.get("id"))
-    except jwt.ExpiredSignatureError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired"
-        ) from exc
-    except jwt.InvalidTokenError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
-        ) from exc
-
-
-def refresh_authenticated_user(
+async def refresh_authenticated_user(
     refresh_token: str = Depends(refresh_api_key_cookie),
 ) -> UUID:
     """Get authenticated user id from token"""
 
-    return decode_token(refresh_token)
+    return await decode_token(refresh_token)
 
 
-def authenticated_user(
-    refresh_token: str = Depends(api_key_cookie),
+async def authenticated_user(
+    request: Request,
+    token: str = Depends(api_key_cookie),
 ) -> UUID:
-    """Get authenticated user id from token"""
+    """Get authenticated user id from token
 
-    return decode_token(refresh_token)
+    Decoded id is kept on request state, so the token is verified once per
+    request whichever dependency or middleware asks first.
+    """
 
+    user_id = getattr(request.state, "user_id", None)
+    if user_id is None:
+        user_id = await decode_token(token)
+        request.state.user_id = user_id
+    return user_id
 
-async def create_user(user: RegisterScheme) -> UserModel:
+
+async def create_user(
+    user: RegisterScheme, session: AsyncSession | None = None
+) -> UserModel:
     """Create user instance"""
 
     user_dict = user.model_dump()
-    user_dict["password"] = get_password_hash(user_dict["password"])
+    user_dict["password"] = await get_password_hash(user_dict["password"])
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = insert(UserModel).values(**user_dict).returning(UserModel)
         try:
             result = await session.execute(stmt)
@@ -106,10 +115,12 @@ async def create_user(user: RegisterScheme) -> UserModel:
     return user_instance
 
 
-async def get_user(user_id: UUID) -> UserModel:
+async def get_user(
+    user_id: UUID, session: AsyncSession | None = None
+) -> UserModel:
     """Get user instance"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             select(UserModel)
             .where(UserModel.id == user_id)
@@ -125,16 +136,20 @@ async def get_user(user_id: UUID) -> UserModel:
     return user
 
 
-async def user_login(email: str, password: str) -> UserModel:
+async def user_login(
+    email: str, password: str, session: AsyncSession | None = None
+) -> UserModel:
     """Login user"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             select(UserModel)
             .where(UserModel.email == email)
             .where(UserModel.is_active)
         )
         user = await session.scalar(stmt)
+        # Return the connection before the password is hashed
+        await session.commit()
 
     if user is None:
         raise HTTPException(
@@ -142,7 +157,7 @@ async def user_login(email: str, password: str) -> UserModel:
             detail="Invalid credentials",
         )
 
-    if not verify_password(password, user.password):
+    if not await verify_password(password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -206,14 +221,25 @@ def delete_auth_cookie(response: Response) -> None:
     response.delete_cookie(key=f"{TOKEN_KEY}_refresh")
 
 
-async def enable_2fa(user_id: UUID) -> str:
+async def revoke_auth_cookies(request: Request) -> None:
+    """Revoke access and refresh tokens sent with request"""
+
+    for key in (TOKEN_KEY, f"{TOKEN_KEY}_refresh"):
+        if key in request.cookies:
+            await revoke_token(request.cookies[key])
+
+
+async def enable_2fa(
+    user_id: UUID, session: AsyncSession | None = None
+) -> str:
     """Enable 2FA for user"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             update(UserModel)
             .where(UserModel.id == user_id)
             .values(is_2fa_enabled=True, otp_secret=pyotp.random_base32())
+            .returning(UserModel)
         )
         result = await session.execute(stmt)
         await session.commit()
@@ -225,10 +251,12 @@ async def enable_2fa(user_id: UUID) -> str:
     return otp_uri
 
 
-async def validate_2fa(user_id: UUID, code: str) -> UserModel:
+async def validate_2fa(
+    user_id: UUID, code: str, session: AsyncSession | None = None
+) -> UserModel:
     """Verify 2FA code"""
 
-    user = await get_user(user_id)
+    user = await get_user(user_id, session)
     if not user.is_2fa_enabled or not user.otp_secret:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="2FA is not enabled"
@@ -243,26 +271,72 @@ async def validate_2fa(user_id: UUID, code: str) -> UserModel:
     return user
 
 
-async def search_users(email_contains: str) -> list[UserModel]:
-    """Search users by email substring"""
+# Trigrams need at least three characters to narrow anything down
+SUBSTRING_MIN_LENGTH = 3
 
-    async with db_session() as session:
-        stmt = (
-            select(UserModel)
-            .where(UserModel.email.contains(email_contains))
-            .where(UserModel.is_active)
+
+async def search_users(
+    query: str,
+    mode: Literal["prefix", "substring"] = "prefix",
+    after: str | None = None,
+    limit: int = USER_SEARCH_PAGE_SIZE,
+    session: AsyncSession | None = None,
+) -> tuple[list[UserModel], str | None]:
+    """Search active users by email, first or last name, ordered by email
+
+    Prefix mode matches the start of any field through btree indexes on
+    lowercased fields, cheap enough for every keystroke. Substring mode
+    uses the trigram index on ``search_key`` when pg_trgm is installed.
+    """
+
+    query = query.strip().lower()
+    if mode == "substring" and len(query) >= SUBSTRING_MIN_LENGTH:
+        condition = UserModel.search_key.like(
+            f"%{escape_like(query)}%", escape="\\"
+        )
+    else:
+        pattern = f"{escape_like(query)}%"
+        condition = or_(
+            func.lower(UserModel.email).like(pattern, escape="\\"),
+            func.lower(UserModel.first_name).like(pattern, escape="\\"),
+            func.lower(UserModel.last_name).like(pattern, escape="\\"),
+        )
+
+    stmt = (
+        select(UserModel)
+        .where(condition)
+        .where(UserModel.is_active)
+        .order_by(UserModel.email, UserModel.id)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        stmt = stmt.where(
+            tuple_(UserModel.email, UserModel.id)
+            > tuple_(*decode_text_cursor(after))
         )
+
+    async with use_session(session) as session:
+        # LIKE prefix becomes an index range only for a known pattern
+        await session.execute(FORCE_CUSTOM_PLAN)
         result = await session.scalars(stmt)
-        return result.all()
+        users = list(result.all())
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_text_cursor(users[-1].email, users[-1].id)
+
+    return users, next_cursor
 
 
 async def update_user(
     user_id: UUID,
     user: UserScheme,
+    session: AsyncSession | None = None,
 ) -> UserModel:
     """Update user information"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             update(UserModel)
             .where(UserModel.id == user_id)
@@ -277,43 +351,59 @@ async def update_user(
     return user_instance
 
 
-async def delete_user(user_id: UUID) -> None:
+async def delete_user(
+    user_id: UUID, session: AsyncSession | None = None
+) -> None:
     """Soft delete user"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             update(UserModel)
             .where(UserModel.id == user_id)
             .values(is_active=False)
         )
-        session.execute(stmt)
+        await session.execute(stmt)
         await session.commit()
 
 
-async def reset_password(user_id: UUID, old: str, new: str) -> None:
+async def reset_password(
+    user_id: UUID,
+    old: str,
+    new: str,
+    session: AsyncSession | None = None,
+) -> None:
     """Reset user password"""
 
-    user_model = await get_user(user_id)
-    if not verify_password(old, user_model.password):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid password",
-        )
+    async with use_session(session) as session:
+        user_model = await get_user(user_id, session)
+        # Return the connection while passwords are hashed
+        await session.commit()
+
+        if not await verify_password(old, user_model.password):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid password",
+            )
 
-    async with db_session() as session:
+        new_hash = await get_password_hash(new)
         stmt = (
             update(UserModel)
             .where(UserModel.id == user_id)
-            .values(password=get_password_hash(new))
+            .values(password=new_hash)
         )
         await session.execute(stmt)
         await session.commit()
 
 
-async def forgot_password(email: str, redirect_url: str) -> None:
+async def forgot_password(
+    email: str,
+    redirect_url: str,
+    redis: Redis,
+    session: AsyncSession | None = None,
+) -> None:
     """Send mail to user for new password"""
 
-    async with db_session() as session:
+    async with use_session(session) as session:
         stmt = (
             select(UserModel)
             .where(UserModel.email == email)
@@ -327,23 +417,14 @@ async def forgot_password(email: str, redirect_url: str) -> None:
             detail="Invalid email",
         )
 
-    send_mail(user_model, redirect_url)
+    await send_mail(user_model, redirect_url, redis)
 
 
-def send_mail(user: UserModel, redirect_url: str) -> None:
-    """Send mail to user"""
+async def send_mail(
+    user: UserModel, redirect_url: str, redis: Redis
+) -> None:
+    """Queue password reset mail to user"""
 
     token = create_token(user.id)
-
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "Chat: Forgot password"
-    message["From"] = MAIL_SENDER
-    message["To"] = user.email
-
     text = f"Link to new password: {redirect_url}?token={token}"
-    message.attach(MIMEText(text, "plain"))
-
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(MAIL_SENDER, MAIL_API_KEY)
-        server.send_message(message)
+    await enqueue_mail(user.email, "Chat: Forgot password", text, redis)
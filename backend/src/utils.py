@@ -1,5 +1,240 @@
+import asyncio
+import base64
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, TypeVar
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+
+T = TypeVar("T")
+
+# Planning with actual parameter values, for queries whose best plan
+# depends on them (LIKE prefixes, frequency of searched words)
+FORCE_CUSTOM_PLAN = text("SET LOCAL plan_cache_mode = force_custom_plan")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Last UUIDv7 timestamp (ms) and counter handed out by this process
+_uuid7_state = (0, 0)
+
+
 def to_camel(string: str) -> str:
     """Convert snake_case to camelCase"""
 
     parts = string.split("_")
     return parts[0] + "".join(word.capitalize() for word in parts[1:])
+
+
+def to_micros(moment: datetime) -> int:
+    """Exact microseconds since epoch"""
+
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    """Datetime from microseconds since epoch"""
+
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def uuid7(
+    moment: datetime | None = None,
+    randbits: Callable[[int], int] = secrets.randbits,
+) -> UUID:
+    """Time-ordered UUID (RFC 9562 version 7)
+
+    Millisecond timestamp comes first, so new rows append to the right
+    edge of primary key B-trees instead of splitting random pages. Keys
+    generated for the current time also increase within a millisecond.
+    """
+
+    global _uuid7_state
+
+    if moment is None:
+        millis = time.time_ns() // 1_000_000
+        last_millis, last_counter = _uuid7_state
+        if millis <= last_millis:
+            # Same millisecond or clock stepped back, keep counting up
+            millis, counter = last_millis, last_counter + 1
+            if counter > 0xFFF:
+                millis, counter = millis + 1, 0
+        else:
+            # Random start, half of the range left for counting
+            counter = randbits(11)
+        _uuid7_state = (millis, counter)
+    else:
+        millis = (moment - EPOCH) // timedelta(milliseconds=1)
+        counter = randbits(12)
+
+    return UUID(
+        int=(millis & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | counter << 64
+        | 0b10 << 62
+        | randbits(62)
+    )
+
+
+def uuid7_time(value: UUID) -> datetime | None:
+    """Creation time encoded in UUIDv7, None for other versions"""
+
+    if value.version != 7:
+        return None
+    return EPOCH + timedelta(milliseconds=value.int >> 80)
+
+
+def pack_cursor(*parts: str) -> str:
+    """Pack keyset position into opaque cursor"""
+
+    raw = "|".join(parts).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def unpack_cursor(cursor: str, count: int) -> list[str]:
+    """Unpack opaque cursor into keyset position parts"""
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        ) from exc
+
+    # Last part is always row id, earlier ones may contain separator
+    parts = raw.rsplit("|", count - 1)
+    if len(parts) != count:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return parts
+
+
+def decode_position(cursor: str, parse: Callable[[str], T]) -> tuple[T, UUID]:
+    """Decode cursor into (sort key, row id) parsing key with given type"""
+
+    key, row_id = unpack_cursor(cursor, 2)
+    try:
+        return parse(key), UUID(row_id)
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        ) from exc
+
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    """Encode keyset position into opaque cursor"""
+
+    return pack_cursor(created_at.isoformat(), str(row_id))
+
+
+def parse_aware_datetime(value: str) -> datetime:
+    """ISO timestamp with offset, naive ones do not compare with
+    timestamptz columns"""
+
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        raise ValueError(f"Timestamp without offset: {value}")
+    return moment
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """Decode opaque cursor into keyset position"""
+
+    return decode_position(cursor, parse_aware_datetime)
+
+
+def encode_rank_cursor(rank: float, row_id: UUID) -> str:
+    """Encode position in ranked results into opaque cursor"""
+
+    return pack_cursor(repr(rank), str(row_id))
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, UUID]:
+    """Decode opaque cursor into position in ranked results"""
+
+    return decode_position(cursor, float)
+
+
+def encode_text_cursor(key: str, row_id: UUID) -> str:
+    """Encode position in results sorted by text into opaque cursor"""
+
+    return pack_cursor(key, str(row_id))
+
+
+def decode_text_cursor(cursor: str) -> tuple[str, UUID]:
+    """Decode opaque cursor into position in results sorted by text"""
+
+    return decode_position(cursor, str)
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards, so value is matched literally"""
+
+    return (
+        value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    )
+
+
+class CheckoutStats:
+    """Counters of connection pool checkouts"""
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float) -> None:
+        """Account one successful checkout"""
+
+        self.checkouts += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def snapshot(self) -> dict:
+        """Current counters"""
+
+        return {
+            "checkouts": self.checkouts,
+            "checkout_timeouts": self.timeouts,
+            "checkout_wait_total": self.wait_total,
+            "checkout_wait_max": self.wait_max,
+        }
+
+
+class BoundedExecutor:
+    """Thread pool with limited backlog that rejects work when saturated"""
+
+    def __init__(self, workers: int, queue_size: int, name: str) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=name
+        )
+        self.limit = workers + queue_size
+        self.pending = 0
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Run blocking call in pool, 429 if backlog is full"""
+
+        if self.pending >= self.limit:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        """Stop worker threads"""
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
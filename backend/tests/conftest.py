@@ -2,11 +2,15 @@ from typing import Generator, Any
 
 import pytest
 from fastapi.testclient import TestClient
+from redis import Redis
+from sqlalchemy import event
 
 from src.main import app
-from src.config import TOKEN_KEY, MAIL_SENDER
+from src.migrate import migrate
+from src.config import TOKEN_KEY, MAIL_SENDER, REDIS_URL, engine
 from src.schemes.user import AuthenticatedUser
 from src.schemes.chat import ChatScheme
+from src.services.rate_limit import RATE_LIMIT_PREFIX, rate_limiter
 
 
 FIRST_NAME = "Name"
@@ -15,10 +19,37 @@ EMAIL = MAIL_SENDER
 PASSWORD = "pass"
 
 
+@pytest.fixture(scope="session", autouse=True)
+def queries() -> Generator[dict[str, tuple], Any, None]:
+    """Collect distinct statements run by the app, with sample parameters"""
+
+    statements: dict[str, tuple] = {}
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.setdefault(statement, parameters)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", collect)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", collect)
+
+
+@pytest.fixture(autouse=True)
+def rate_limits() -> None:
+    """Start every test with fresh rate limit counters"""
+
+    with Redis.from_url(REDIS_URL) as redis:
+        keys = list(redis.scan_iter(f"{RATE_LIMIT_PREFIX}*"))
+        if keys:
+            redis.delete(*keys)
+    rate_limiter.local.clear()
+
+
 @pytest.fixture(scope="session")
 def client() -> Generator[TestClient, Any, None]:
     """Get FastAPI app"""
 
+    migrate()
     with TestClient(app) as client:
         yield client
 
@@ -67,4 +98,4 @@ def chat(client: TestClient, token: str) -> ChatScheme:
     """Get chat"""
 
     response = client.get("/chat", cookies={TOKEN_KEY: token})
-    return ChatScheme.model_validate(response.json()[0])
+    return ChatScheme.model_validate(response.json()["items"][0])
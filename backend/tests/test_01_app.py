@@ -7,3 +7,50 @@ def test_health(client: TestClient):
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == "OK"
+
+
+def test_pools_metrics(client: TestClient):
+    """Test connection pools usage view"""
+
+    response = client.get("/metrics/pools")
+    response_json = response.json()
+
+    assert response.status_code == 200
+    assert response_json["database"]["checkouts"] >= 1
+    assert "checked_out" in response_json["database"]
+    assert "in_use" in response_json["redis"]
+
+
+def test_prometheus_metrics(client: TestClient):
+    """Test Prometheus metrics exposition"""
+
+    client.get("/metrics/pools")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/metrics/pools"' in response.text
+    assert "http_request_db_queries_bucket" in response.text
+    assert "database_pool_checked_out" in response.text
+
+
+def test_liveness(client: TestClient):
+    """Test liveness probe"""
+
+    response = client.get("/health/live")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
+def test_readiness(client: TestClient):
+    """Test readiness probe with dependencies checks"""
+
+    response = client.get("/health/ready")
+    response_json = response.json()
+
+    assert response.status_code == 200
+    assert response_json["status"] == "ready"
+    assert all(response_json["checks"].values())
+    assert "checked_out" in response_json["pools"]["database"]
+    assert "in_use" in response_json["pools"]["redis"]
@@ -23,8 +23,10 @@ def test_read_me(client: TestClient, token: str):
 def test_search_user(client: TestClient, token: str):
     """Test search users"""
 
-    response = client.get("/user", cookies={TOKEN_KEY: token})
-    response_json = response.json()[0]
+    response = client.get(
+        "/user", params={"q": EMAIL[:3]}, cookies={TOKEN_KEY: token}
+    )
+    response_json = response.json()["items"][0]
 
     assert response.status_code == 200
     assert response_json["firstName"] == FIRST_NAME
@@ -32,6 +34,41 @@ def test_search_user(client: TestClient, token: str):
     assert response_json["email"] == EMAIL
 
 
+def test_search_user_modes(client: TestClient, token: str):
+    """Test prefix and substring user search over names and email"""
+
+    response = client.get(
+        "/user",
+        params={"q": LAST_NAME[:4].lower()},
+        cookies={TOKEN_KEY: token},
+    )
+    assert [u["email"] for u in response.json()["items"]] == [EMAIL]
+
+    response = client.get(
+        "/user",
+        params={"q": EMAIL[2:-2], "mode": "substring"},
+        cookies={TOKEN_KEY: token},
+    )
+    assert [u["email"] for u in response.json()["items"]] == [EMAIL]
+
+    response = client.get(
+        "/user",
+        params={"q": EMAIL[2:-2]},
+        cookies={TOKEN_KEY: token},
+    )
+    assert response.json()["items"] == []
+
+    response = client.get(
+        "/user",
+        params={"q": "%", "mode": "substring"},
+        cookies={TOKEN_KEY: token},
+    )
+    assert response.json()["items"] == []
+
+    response = client.get("/user", cookies={TOKEN_KEY: token})
+    assert response.status_code == 422
+
+
 def test_update_user(client: TestClient, token: str):
     """Test update users"""
 
@@ -1,6 +1,13 @@
+from uuid import UUID
+
 from fastapi.testclient import TestClient
+from redis import Redis
+
 from src.schemes.chat import ChatScheme
-from src.config import TOKEN_KEY
+from src.schemes.user import AuthenticatedUser
+from src.config import TOKEN_KEY, REDIS_URL
+from src.redis_pool import redis_client
+from src.services import chat as chat_service
 
 
 def test_create_chat(client: TestClient, token: str):
@@ -53,10 +60,12 @@ def test_read_chats(client: TestClient, token: str, chat: ChatScheme):
 
     response = client.get("/chat", cookies={TOKEN_KEY: token})
 
-    response_json = response.json()[0]
+    response_json = response.json()["items"][0]
     assert response.status_code == 200
     assert response_json["id"] == str(chat.id)
     assert response_json["name"] == "Chat updated name"
+    assert response_json["unreadCount"] == 0
+    assert len(response_json["participants"]) >= 1
 
 
 def test_delete_chat(client: TestClient, token: str, chat: ChatScheme):
@@ -64,3 +73,62 @@ def test_delete_chat(client: TestClient, token: str, chat: ChatScheme):
 
     response = client.delete(f"/chat/{chat.id}", cookies={TOKEN_KEY: token})
     assert response.status_code == 204
+
+
+def test_deleted_chat_forbidden(client: TestClient, token: str):
+    """Test access to deleted chat is revoked"""
+
+    response = client.post(
+        "/chat",
+        json={"participants": [], "chat": {"name": "Short-lived chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+
+    response = client.get(f"/chat/{chat_id}", cookies={TOKEN_KEY: token})
+    assert response.status_code == 200
+
+    client.delete(f"/chat/{chat_id}", cookies={TOKEN_KEY: token})
+
+    response = client.get(f"/chat/{chat_id}", cookies={TOKEN_KEY: token})
+    assert response.status_code == 403
+
+
+def test_membership_fill_after_change(
+    client: TestClient, token: str, user: AuthenticatedUser, monkeypatch
+):
+    """Test memberships read before a change are not cached after it"""
+
+    response = client.post(
+        "/chat",
+        json={"participants": [], "chat": {"name": "Cached chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = UUID(response.json()["id"])
+    read_chat_ids = chat_service.read_chat_ids
+
+    async def changed_meanwhile(user_id: UUID, session=None) -> set[UUID]:
+        chat_ids = await read_chat_ids(user_id, session)
+        # As if the user left a chat right after the read
+        await chat_service.invalidate_membership([user_id], redis_client)
+        return chat_ids
+
+    def allowed() -> set[UUID]:
+        return client.portal.call(
+            chat_service.allowed_chats, user.id, {chat_id}, redis_client
+        )
+
+    with Redis.from_url(REDIS_URL) as redis:
+        key = chat_service.membership_key(user.id)
+        client.portal.call(
+            chat_service.invalidate_membership, [user.id], redis_client
+        )
+        monkeypatch.setattr(chat_service, "read_chat_ids", changed_meanwhile)
+        assert allowed() == {chat_id}
+        assert not redis.exists(key)
+
+        monkeypatch.undo()
+        assert allowed() == {chat_id}
+        assert redis.exists(key)
+
+    client.delete(f"/chat/{chat_id}", cookies={TOKEN_KEY: token})
@@ -0,0 +1,683 @@
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from uuid import UUID
+
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import insert, text
+from src.schemes.chat import ChatScheme
+from src.schemes.user import AuthenticatedUser
+from src.config import TOKEN_KEY, db_session
+from src.utils import pack_cursor, uuid7
+from src.models import MessageModel
+from src.redis_pool import redis_client
+from src.services.chat import invalidate_membership
+from src.services.message import record_chat_activity
+from src.services.receipt import read_receipts
+from src.services.stream import broker, chat_channel
+from src.services.partition import (
+    create_partitions,
+    expire_chat_messages,
+    expire_partitions,
+    partition_name,
+    period_start,
+)
+
+
+def test_create_message(client: TestClient, token: str):
+    """Test create chat messages"""
+
+    response = client.post(
+        "/chat",
+        json={"participants": [], "chat": {"name": "Message chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+
+    for i in range(5):
+        response = client.post(
+            f"/chat/{chat_id}/message",
+            json={"text": f"Message {i}"},
+            cookies={TOKEN_KEY: token},
+        )
+        assert response.status_code == 200
+        assert response.json()["text"] == f"Message {i}"
+        # Time-ordered ids keep primary key inserts on the right edge
+        assert uuid.UUID(response.json()["id"]).version == 7
+
+
+def test_read_messages_page(client: TestClient, token: str, chat: ChatScheme):
+    """Test keyset pagination of chat messages"""
+
+    response = client.get(
+        f"/chat/{chat.id}/message",
+        params={"limit": 2},
+        cookies={TOKEN_KEY: token},
+    )
+    first_page = response.json()
+
+    assert response.status_code == 200
+    assert [m["text"] for m in first_page["items"]] == [
+        "Message 4",
+        "Message 3",
+    ]
+    assert first_page["nextCursor"] is not None
+
+    response = client.get(
+        f"/chat/{chat.id}/message",
+        params={"limit": 10, "before": first_page["nextCursor"]},
+        cookies={TOKEN_KEY: token},
+    )
+    second_page = response.json()
+
+    assert response.status_code == 200
+    assert [m["text"] for m in second_page["items"]] == [
+        "Message 2",
+        "Message 1",
+        "Message 0",
+    ]
+    assert second_page["nextCursor"] is None
+
+
+def test_read_messages_invalid_cursor(
+    client: TestClient, token: str, chat: ChatScheme
+):
+    """Test reading messages with malformed cursor"""
+
+    response = client.get(
+        f"/chat/{chat.id}/message",
+        params={"before": "not-a-cursor"},
+        cookies={TOKEN_KEY: token},
+    )
+
+    assert response.status_code == 400
+
+    # Well formed, but its timestamp has no offset
+    naive = pack_cursor("2026-01-01T00:00:00", str(uuid.uuid4()))
+    response = client.get(
+        f"/chat/{chat.id}/message",
+        params={"before": naive},
+        cookies={TOKEN_KEY: token},
+    )
+
+    assert response.status_code == 400
+
+
+def test_read_chats_preview(client: TestClient, token: str, chat: ChatScheme):
+    """Test chat list is ordered by activity and shows last message"""
+
+    client.post(
+        "/chat",
+        json={"participants": [], "chat": {"name": "Quiet chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    client.post(
+        f"/chat/{chat.id}/message",
+        json={"text": "Latest message"},
+        cookies={TOKEN_KEY: token},
+    )
+
+    response = client.get(
+        "/chat", params={"limit": 1}, cookies={TOKEN_KEY: token}
+    )
+    page = response.json()
+
+    assert response.status_code == 200
+    assert page["items"][0]["id"] == str(chat.id)
+    assert page["items"][0]["lastMessage"]["text"] == "Latest message"
+    assert page["nextCursor"] is not None
+
+    response = client.get(
+        "/chat",
+        params={"limit": 1, "before": page["nextCursor"]},
+        cookies={TOKEN_KEY: token},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["items"][0]["name"] == "Quiet chat"
+    assert response.json()["items"][0]["lastMessage"] is None
+
+
+def test_stream_message(client: TestClient, token: str, chat: ChatScheme):
+    """Test realtime message event delivery"""
+
+    with client.websocket_connect(
+        "/stream", headers={"cookie": f"{TOKEN_KEY}={token}"}
+    ) as websocket:
+        client.post(
+            f"/chat/{chat.id}/message",
+            json={"text": "Streamed"},
+            cookies={TOKEN_KEY: token},
+        )
+        event = websocket.receive_json()
+
+    assert event["type"] == "created"
+    assert event["chatId"] == str(chat.id)
+    assert event["message"]["text"] == "Streamed"
+
+
+def test_stream_follows_memberships(client: TestClient, token: str):
+    """Test open streams pick up chats joined after connecting"""
+
+    with client.websocket_connect(
+        "/stream", headers={"cookie": f"{TOKEN_KEY}={token}"}
+    ) as websocket:
+        response = client.post(
+            "/chat",
+            json={"participants": [], "chat": {"name": "Joined chat"}},
+            cookies={TOKEN_KEY: token},
+        )
+        chat_id = response.json()["id"]
+        channel = chat_channel(UUID(chat_id))
+        deadline = time.monotonic() + 5
+        while not broker._shard(channel).listeners.get(channel):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        client.post(
+            f"/chat/{chat_id}/message",
+            json={"text": "Joined"},
+            cookies={TOKEN_KEY: token},
+        )
+        event = websocket.receive_json()
+
+    client.delete(f"/chat/{chat_id}", cookies={TOKEN_KEY: token})
+    assert event["chatId"] == chat_id
+    assert event["message"]["text"] == "Joined"
+
+
+def test_unread_counters(client: TestClient, token: str):
+    """Test unread counters follow messages and read receipts"""
+
+    response = client.post(
+        "/auth/register",
+        json={"email": "reader@example.com", "password": "pass"},
+    )
+    reader = response.json()["id"]
+    reader_token = response.cookies[TOKEN_KEY]
+
+    response = client.post(
+        "/chat",
+        json={"participants": [reader], "chat": {"name": "Unread chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+
+    messages = [
+        client.post(
+            f"/chat/{chat_id}/message",
+            json={"text": f"Unread {i}"},
+            cookies={TOKEN_KEY: token},
+        ).json()
+        for i in range(3)
+    ]
+
+    response = client.get("/chat/unread", cookies={TOKEN_KEY: reader_token})
+    assert response.status_code == 200
+    assert response.json() == {"total": 3, "chats": {chat_id: 3}}
+
+    response = client.post(
+        f"/chat/{chat_id}/read",
+        json={"lastReadAt": messages[1]["createdAt"]},
+        cookies={TOKEN_KEY: reader_token},
+    )
+    assert response.status_code == 202
+
+    # Pointer is written by background flush
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        response = client.get(
+            "/chat/unread", cookies={TOKEN_KEY: reader_token}
+        )
+        if response.json()["total"] == 1:
+            break
+        time.sleep(0.2)
+    assert response.json() == {"total": 1, "chats": {chat_id: 1}}
+
+    # Deleting an unread message takes it off the counter
+    retracted = client.post(
+        f"/chat/{chat_id}/message",
+        json={"text": "Retracted"},
+        cookies={TOKEN_KEY: token},
+    ).json()
+    response = client.get("/chat/unread", cookies={TOKEN_KEY: reader_token})
+    assert response.json() == {"total": 2, "chats": {chat_id: 2}}
+    client.delete(
+        f"/chat/{chat_id}/message/{retracted['id']}",
+        cookies={TOKEN_KEY: token},
+    )
+    response = client.get("/chat/unread", cookies={TOKEN_KEY: reader_token})
+    assert response.json() == {"total": 1, "chats": {chat_id: 1}}
+
+    response = client.get("/chat/unread", cookies={TOKEN_KEY: token})
+    assert chat_id not in response.json()["chats"]
+
+
+def test_read_pointer_without_redis(
+    client: TestClient, token: str, monkeypatch
+):
+    """Test read pointers are written directly while Redis is down"""
+
+    response = client.post(
+        "/auth/register",
+        json={"email": "offline.reader@example.com", "password": "pass"},
+    )
+    reader = response.json()["id"]
+    reader_token = response.cookies[TOKEN_KEY]
+    response = client.post(
+        "/chat",
+        json={"participants": [reader], "chat": {"name": "Offline chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+    messages = [
+        client.post(
+            f"/chat/{chat_id}/message",
+            json={"text": f"Offline {i}"},
+            cookies={TOKEN_KEY: token},
+        ).json()
+        for i in range(2)
+    ]
+
+    async def unavailable(*args, **kwargs):
+        raise RedisConnectionError("Redis is down")
+
+    monkeypatch.setattr(read_receipts, "advance_script", unavailable)
+    response = client.post(
+        f"/chat/{chat_id}/read",
+        json={"lastReadAt": messages[0]["createdAt"]},
+        cookies={TOKEN_KEY: reader_token},
+    )
+    assert response.status_code == 202
+
+    # No flush to wait for
+    response = client.get("/chat/unread", cookies={TOKEN_KEY: reader_token})
+    assert response.json() == {"total": 1, "chats": {chat_id: 1}}
+    client.delete(f"/chat/{chat_id}", cookies={TOKEN_KEY: token})
+
+
+def test_search_messages(client: TestClient, token: str, chat: ChatScheme):
+    """Test full-text search in chat and across user chats"""
+
+    response = client.get(
+        f"/chat/{chat.id}/message/search",
+        params={"q": "unread", "limit": 2},
+        cookies={TOKEN_KEY: token},
+    )
+    first_page = response.json()
+
+    assert response.status_code == 200
+    assert len(first_page["items"]) == 2
+    assert first_page["nextCursor"] is not None
+
+    response = client.get(
+        f"/chat/{chat.id}/message/search",
+        params={"q": "unread", "before": first_page["nextCursor"]},
+        cookies={TOKEN_KEY: token},
+    )
+    texts = [hit["text"] for hit in first_page["items"]]
+    texts += [hit["text"] for hit in response.json()["items"]]
+
+    assert sorted(texts) == ["Unread 0", "Unread 1", "Unread 2"]
+    assert response.json()["nextCursor"] is None
+
+    response = client.get(
+        "/message/search",
+        params={"q": "latest"},
+        cookies={TOKEN_KEY: token},
+    )
+    hits = response.json()["items"]
+
+    assert response.status_code == 200
+    assert [hit["text"] for hit in hits] == ["Latest message"]
+    assert hits[0]["headline"] == "<mark>Latest</mark> message"
+
+
+def test_create_messages_batch(
+    client: TestClient, token: str, chat: ChatScheme
+):
+    """Test batch ingestion with per-item results and idempotency"""
+
+    batch = {
+        "items": [
+            {
+                "chatId": str(chat.id),
+                "text": "Batch 0",
+                "idempotencyKey": "b0",
+            },
+            {"chatId": str(uuid.uuid4()), "text": "Elsewhere"},
+            {"chatId": str(chat.id), "text": "Batch 1"},
+        ]
+    }
+    response = client.post(
+        "/message/batch", json=batch, cookies={TOKEN_KEY: token}
+    )
+    results = response.json()["items"]
+
+    assert response.status_code == 200
+    assert [r["status"] for r in results] == [
+        "created",
+        "forbidden",
+        "created",
+    ]
+    first_id = results[0]["message"]["id"]
+
+    response = client.post(
+        "/message/batch",
+        json={"items": batch["items"][:1]},
+        cookies={TOKEN_KEY: token},
+    )
+    retried = response.json()["items"][0]
+
+    assert retried["status"] == "duplicate"
+    assert retried["message"]["id"] == first_id
+
+    response = client.get(
+        f"/chat/{chat.id}/message",
+        params={"limit": 2},
+        cookies={TOKEN_KEY: token},
+    )
+    assert [m["text"] for m in response.json()["items"]] == [
+        "Batch 1",
+        "Batch 0",
+    ]
+
+
+def test_create_message_buffered(
+    client: TestClient, token: str, chat: ChatScheme, monkeypatch
+):
+    """Test messages sent through the group-committing writer"""
+
+    monkeypatch.setattr(
+        "src.services.message.MESSAGE_WRITE_MODE", "buffered"
+    )
+
+    for i in range(3):
+        response = client.post(
+            f"/chat/{chat.id}/message",
+            json={"text": f"Buffered {i}"},
+            cookies={TOKEN_KEY: token},
+        )
+        assert response.status_code == 200
+        assert response.json()["text"] == f"Buffered {i}"
+
+    # Acknowledged after commit, so readable right away
+    response = client.get(
+        f"/chat/{chat.id}/message",
+        params={"limit": 3},
+        cookies={TOKEN_KEY: token},
+    )
+    assert [m["text"] for m in response.json()["items"]] == [
+        "Buffered 2",
+        "Buffered 1",
+        "Buffered 0",
+    ]
+
+
+def cache_hits(client: TestClient) -> float:
+    """Chat history cache hits reported to Prometheus"""
+
+    for line in client.get("/metrics").text.splitlines():
+        if line.startswith('message_cache_requests_total{result="hit"}'):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def test_message_history_cache(client: TestClient, token: str):
+    """Test cached history pages stay in sync with message writes"""
+
+    response = client.post(
+        "/chat",
+        json={"participants": [], "chat": {"name": "Cached chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+    ids = []
+    for i in range(3):
+        response = client.post(
+            f"/chat/{chat_id}/message",
+            json={"text": f"Cached {i}"},
+            cookies={TOKEN_KEY: token},
+        )
+        ids.append(response.json()["id"])
+
+    def texts(**params) -> list[str]:
+        response = client.get(
+            f"/chat/{chat_id}/message",
+            params=params,
+            cookies={TOKEN_KEY: token},
+        )
+        assert response.status_code == 200
+        return [m["text"] for m in response.json()["items"]]
+
+    assert texts() == ["Cached 2", "Cached 1", "Cached 0"]
+    hits = cache_hits(client)
+    assert texts() == ["Cached 2", "Cached 1", "Cached 0"]
+    assert cache_hits(client) == hits + 1
+
+    client.put(
+        f"/chat/{chat_id}/message/{ids[1]}",
+        json={"text": "Edited"},
+        cookies={TOKEN_KEY: token},
+    )
+    client.delete(
+        f"/chat/{chat_id}/message/{ids[0]}", cookies={TOKEN_KEY: token}
+    )
+    client.post(
+        f"/chat/{chat_id}/message",
+        json={"text": "Cached 3"},
+        cookies={TOKEN_KEY: token},
+    )
+
+    assert texts() == ["Cached 3", "Cached 2", "Edited"]
+
+    response = client.get(
+        f"/chat/{chat_id}/message",
+        params={"limit": 2},
+        cookies={TOKEN_KEY: token},
+    )
+    cursor = response.json()["nextCursor"]
+    assert texts(before=cursor) == ["Edited"]
+    assert cache_hits(client) == hits + 4
+
+
+async def insert_message(
+    user_id: UUID,
+    chat_id: UUID,
+    text: str,
+    created_at: datetime,
+    message_id: UUID | None = None,
+) -> None:
+    """Insert message sent in the past, counted like a sent one"""
+
+    async with db_session() as session:
+        message = await session.scalar(
+            insert(MessageModel)
+            .values(
+                id=message_id or uuid7(created_at),
+                user=user_id,
+                chat=chat_id,
+                text=text,
+                created_at=created_at,
+                updated_at=created_at,
+            )
+            .returning(MessageModel)
+        )
+        await record_chat_activity(session, user_id, [message])
+        await session.commit()
+
+
+def unread_of(client: TestClient, token: str, chat_id: str) -> int:
+    """Unread messages of chat member"""
+
+    response = client.get("/chat/unread", cookies={TOKEN_KEY: token})
+    return response.json()["chats"].get(chat_id, 0)
+
+
+async def count_rows(table: str) -> int:
+    """Rows of table, e.g. archived partition"""
+
+    async with db_session() as session:
+        return await session.scalar(text(f"SELECT count(*) FROM {table}"))
+
+
+def test_message_partitions(
+    client: TestClient, token: str, user: AuthenticatedUser
+):
+    """Test old partitions are archived past global retention"""
+
+    response = client.post(
+        "/auth/register",
+        json={"email": "partition.reader@example.com", "password": "pass"},
+    )
+    reader = response.json()["id"]
+    reader_token = response.cookies[TOKEN_KEY]
+    response = client.post(
+        "/chat",
+        json={"participants": [reader], "chat": {"name": "Partitioned chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+    now = datetime.now(timezone.utc)
+    sent_at = now - timedelta(days=400)
+
+    created = client.portal.call(partial(create_partitions, since=sent_at))
+    assert partition_name(period_start(sent_at, "month")) in created
+
+    client.portal.call(insert_message, user.id, chat_id, "Ancient", sent_at)
+    client.portal.call(insert_message, user.id, chat_id, "Recent", now)
+
+    # Cached history window holds both until the partition expires
+    response = client.get(
+        f"/chat/{chat_id}/message", cookies={TOKEN_KEY: token}
+    )
+    texts = [m["text"] for m in response.json()["items"]]
+    assert texts == ["Recent", "Ancient"]
+    assert unread_of(client, reader_token, chat_id) == 2
+
+    expired = client.portal.call(
+        partial(expire_partitions, retention_days=365, archive_schema="arc")
+    )
+    archived = partition_name(period_start(sent_at, "month"))
+    assert archived in expired
+    assert client.portal.call(count_rows, f"arc.{archived}") == 1
+
+    response = client.get(
+        f"/chat/{chat_id}/message", cookies={TOKEN_KEY: token}
+    )
+    assert [m["text"] for m in response.json()["items"]] == ["Recent"]
+    assert unread_of(client, reader_token, chat_id) == 1
+
+
+def test_chat_retention(
+    client: TestClient, token: str, user: AuthenticatedUser
+):
+    """Test messages past chat retention are deleted"""
+
+    response = client.post(
+        "/auth/register",
+        json={"email": "retention.reader@example.com", "password": "pass"},
+    )
+    reader = response.json()["id"]
+    reader_token = response.cookies[TOKEN_KEY]
+    response = client.post(
+        "/chat",
+        json={"participants": [reader], "chat": {"name": "Ephemeral chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+    response = client.put(
+        f"/chat/{chat_id}",
+        json={"name": "Ephemeral chat", "retentionDays": 1},
+        cookies={TOKEN_KEY: token},
+    )
+    assert response.json()["retentionDays"] == 1
+
+    now = datetime.now(timezone.utc)
+    client.portal.call(
+        insert_message, user.id, chat_id, "Stale", now - timedelta(days=2)
+    )
+    client.portal.call(insert_message, user.id, chat_id, "Fresh", now)
+    assert unread_of(client, reader_token, chat_id) == 2
+
+    assert client.portal.call(expire_chat_messages) == 1
+
+    response = client.get(
+        f"/chat/{chat_id}/message", cookies={TOKEN_KEY: token}
+    )
+    assert [m["text"] for m in response.json()["items"]] == ["Fresh"]
+    assert unread_of(client, reader_token, chat_id) == 1
+
+
+def test_message_id_clock_skew(
+    client: TestClient, token: str, user: AuthenticatedUser
+):
+    """Test message is found when its id time is far from created_at"""
+
+    response = client.post(
+        "/chat",
+        json={"participants": [], "chat": {"name": "Skewed chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+    now = datetime.now(timezone.utc)
+    # As if the clock stepped back an hour between id and timestamp
+    message_id = uuid7(now + timedelta(hours=1))
+    client.portal.call(
+        partial(insert_message, message_id=message_id),
+        user.id,
+        chat_id,
+        "Skewed",
+        now,
+    )
+
+    url = f"/chat/{chat_id}/message/{message_id}"
+    response = client.get(url, cookies={TOKEN_KEY: token})
+    assert response.status_code == 200
+    assert response.json()["text"] == "Skewed"
+
+    response = client.put(
+        url, json={"text": "Edited"}, cookies={TOKEN_KEY: token}
+    )
+    assert response.status_code == 200
+    assert response.json()["text"] == "Edited"
+
+    missing = f"/chat/{chat_id}/message/{uuid7()}"
+    response = client.put(
+        missing, json={"text": "Edited"}, cookies={TOKEN_KEY: token}
+    )
+    assert response.status_code == 404
+    assert client.get(missing, cookies={TOKEN_KEY: token}).status_code == 404
+
+
+def pool_checkouts(client: TestClient) -> int:
+    """Connections checked out of the database pool so far"""
+
+    return client.get("/metrics/pools").json()["database"]["checkouts"]
+
+
+def test_request_session(
+    client: TestClient, token: str, user: AuthenticatedUser
+):
+    """Test permission check and message write share one connection"""
+
+    response = client.post(
+        "/chat",
+        json={"participants": [], "chat": {"name": "Session chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+    # Membership is read from the database, not the cache
+    client.portal.call(invalidate_membership, [user.id], redis_client)
+    checkouts = pool_checkouts(client)
+
+    response = client.post(
+        f"/chat/{chat_id}/message",
+        json={"text": "One connection"},
+        cookies={TOKEN_KEY: token},
+    )
+
+    assert response.status_code == 200
+    assert pool_checkouts(client) - checkouts == 1
@@ -0,0 +1,192 @@
+import json
+import socket
+import time
+from functools import partial
+from typing import Callable
+
+import pytest
+from aiosmtpd.controller import Controller
+from fastapi.testclient import TestClient
+from redis import Redis
+
+from src.config import REDIS_URL, MAIL_MAX_ATTEMPTS
+from src.redis_pool import redis_client
+from src.services.mail import MailDispatcher, MailSender
+
+# Keys apart from the app's own dispatcher
+PREFIX = "test:mail"
+
+
+class RecordingHandler:
+    """Fake SMTP server handler keeping received mails, the first
+    ``failures`` ones are refused as temporary errors"""
+
+    def __init__(self) -> None:
+        self.sessions = set()
+        self.recipients = []
+        self.failures = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failures:
+            self.failures -= 1
+            return "451 Try again later"
+
+        self.sessions.add(id(session))
+        self.recipients.extend(envelope.rcpt_tos)
+        return "250 Message accepted for delivery"
+
+
+def free_port() -> int:
+    """Port nobody listens on"""
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    """Local fake SMTP server"""
+
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield handler, controller.port
+    controller.stop()
+
+
+def mail(index: int) -> dict:
+    return {
+        "to": f"user{index}@example.com",
+        "subject": "Subject",
+        "text": "Text",
+        "attempts": 0,
+    }
+
+
+def test_deliver_batch_over_one_connection(smtp_server):
+    """Test mails of batch reuse single SMTP connection"""
+
+    handler, port = smtp_server
+    sender = MailSender("127.0.0.1", port, starttls=False, password="")
+
+    failed, rejected = sender.deliver([mail(i) for i in range(3)])
+    sender.close()
+
+    assert failed == rejected == []
+    assert handler.recipients == [f"user{i}@example.com" for i in range(3)]
+    assert len(handler.sessions) == 1
+
+
+def test_deliver_unavailable_server():
+    """Test whole batch is returned for retry when SMTP is down"""
+
+    sender = MailSender("127.0.0.1", free_port(), starttls=False, password="")
+    mails = [mail(i) for i in range(3)]
+
+    assert sender.deliver(mails) == (mails, [])
+
+
+@pytest.fixture
+def redis():
+    """Direct Redis connection for checking queue state"""
+
+    with Redis.from_url(REDIS_URL) as redis:
+        yield redis
+        keys = list(redis.scan_iter(f"{PREFIX}:*"))
+        if keys:
+            redis.delete(*keys)
+
+
+@pytest.fixture
+def dispatcher(client: TestClient, smtp_server):
+    """Dispatcher of test queue sending to local fake SMTP server"""
+
+    _, port = smtp_server
+    dispatcher = MailDispatcher(
+        redis_client,
+        workers=1,
+        prefix=PREFIX,
+        retry_delay=0.01,
+        sender=partial(
+            MailSender, "127.0.0.1", port, starttls=False, password=""
+        ),
+    )
+    client.portal.call(dispatcher.start)
+    yield dispatcher
+    client.portal.call(dispatcher.stop)
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.05)
+
+
+def drained(redis: Redis) -> bool:
+    """Whether no mail is queued, waiting for retry or being sent"""
+
+    return not (
+        redis.llen(f"{PREFIX}:queue")
+        or redis.zcard(f"{PREFIX}:retry")
+        or any(
+            redis.llen(key.decode())
+            for key in redis.scan_iter(f"{PREFIX}:processing:*")
+            if not key.endswith(b":alive")
+        )
+    )
+
+
+def test_retry_after_temporary_failure(redis, smtp_server, dispatcher):
+    """Test mail refused once is sent on retry"""
+
+    handler, _ = smtp_server
+    handler.failures = 1
+    redis.lpush(f"{PREFIX}:queue", json.dumps(mail(0)))
+
+    wait_for(lambda: handler.recipients and drained(redis))
+    assert handler.recipients == ["user0@example.com"]
+    assert redis.llen(f"{PREFIX}:dead") == 0
+
+
+def test_exhausted_retries_dead_lettered(redis, smtp_server, dispatcher):
+    """Test mail failing every attempt ends in dead letters"""
+
+    handler, _ = smtp_server
+    handler.failures = MAIL_MAX_ATTEMPTS
+    redis.lpush(f"{PREFIX}:queue", json.dumps(mail(0)))
+
+    wait_for(lambda: redis.llen(f"{PREFIX}:dead") and drained(redis))
+    dead = json.loads(redis.lindex(f"{PREFIX}:dead", 0))
+    assert dead["attempts"] == MAIL_MAX_ATTEMPTS
+    assert handler.recipients == []
+
+
+def test_malformed_mail_dead_lettered(redis, smtp_server, dispatcher):
+    """Test malformed mails are dead-lettered without stopping others"""
+
+    handler, _ = smtp_server
+    malformed = [b"not json", json.dumps({"to": "nobody"}).encode()]
+    redis.lpush(f"{PREFIX}:queue", *malformed, json.dumps(mail(1)))
+
+    wait_for(lambda: handler.recipients and drained(redis))
+    assert handler.recipients == ["user1@example.com"]
+    assert sorted(redis.lrange(f"{PREFIX}:dead", 0, -1)) == sorted(malformed)
+
+
+def test_mails_of_dead_worker_requeued(
+    client: TestClient, redis, smtp_server, dispatcher
+):
+    """Test mails taken by a worker that died are sent after restart"""
+
+    handler, _ = smtp_server
+    client.portal.call(dispatcher.stop)
+    processing = f"{PREFIX}:processing:gone"
+    redis.sadd(f"{PREFIX}:processing", processing)
+    redis.lpush(processing, json.dumps(mail(2)))
+
+    client.portal.call(dispatcher.start)
+    wait_for(lambda: handler.recipients and drained(redis))
+    assert handler.recipients == ["user2@example.com"]
+    assert not redis.sismember(f"{PREFIX}:processing", processing)
@@ -0,0 +1,119 @@
+import re
+
+from fastapi.testclient import TestClient
+
+from src.config import engine
+from src.models import Base
+
+# Statements executed by earlier tests are planned as if tables were
+# large: with sequential scans and hash or merge joins over whole tables
+# disabled, the planner still reads a table in full only when no index
+# can serve the query
+PLANNER_SETTINGS = ("enable_seqscan", "enable_hashjoin", "enable_mergejoin")
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+# Substring search of users is indexed only where pg_trgm is available
+TRIGRAM_SEARCH = "search_key LIKE"
+
+# Retention reads detached partitions whole, and they are gone by now
+DETACHED_PARTITION = re.compile(r'(FROM|JOIN) "?message_p')
+
+FOREIGN_KEY_INDEXES_QUERY = """
+    SELECT c.conrelid::regclass::text, c.conname
+    FROM pg_constraint c
+    JOIN pg_class t ON t.oid = c.conrelid
+    WHERE c.contype = 'f' AND NOT t.relispartition
+      AND NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        WHERE i.indrelid = c.conrelid
+          AND (i.indkey::int2[])[0:cardinality(c.conkey) - 1]
+              @> c.conkey
+          AND (i.indkey::int2[])[0:cardinality(c.conkey) - 1]
+              <@ c.conkey
+      )
+"""
+
+PARTIAL_INDEXES_QUERY = """
+    SELECT indexrelid::regclass::text FROM pg_index
+    WHERE indpred IS NOT NULL
+"""
+
+
+def full_scans(plan: dict, partial_indexes: set[str]) -> list[str]:
+    """Application tables read in full anywhere in plan
+
+    With sequential scans disabled the planner walks a whole index
+    instead, so index scans without a condition count as well, unless
+    the index is partial and holds only the rows asked for.
+    """
+
+    scans = []
+    full_index_scan = (
+        plan["Node Type"] in ("Index Scan", "Index Only Scan")
+        and "Index Cond" not in plan
+        and plan["Index Name"] not in partial_indexes
+    )
+    if plan["Node Type"] == "Seq Scan" or full_index_scan:
+        relation = plan["Relation Name"]
+        if relation in Base.metadata.tables or relation.startswith(
+            "message_p"
+        ):
+            scans.append(relation)
+    for child in plan.get("Plans", []):
+        scans.extend(full_scans(child, partial_indexes))
+    return scans
+
+
+async def plan_queries(queries: dict[str, tuple]) -> dict[str, list[str]]:
+    async with engine.connect() as conn:
+        raw_connection = await conn.get_raw_connection()
+        connection = raw_connection.driver_connection
+        trigrams = await connection.fetchval(
+            "SELECT to_regclass('ix_user_search_key_trgm') IS NOT NULL"
+        )
+        partial_indexes = set(
+            await connection.fetchval(
+                f"SELECT array({PARTIAL_INDEXES_QUERY})"
+            )
+        )
+        async with connection.transaction():
+            for setting in PLANNER_SETTINGS:
+                await connection.execute(f"SET LOCAL {setting} TO off")
+            fallbacks = {}
+            for statement, parameters in queries.items():
+                if not statement.lstrip().upper().startswith(EXPLAINED):
+                    continue
+                if TRIGRAM_SEARCH in statement and not trigrams:
+                    continue
+                if DETACHED_PARTITION.search(statement):
+                    continue
+                # JSON codec of the engine decodes the plan already
+                result = await connection.fetchval(
+                    f"EXPLAIN (FORMAT JSON) {statement}", *parameters
+                )
+                scans = full_scans(result[0]["Plan"], partial_indexes)
+                if scans:
+                    fallbacks[statement] = scans
+    return fallbacks
+
+
+async def unindexed_foreign_keys() -> list[tuple[str, str]]:
+    async with engine.connect() as conn:
+        raw_connection = await conn.get_raw_connection()
+        connection = raw_connection.driver_connection
+        rows = await connection.fetch(FOREIGN_KEY_INDEXES_QUERY)
+    return [tuple(row) for row in rows]
+
+
+def test_foreign_keys_indexed(client: TestClient):
+    """Test every foreign key leads some index, so cascades use it"""
+
+    assert client.portal.call(unindexed_foreign_keys) == []
+
+
+def test_queries_use_indexes(client: TestClient, queries: dict[str, tuple]):
+    """Test service queries do not fall back to sequential scans"""
+
+    assert len(queries) > 50
+    assert client.portal.call(plan_queries, queries) == {}
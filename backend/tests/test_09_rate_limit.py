@@ -0,0 +1,124 @@
+from functools import partial
+
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.config import (
+    TOKEN_KEY,
+    LOGIN_RATE_LIMIT,
+    FORGOT_PASSWORD_RATE_LIMIT,
+    MESSAGE_RATE_LIMIT,
+)
+from src.schemes.chat import ChatScheme
+from src.services.rate_limit import rate_limiter
+from tests.conftest import EMAIL, PASSWORD
+
+
+def test_login_throttled(client: TestClient):
+    """Test login attempts are limited per account"""
+
+    for _ in range(LOGIN_RATE_LIMIT):
+        response = client.post(
+            "/auth/login", json={"email": EMAIL, "password": "wrong"}
+        )
+        assert response.status_code == 401
+
+    # Right password does not help once the account is throttled
+    response = client.post(
+        "/auth/login", json={"email": EMAIL, "password": PASSWORD}
+    )
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+    # Other accounts from the same address are not
+    response = client.post(
+        "/auth/login",
+        json={"email": f"other.{EMAIL}", "password": PASSWORD},
+    )
+    assert response.status_code == 401
+
+
+def test_forgot_password_throttled(client: TestClient):
+    """Test password reset requests are limited per email"""
+
+    body = {"email": "nobody@example.com", "redirectUrl": ""}
+    for _ in range(FORGOT_PASSWORD_RATE_LIMIT):
+        response = client.post("/user/forgot-password", json=body)
+        assert response.status_code == 404
+
+    response = client.post("/user/forgot-password", json=body)
+    assert response.status_code == 429
+
+
+def test_messages_throttled(client: TestClient, token: str, chat: ChatScheme):
+    """Test sent messages are limited per user"""
+
+    for i in range(MESSAGE_RATE_LIMIT):
+        response = client.post(
+            f"/chat/{chat.id}/message",
+            json={"text": f"Flood {i}"},
+            cookies={TOKEN_KEY: token},
+        )
+        assert response.status_code == 200
+
+    response = client.post(
+        f"/chat/{chat.id}/message",
+        json={"text": "Flood"},
+        cookies={TOKEN_KEY: token},
+    )
+    assert response.status_code == 429
+
+
+def test_batches_throttled(client: TestClient):
+    """Test batch messages count against the same limit as single ones"""
+
+    response = client.post(
+        "/auth/register",
+        json={"email": "batcher@example.com", "password": "pass"},
+    )
+    token = response.cookies[TOKEN_KEY]
+    response = client.post(
+        "/chat",
+        json={"participants": [], "chat": {"name": "Batch chat"}},
+        cookies={TOKEN_KEY: token},
+    )
+    chat_id = response.json()["id"]
+
+    def send_batch(size: int) -> int:
+        items = [
+            {"chatId": chat_id, "text": f"Batched {i}"} for i in range(size)
+        ]
+        response = client.post(
+            "/message/batch",
+            json={"items": items},
+            cookies={TOKEN_KEY: token},
+        )
+        return response.status_code
+
+    # One batch is charged for every message in it
+    assert send_batch(MESSAGE_RATE_LIMIT + 1) == 429
+    assert send_batch(MESSAGE_RATE_LIMIT - 1) == 200
+    assert send_batch(2) == 429
+
+    response = client.post(
+        f"/chat/{chat_id}/message",
+        json={"text": "Last one"},
+        cookies={TOKEN_KEY: token},
+    )
+    assert response.status_code == 200
+    assert send_batch(1) == 429
+
+
+def test_limit_without_redis(client: TestClient, monkeypatch):
+    """Test limits hold per worker while Redis is unavailable"""
+
+    async def unavailable(*args, **kwargs):
+        raise RedisConnectionError("Redis is down")
+
+    hit = partial(rate_limiter.hit, "test:fallback", 2, 60)
+    assert client.portal.call(hit) == 0
+
+    monkeypatch.setattr(rate_limiter, "hit_script", unavailable)
+    assert client.portal.call(hit) == 0
+    assert client.portal.call(hit) == 0
+    assert client.portal.call(hit) > 0
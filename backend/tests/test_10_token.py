@@ -0,0 +1,110 @@
+import json
+from uuid import uuid4
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from jwt.algorithms import ECAlgorithm
+
+from src.config import TOKEN_KEY
+from src.redis_pool import redis_client
+from src.services import token as token_service
+from src.services.token import (
+    KeySet,
+    RevocationList,
+    create_token,
+    verify_token,
+)
+
+
+def test_logout_revokes_tokens(client: TestClient, login: tuple[str, str]):
+    """Test tokens stop working on logout"""
+
+    token, refresh_token = login
+    cookies = {TOKEN_KEY: token, f"{TOKEN_KEY}_refresh": refresh_token}
+    assert client.get("/user/me", cookies=cookies).status_code == 200
+
+    response = client.post("/auth/logout", cookies=cookies)
+    assert response.status_code == 204
+
+    response = client.get("/user/me", cookies=cookies)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token revoked"
+    response = client.post("/auth/refresh", cookies=cookies)
+    assert response.status_code == 401
+
+
+def test_revocation_reaches_workers(
+    client: TestClient, login: tuple[str, str]
+):
+    """Test other workers learn revocations on their next sync"""
+
+    token, _ = login
+    jti = verify_token(token).jti
+    worker = RevocationList(redis_client)
+    client.portal.call(worker.sync)
+    assert not client.portal.call(worker.is_revoked, jti)
+
+    client.post("/auth/logout", cookies={TOKEN_KEY: token})
+    client.portal.call(worker.sync)
+    assert client.portal.call(worker.is_revoked, jti)
+
+
+def test_verified_tokens_cached(monkeypatch):
+    """Test signature is verified once per token"""
+
+    decoded = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decoded.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(jwt, "decode", counting_decode)
+    user_id = uuid4()
+    token = create_token(user_id)
+    assert verify_token(token).user_id == user_id
+    assert verify_token(token).user_id == user_id
+    assert decoded == [token]
+
+    with pytest.raises(HTTPException) as exc_info:
+        verify_token(create_token(user_id, -1))
+    assert exc_info.value.detail == "Token expired"
+
+
+def test_key_rotation(tmp_path, monkeypatch):
+    """Test tokens name their key and old keys verify until dropped"""
+
+    old = ECAlgorithm.to_jwk(
+        ec.generate_private_key(ec.SECP256R1()), as_dict=True
+    )
+    new = {"kty": "oct", "k": "bmV3LXNlY3JldC1rZXktb2YtMzItYnl0ZXMtLQ"}
+    old.update(kid="old", alg="ES256")
+    new.update(kid="new", alg="HS256")
+    keys = tmp_path / "jwks.json"
+    keys.write_text(json.dumps({"keys": [old, new]}))
+
+    def use_keys(signing_kid: str) -> None:
+        monkeypatch.setattr(
+            token_service, "key_set", KeySet(str(keys), signing_kid)
+        )
+        token_service.token_cache.clear()
+
+    user_id = uuid4()
+    use_keys("old")
+    old_token = create_token(user_id)
+    assert jwt.get_unverified_header(old_token)["kid"] == "old"
+
+    use_keys("new")
+    new_token = create_token(user_id)
+    assert jwt.get_unverified_header(new_token)["kid"] == "new"
+    assert verify_token(old_token).user_id == user_id
+    assert verify_token(new_token).user_id == user_id
+
+    keys.write_text(json.dumps({"keys": [new]}))
+    use_keys("new")
+    assert verify_token(new_token).user_id == user_id
+    with pytest.raises(HTTPException):
+        verify_token(old_token)